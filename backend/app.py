@@ -1,19 +1,41 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import os
+import sys
 import uuid
 import threading
 import tempfile
 import shutil
 import time
+import heapq
+import functools
 from datetime import datetime, timedelta
-from helpers import generate_srt, overlay_subtitles
-import whisper
+from helpers import overlay_subtitles, OUTPUT_MODES, ALLOWED_PRESETS, BURN_IN_PRESETS
+from captions import CaptionWriter, CaptionLimits, export_captions, render_captions, CAPTION_FORMATS, CAPTION_MIMETYPES
+from scheduler import JobScheduler, QueueFullError, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from transcription_cache import TranscriptionCache, hash_file, make_cache_key
+from transcription import transcribe_chunked, pack_clips, unpack_result, start_process_server
+from audio import probe_media, extract_audio, SAMPLE_RATE
+from job_store import create_job_store, TERMINAL_STATUSES, UNFINISHED_FINAL_STATUSES
+from model_registry import ModelRegistry
+from worker_pool import TranscriptionWorkerPool
+from metrics import REGISTRY, STAGE_SECONDS, JobMetrics
+from uploads import StreamingUploadRequest, UploadTooLarge, ResumableUploads, MAX_UPLOAD_BYTES, copy_stream
+from archive import extract_archive, stream_zip
+from downloads import UrlSigner, load_secret, send_processed_file, DOWNLOAD_OFFLOAD, URL_FIELDS
+from cancellation import CancelToken, JobCancelled
+from werkzeug.exceptions import RequestEntityTooLarge
 import gc
 import psutil
+import numpy as np
 import logging
+import json
+import cProfile
+import atexit
 
 app = Flask(__name__)
+# Multipart file parts are streamed straight into the upload folder (see uploads.py)
+app.request_class = StreamingUploadRequest
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,78 +49,202 @@ CORS(app,
          "http://localhost:3000",
          "https://localhost:3000"
      ],
-     methods=['GET', 'POST', 'OPTIONS'],
-     allow_headers=['Content-Type', 'Authorization'],
+     methods=['GET', 'HEAD', 'POST', 'PATCH', 'OPTIONS'],
+     allow_headers=['Content-Type', 'Authorization', 'Upload-Offset'],
+     # Resumable upload clients read the server's offset from the response
+     expose_headers=['Upload-Offset'],
      supports_credentials=True,
      max_age=3600
 )
 
-# Use system temporary directory with size limit
+# Storage limit for job files; create_app() picks CAPVID_DATA_DIR or a fresh temp dir
 TEMP_STORAGE_LIMIT = 250 * 1024 * 1024  # 250MB in bytes
-TEMP_BASE_DIR = tempfile.mkdtemp(prefix='capvid_')
-UPLOAD_FOLDER = os.path.join(TEMP_BASE_DIR, 'uploads')
-PROCESSED_FOLDER = os.path.join(TEMP_BASE_DIR, 'processed')
+PERSISTENT_STORAGE = bool(os.environ.get('CAPVID_DATA_DIR'))
+
+# Storage, the job store, models and background threads are set up by create_app(), not on import
+TEMP_BASE_DIR = None
+UPLOAD_FOLDER = None
+PROCESSED_FOLDER = None
+url_signer = None
+resumable_uploads = None
+job_store = None
+transcription_cache = None
+scheduler = None
+model_registry = None
+worker_pool = None
+services_started = threading.Event()
+services_lock = threading.Lock()
+# Why create_app() refused to start, so later requests answer 503 instead of retrying it
+startup_error = None
+
+# The file transfer itself can be handed to the front proxy
+app.config['USE_X_SENDFILE'] = DOWNLOAD_OFFLOAD == 'x-sendfile'
+
+# Werkzeug rejects bodies over this before reading them, chunked transfers included
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 1024 * 1024  # room for multipart overhead
+
+# Job records live in a pluggable store (sqlite by default) shared by all web workers
+JOB_STORE_BACKEND = os.environ.get('CAPVID_JOB_STORE', 'sqlite')
+
+# Wakes /events streams in this process; streams in other workers notice on their next poll
+job_updates = threading.Condition()
+# Streaming jobs use short chunks so the first captions arrive within seconds
+STREAM_CHUNK_SECONDS = 20
+STREAM_MIN_CHUNKED_SECONDS = 30
+
+SHORT_CLIP_SECONDS = 120  # clips under 2 minutes jump the queue
+PRIORITY_NAMES = {'high': PRIORITY_HIGH, 'normal': PRIORITY_NORMAL, 'low': PRIORITY_LOW}
+# Deferred full renders /render may (re)start; a queued or running one is left alone
+RENDERABLE_FINAL_STATUSES = ('pending', 'failed', 'cancelled')
+
+# Batches: one record (status BATCH_STATUS) listing member jobs that run like normal uploads
+BATCH_STATUS = 'batch'
+MAX_BATCH_FILES = int(os.environ.get('CAPVID_MAX_BATCH_FILES', 50))
+# Short batch clips are packed into shared model passes of up to this much audio
+BATCH_PACK_SECONDS = int(os.environ.get('CAPVID_BATCH_PACK_SECONDS', 600))
+# Rough share of a job's progress bar that each status represents, for batch progress
+STATUS_PROGRESS = {'queued': 0, 'transcribing': 10, 'generating_captions': 80, 'embedding_subtitles': 85}
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
+# 'process' moves Whisper into recycled worker processes so it never holds this process's GIL
+WORKER_MODE = os.environ.get('CAPVID_WORKER_MODE', 'thread')
 
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+# Profiling has overhead and exposes internals, so it must be switched on for the server first
+PROFILING_ENABLED = os.environ.get('CAPVID_PROFILING', 'false').lower() == 'true'
+profile_lock = threading.Lock()
 
-# Thread-safe job management with longer retention
-job_status = {}
-file_timestamps = {}
-processing_lock = threading.Lock()
+# Running jobs nobody has polled for this long are cancelled, e.g. after the tab was closed (0 disables)
+ABANDONED_JOB_SECONDS = int(os.environ.get('CAPVID_ABANDONED_JOB_SECONDS', 600))
+CANCEL_POLL_SECONDS = 1
+# Cancel tokens of the jobs running in this process
+running_jobs = {}
+running_jobs_lock = threading.Lock()
+# Packed passes running per batch; they share the batch's token in running_jobs
+batch_passes = {}
 
-# Global model to avoid reloading
-whisper_model = None
-model_load_lock = threading.Lock()
+# Transcription settings; part of the cache key so changing them invalidates old entries
+TRANSCRIBE_OPTIONS = {
+    'language': None,  # Auto-detect language
+    'task': "transcribe",
+    'verbose': False,
+    'word_timestamps': True,
+    'temperature': 0.0,
+    'compression_ratio_threshold': 2.4,
+    'logprob_threshold': -1.0,
+    'no_speech_threshold': 0.6
+}
 
-def get_directory_size(directory):
-    """Calculate total size of all files in directory"""
-    total_size = 0
+# Burn-in jobs can stop at a quick low-res preview; the full render then waits for POST /render/<job_id>
+PREVIEW_RENDER_DEFAULT = os.environ.get('CAPVID_PREVIEW_RENDER', 'false').lower() == 'true'
+
+# Longest media we accept; checked with ffprobe before any decoding
+MAX_DURATION_SECONDS = int(os.environ.get('CAPVID_MAX_DURATION', 3600))
+
+# Point-in-time values read on each /metrics scrape
+REGISTRY.gauge('capvid_queue_depth', 'Jobs waiting for a worker', lambda: scheduler.stats()['queued'])
+REGISTRY.gauge('capvid_jobs_running', 'Jobs being processed', lambda: scheduler.stats()['running'])
+REGISTRY.gauge('capvid_encodes_running', 'ffmpeg encodes sharing the cores', lambda: scheduler.stats()['encoding'])
+REGISTRY.gauge('capvid_cache_lookups_total', 'Transcription cache lookups by result', lambda: {
+    (('result', 'hit'),): transcription_cache.hits,
+    (('result', 'miss'),): transcription_cache.misses
+}, metric_type='counter')
+REGISTRY.gauge('capvid_cache_evictions_total', 'Transcription cache entries evicted',
+               lambda: transcription_cache.evictions, metric_type='counter')
+REGISTRY.gauge('capvid_storage_bytes', 'Bytes of uploads and outputs on disk', lambda: get_storage_usage())
+
+# Untracked files younger than this may belong to an upload still being registered
+ORPHAN_GRACE_SECONDS = 10 * 60
+# Resumable upload sessions with no progress for this long are abandoned
+RESUMABLE_UPLOAD_TTL = 2 * 60 * 60
+
+def record_job_file(job_id, path):
+    """Record a file's current size in the job's storage ledger"""
     try:
-        for dirpath, dirnames, filenames in os.walk(directory):
-            for filename in filenames:
-                filepath = os.path.join(dirpath, filename)
-                if os.path.exists(filepath):
-                    total_size += os.path.getsize(filepath)
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    job_store.record_file(job_id, path, size)
+
+def remove_job_file(path):
+    """Delete a file and drop it from the storage ledger"""
+    try:
+        os.remove(path)
+        logger.info(f"Removed file: {path}")
+    except FileNotFoundError:
+        pass
     except Exception as e:
-        logger.error(f"Error calculating directory size: {e}")
-    return total_size
+        logger.error(f"Failed to remove {path}: {e}")
+    job_store.forget_file(path)
+
+def get_storage_usage():
+    """Bytes used by job files, from the ledger rather than a directory walk"""
+    return job_store.total_bytes()
+
+def reconcile_storage():
+    """Correct ledger drift against the disk and delete stale files no job owns"""
+    tracked = {}
+    now = time.time()
+    for path, job_id, size in job_store.all_files():
+        tracked[path] = job_id
+        try:
+            stat = os.stat(path)
+        except OSError:
+            job_store.forget_file(path)
+            continue
+        if job_store.get(job_id) is None and now - stat.st_mtime > RESUMABLE_UPLOAD_TTL:
+            # Ledger entries without a job belong to resumable uploads that were never finished
+            remove_job_file(path)
+            continue
+        if stat.st_size != size:
+            job_store.record_file(job_id, path, stat.st_size)
+    
+    for folder in [UPLOAD_FOLDER, PROCESSED_FOLDER]:
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as e:
+            logger.error(f"Error scanning {folder}: {e}")
+            continue
+        for entry in entries:
+            if entry.path in tracked or not entry.is_file():
+                continue
+            try:
+                if now - entry.stat().st_mtime < ORPHAN_GRACE_SECONDS:
+                    continue
+                os.remove(entry.path)
+                logger.info(f"Removed untracked file: {entry.path}")
+            except OSError as e:
+                logger.error(f"Failed to remove untracked file {entry.path}: {e}")
 
 def cleanup_old_files():
     """Remove files older than 2 hours or when storage limit is exceeded"""
     current_time = datetime.now()
     cutoff_time = current_time - timedelta(hours=2)  # Increased from 1 hour to 2 hours
     
-    # Get current storage usage
-    total_size = get_directory_size(TEMP_BASE_DIR)
-    
-    files_to_remove = []
+    def final_render_pending(job_id):
+        # A queued or running full render still needs the upload and the captions
+        return (job_store.get(job_id) or {}).get('final_status') in UNFINISHED_FINAL_STATUSES
     
     # Only remove files older than 2 hours
-    for job_id, timestamp in list(file_timestamps.items()):
-        if timestamp < cutoff_time:
-            files_to_remove.append(job_id)
+    files_to_remove = [
+        job_id for job_id, _, _ in job_store.list_jobs(created_before=cutoff_time.timestamp())
+        if not final_render_pending(job_id)
+    ]
     
-    # If still over limit, remove oldest completed jobs first
+    job_sizes = job_store.bytes_by_job()
+    total_size = get_storage_usage() - sum(job_sizes.get(job_id, 0) for job_id in files_to_remove)
+    
+    # If still over limit, remove oldest completed jobs first until back under 80%
     if total_size > TEMP_STORAGE_LIMIT:
-        with processing_lock:
-            completed_jobs = []
-            for job_id, status_info in job_status.items():
-                if status_info.get('status') in ['completed', 'failed', 'completed_srt_only']:
-                    if job_id in file_timestamps:
-                        completed_jobs.append((job_id, file_timestamps[job_id]))
-            
-            # Sort by timestamp and remove oldest completed jobs
-            completed_jobs.sort(key=lambda x: x[1])
-            for job_id, _ in completed_jobs:
-                if job_id not in files_to_remove:
-                    files_to_remove.append(job_id)
-                    # Check if we're under limit after adding this file
-                    if get_directory_size(TEMP_BASE_DIR) < TEMP_STORAGE_LIMIT * 0.8:
-                        break
+        removing = set(files_to_remove)
+        oldest_first = [
+            (created_at, job_id)
+            for job_id, created_at, _ in job_store.list_jobs(statuses=TERMINAL_STATUSES)
+            if job_id not in removing and not final_render_pending(job_id)
+        ]
+        heapq.heapify(oldest_first)
+        while oldest_first and total_size >= TEMP_STORAGE_LIMIT * 0.8:
+            _, job_id = heapq.heappop(oldest_first)
+            files_to_remove.append(job_id)
+            total_size -= job_sizes.get(job_id, 0)
     
     # Remove identified files
     for job_id in files_to_remove:
@@ -107,25 +253,17 @@ def cleanup_old_files():
 def cleanup_job_files(job_id):
     """Remove all files associated with a job"""
     try:
-        with processing_lock:
-            # Remove from status tracking
-            if job_id in job_status:
-                logger.info(f"Removing job {job_id} from status tracking")
-                del job_status[job_id]
-            if job_id in file_timestamps:
-                del file_timestamps[job_id]
+        known_files = job_store.job_files(job_id)
+        
+        # Remove from status tracking
+        if job_store.delete(job_id):
+            logger.info(f"Removing job {job_id} from status tracking")
+        with job_updates:
+            job_updates.notify_all()
         
         # Remove actual files
-        for folder in [UPLOAD_FOLDER, PROCESSED_FOLDER]:
-            if os.path.exists(folder):
-                for filename in os.listdir(folder):
-                    if filename.startswith(job_id):
-                        filepath = os.path.join(folder, filename)
-                        try:
-                            os.remove(filepath)
-                            logger.info(f"Removed file: {filepath}")
-                        except Exception as e:
-                            logger.error(f"Failed to remove {filepath}: {e}")
+        for path, _ in known_files:
+            remove_job_file(path)
     except Exception as e:
         logger.error(f"Error cleaning up job {job_id}: {e}")
 
@@ -133,56 +271,135 @@ def periodic_cleanup():
     """Run cleanup every 30 minutes"""
     while True:
         time.sleep(1800)  # 30 minutes
+        reconcile_storage()
         cleanup_old_files()
 
-# Start cleanup thread
-cleanup_thread = threading.Thread(target=periodic_cleanup, daemon=True)
-cleanup_thread.start()
+def check_cancellation():
+    """Cancel jobs running here that were asked to stop, were removed, or that nobody is polling"""
+    with running_jobs_lock:
+        tokens = dict(running_jobs)
+    if not tokens:
+        return
+    state = job_store.control_state(tokens)
+    now = time.time()
+    for job_id, token in tokens.items():
+        if job_id not in state:
+            token.cancel('Job was removed')
+            continue
+        cancel_requested, last_polled = state[job_id]
+        if cancel_requested:
+            token.cancel('Cancelled')
+        elif ABANDONED_JOB_SECONDS and now - last_polled > ABANDONED_JOB_SECONDS:
+            token.cancel(f'Cancelled: no client checked on the job for {ABANDONED_JOB_SECONDS}s')
 
-def load_whisper_model():
-    """Load Whisper model with memory optimization"""
-    global whisper_model
-    
-    with model_load_lock:
-        if whisper_model is not None:
-            return whisper_model
-        
+def watch_running_jobs():
+    """Poll the job store so cancel requests served by any web worker reach the process running the job"""
+    while True:
+        time.sleep(CANCEL_POLL_SECONDS)
         try:
-            # Check available memory
-            memory = psutil.virtual_memory()
-            available_gb = memory.available / (1024**3)
-            
-            logger.info(f"Available memory: {available_gb:.1f}GB")
-            
-            if available_gb < 0.5:  # Less than 500MB available
-                model_name = "tiny"
-                logger.info("Using tiny model due to memory constraints")
-            elif available_gb < 1.0:  # Less than 1GB available
-                model_name = "base"
-                logger.info("Using base model due to memory constraints")
-            else:
-                model_name = "small"
-                logger.info("Using small model")
-            
-            logger.info(f"Attempting to load Whisper model: {model_name}")
-            whisper_model = whisper.load_model(model_name)
-            logger.info(f"Successfully loaded Whisper model: {model_name}")
-            
-            return whisper_model
-            
+            check_cancellation()
         except Exception as e:
-            logger.error(f"Failed to load model: {e}")
-            # Fallback to tiny model
-            try:
-                logger.info("Falling back to tiny model")
-                whisper_model = whisper.load_model("tiny")
-                logger.info("Successfully loaded tiny model as fallback")
-                return whisper_model
-            except Exception as fallback_error:
-                logger.error(f"Failed to load fallback model: {fallback_error}")
-                raise
-
-def process_video_task(job_id, filepath, filename):
+            logger.error(f"Error checking for cancelled jobs: {e}")
+
+def set_job_status(job_id, status_info, job_metrics=None):
+    """Replace a job's status and wake any /events subscribers"""
+    if job_metrics:
+        status_info = dict(status_info, **job_metrics.as_status())
+    job_store.set(job_id, status_info)
+    with job_updates:
+        job_updates.notify_all()
+
+def publish_segments(job_id, segments):
+    """Record newly decoded segments for streaming clients"""
+    job_store.append_segments(job_id, [
+        {'start': round(s['start'], 3), 'end': round(s['end'], 3), 'text': s['text'].strip()}
+        for s in segments
+    ])
+    with job_updates:
+        job_updates.notify_all()
+
+def start_profiler(job_id):
+    """cProfile the job's thread; only one job at a time can be profiled"""
+    if not profile_lock.acquire(blocking=False):
+        logger.warning(f"Another job is being profiled, running job {job_id} without the profiler")
+        return None
+    # For a sampling profile instead, point py-spy at this pid and thread
+    logger.info(f"Profiling job {job_id} (pid {os.getpid()}, thread {threading.get_native_id()})")
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        profile_lock.release()
+        logger.warning(f"Could not start the profiler for job {job_id}: {e}")
+        return None
+    return profiler
+
+def stop_profiler(job_id, profiler):
+    """Write the pstats file next to the job's outputs and return its download URL"""
+    try:
+        profiler.disable()
+        profile_path = os.path.join(PROCESSED_FOLDER, f"{job_id}_profile.prof")
+        profiler.dump_stats(profile_path)
+        record_job_file(job_id, profile_path)
+        return f"/profile/{job_id}"
+    finally:
+        profile_lock.release()
+
+def run_transcription(job_id, audio, pcm_path, model_name, stream, on_progress, on_segments, cancel_token=None):
+    """Transcribe in this process or hand the PCM file to a worker process; returns (result, model_name)"""
+    chunk_seconds = STREAM_CHUNK_SECONDS if stream else None
+    min_chunked_seconds = STREAM_MIN_CHUNKED_SECONDS if stream else None
+    
+    if worker_pool:
+        logger.info(f"Sending job {job_id} to a transcription worker process")
+        result_path = os.path.join(UPLOAD_FOLDER, f"{job_id}_result.json")
+        job_store.record_file(job_id, result_path, 0)
+        try:
+            return worker_pool.transcribe(
+                pcm_path, result_path, model_name, TRANSCRIBE_OPTIONS, on_progress, on_segments,
+                chunk_seconds=chunk_seconds, min_chunked_seconds=min_chunked_seconds, cancel_token=cancel_token
+            )
+        finally:
+            job_store.forget_file(result_path)
+    
+    with model_registry.use(model_name) as (model, loaded_name):
+        logger.info(f"Starting transcription with Whisper {loaded_name} model")
+        # Share the cores between jobs the scheduler may be running side by side
+        chunk_workers = max(1, (os.cpu_count() or 1) // scheduler.num_workers)
+        result = transcribe_chunked(
+            model, audio, TRANSCRIBE_OPTIONS, chunk_workers, on_progress, on_segments,
+            chunk_seconds=chunk_seconds, min_chunked_seconds=min_chunked_seconds, cancel_token=cancel_token,
+            load_model=functools.partial(model_registry.loader, loaded_name)
+        )
+    return result, loaded_name
+
+def encode_reporter(job_id):
+    """Progress callback for overlay_subtitles that publishes encode progress on the job"""
+    last_report = [0]
+    def report(progress):
+        # ffmpeg reports twice a second; once a second is plenty for pollers
+        now = time.time()
+        if now - last_report[0] < 1 and progress['percent'] != 100:
+            return
+        last_report[0] = now
+        job_store.update(job_id, progress=progress['percent'], encode_fps=progress['fps'],
+                         encode_speed=progress['speed'], encode_eta_seconds=progress['eta_seconds'])
+        with job_updates:
+            job_updates.notify_all()
+    return report
+
+def caption_urls(job_id):
+    """Download links for every caption file a finished job has, plus the re-render endpoint"""
+    urls = {f"{fmt}_url": f"/download_srt/{job_id}_captions.{fmt}" for fmt in CAPTION_FORMATS}
+    urls['captions_url'] = f"/captions/{job_id}"
+    return urls
+
+def run_video_task(job_id, filepath, filename, stream, output_options, content_hash, requested_model, job_metrics,
+                   cancel_token, duration=None):
+    """Transcribe and render one job; returns False if the job was no longer queued
+
+    cancel_token is checked between stages and passed down to transcription and ffmpeg.
+    """
     try:
         logger.info(f"Starting video processing for job {job_id}")
         
@@ -191,95 +408,169 @@ def process_video_task(job_id, filepath, filename):
         logger.info(f"Memory usage before processing: {memory.used / 1024 / 1024:.1f}MB")
         logger.info(f"Current memory usage: {memory.used / 1024 / 1024:.1f}MB, Available: {memory.available / 1024 / 1024:.1f}MB")
         
-        with processing_lock:
-            job_status[job_id] = {'status': 'transcribing', 'filename': filename}
-
-        # Load model
-        model = load_whisper_model()
-        logger.info(f"Starting transcription with {model.__class__.__name__ if hasattr(model, '__class__') else 'unknown'} model")
+        # Only start jobs that are still queued; a cleaned-up job has no record left
+        if not job_store.transition(job_id, ['queued'], {'status': 'transcribing', 'filename': filename}):
+            logger.info(f"Job {job_id} is no longer queued, skipping")
+            return False
+        # Jobs abandoned while they waited in the queue stop before any work is done
+        check_cancellation()
+        cancel_token.check()
+        
+        # SRT and WebVTT are appended to as segments are decoded; every format is rewritten at the end
+        caption_paths = {fmt: os.path.join(PROCESSED_FOLDER, f"{job_id}_captions.{fmt}") for fmt in CAPTION_FORMATS}
+        srt_path = caption_paths['srt']
+        vtt_path = caption_paths['vtt']
+        caption_writer = CaptionWriter({'srt': srt_path, 'vtt': vtt_path}, flush=True)
+        record_job_file(job_id, srt_path)
+        record_job_file(job_id, vtt_path)
         
-        # Enhanced transcription with better error handling
+        def on_segments(segments):
+            caption_writer.write_segments(segments)
+            publish_segments(job_id, segments)
+
+        # Decode the audio once; the buffer feeds the cache key, VAD splitting and Whisper
+        pcm_path = os.path.join(UPLOAD_FOLDER, f"{job_id}_audio.pcm")
+        audio = None
         try:
-            result = model.transcribe(
-                filepath,
-                language=None,  # Auto-detect language
-                task="transcribe",
-                verbose=False,
-                word_timestamps=True,
-                temperature=0.0,
-                compression_ratio_threshold=2.4,
-                logprob_threshold=-1.0,
-                no_speech_threshold=0.6
-            )
+            model_name = model_registry.resolve(requested_model) or model_registry.default_model
+            
+            # Byte-identical re-uploads resolve through the upload hash without decoding anything
+            upload_key = None
+            result = None
+            if content_hash:
+                upload_key = make_cache_key(content_hash, model_name, TRANSCRIBE_OPTIONS, model_registry.backend.name)
+                cache_key = transcription_cache.get_alias(upload_key)
+                if cache_key:
+                    result = transcription_cache.get(cache_key)
             
-            # Validate transcription result
-            if not result or 'segments' not in result or not result['segments']:
-                raise Exception("No speech detected in the video or transcription failed")
+            if result is None:
+                job_store.record_file(job_id, pcm_path, 0)
+                with job_metrics.stage('extract_audio'):
+                    audio = extract_audio(filepath, pcm_path, cancel_token=cancel_token)
+                record_job_file(job_id, pcm_path)
+                with job_metrics.stage('cache_lookup'):
+                    audio_hash = hash_file(pcm_path)
+                    cache_key = make_cache_key(audio_hash, model_name, TRANSCRIBE_OPTIONS, model_registry.backend.name)
+                    result = transcription_cache.get(cache_key)
+            
+            if result is not None:
+                logger.info(f"Transcription cache hit for job {job_id}")
+                on_segments(result['segments'])
+            else:
+                def report_progress(done, total):
+                    job_store.update(job_id, progress=round(done / total * 100))
+                    with job_updates:
+                        job_updates.notify_all()
+                
+                with job_metrics.stage('transcribe'):
+                    result, loaded_name = run_transcription(
+                        job_id, audio, pcm_path, model_name, stream, report_progress, on_segments, cancel_token
+                    )
+                if loaded_name != model_name:
+                    # The registry fell back to another model; cache under the one that ran
+                    model_name = loaded_name
+                    upload_key = make_cache_key(content_hash, model_name, TRANSCRIBE_OPTIONS, model_registry.backend.name) if content_hash else None
+                    cache_key = make_cache_key(audio_hash, model_name, TRANSCRIBE_OPTIONS, model_registry.backend.name)
+                
+                # Validate transcription result
+                if not result or 'segments' not in result or not result['segments']:
+                    raise Exception("No speech detected in the video or transcription failed")
                 
+                transcription_cache.put(cache_key, result)
+            
+            if upload_key:
+                transcription_cache.put_alias(upload_key, cache_key)
+                
+        except JobCancelled:
+            caption_writer.close()
+            raise
         except Exception as transcribe_error:
             logger.error(f"Transcription failed for job {job_id}: {transcribe_error}")
-            with processing_lock:
-                job_status[job_id] = {
-                    'status': 'failed',
-                    'filename': filename,
-                    'error': f'Transcription failed: {str(transcribe_error)}'
-                }
+            caption_writer.close()
+            record_job_file(job_id, srt_path)
+            record_job_file(job_id, vtt_path)
+            set_job_status(job_id, {
+                'status': 'failed',
+                'filename': filename,
+                'error': f'Transcription failed: {str(transcribe_error)}'
+            }, job_metrics)
             return
+        finally:
+            del audio
+            remove_job_file(pcm_path)
+        
+        caption_writer.close()
+        record_job_file(job_id, vtt_path)
 
         # Log memory after transcription
         memory = psutil.virtual_memory()
         logger.info(f"Memory usage after transcription: {memory.used / 1024 / 1024:.1f}MB")
 
-        with processing_lock:
-            job_status[job_id] = {'status': 'generating_captions', 'filename': filename}
-        
-        srt_path = os.path.join(PROCESSED_FOLDER, f"{job_id}_captions.srt")
+        cancel_token.check()
+        set_job_status(job_id, {'status': 'generating_captions', 'filename': filename}, job_metrics)
         
         # Create output video filename with subtitles
         name, ext = os.path.splitext(filename)
         output_video_filename = f"{job_id}_with_subtitles{ext}"
         output_video_path = os.path.join(PROCESSED_FOLDER, output_video_filename)
 
-        generate_srt(result["segments"], srt_path)
+        with job_metrics.stage('generate_srt'):
+            export_captions(result["segments"], caption_paths, language=result.get('language'))
+        for path in caption_paths.values():
+            record_job_file(job_id, path)
+        # The cached transcript lets /captions re-render any format without the pipeline
+        caption_info = dict(caption_urls(job_id), transcript_key=cache_key, language=result.get('language'))
         
-        with processing_lock:
-            job_status[job_id] = {'status': 'embedding_subtitles', 'filename': filename}
+        cancel_token.check()
+        set_job_status(job_id, {'status': 'embedding_subtitles', 'filename': filename}, job_metrics)
         
+        output_options = dict(output_options or {})
+        if output_options.pop('preview', False) and run_preview_render(
+                job_id, filepath, filename, srt_path, ext, duration, caption_info, cancel_token, job_metrics):
+            return
+        # Track the output before ffmpeg runs so a partial file is still cleaned up
+        job_store.record_file(job_id, output_video_path, 0)
         try:
-            overlay_subtitles(filepath, srt_path, output_video_path)
+            encode_started = time.time()
+            # Parallel encodes split the cores instead of each starting a thread per core
+            with scheduler.encode_slot() as encode_threads, job_metrics.stage('overlay_subtitles'):
+                threads = min(output_options.get('threads') or encode_threads, encode_threads)
+                output_mode = overlay_subtitles(filepath, srt_path, output_video_path,
+                                                **dict(output_options, threads=threads),
+                                                cancel_token=cancel_token, duration=duration,
+                                                on_progress=encode_reporter(job_id))
+            encode_seconds = round(time.time() - encode_started, 2)
+            record_job_file(job_id, output_video_path)
             
             if os.path.exists(output_video_path):
-                logger.info(f"Video processing completed successfully for job {job_id}")
-                with processing_lock:
-                    job_status[job_id] = {
-                        'status': 'completed',
-                        'filename': filename,
-                        'download_url': f"/download/{output_video_filename}",
-                        'srt_url': f"/download_srt/{job_id}_captions.srt"
-                    }
+                logger.info(f"Video processing completed successfully for job {job_id} ({output_mode} mode, encode took {encode_seconds}s)")
+                set_job_status(job_id, {
+                    'status': 'completed',
+                    'filename': filename,
+                    'download_url': f"/download/{output_video_filename}",
+                    **caption_info,
+                    'output_mode': output_mode,
+                    'encode_seconds': encode_seconds
+                }, job_metrics)
                 # Remove original upload file to save space AFTER successful processing
-                try:
-                    os.remove(filepath)
-                    logger.info(f"Removed original upload file: {filepath}")
-                except Exception as e:
-                    logger.error(f"Could not remove upload file: {e}")
+                remove_job_file(filepath)
             else:
-                with processing_lock:
-                    job_status[job_id] = {
-                        'status': 'completed_srt_only',
-                        'filename': filename,
-                        'error': 'Output video file was not created, but SRT file is available',
-                        'srt_url': f"/download_srt/{job_id}_captions.srt"
-                    }
-        except Exception as subtitle_error:
-            logger.error(f"Failed to embed subtitles for job {job_id}: {str(subtitle_error)}")
-            with processing_lock:
-                job_status[job_id] = {
+                set_job_status(job_id, {
                     'status': 'completed_srt_only',
                     'filename': filename,
-                    'error': f'Failed to embed subtitles: {str(subtitle_error)}',
-                    'srt_url': f"/download_srt/{job_id}_captions.srt"
-                }
+                    'error': 'Output video file was not created, but SRT file is available',
+                    **caption_info
+                }, job_metrics)
+        except JobCancelled:
+            raise
+        except Exception as subtitle_error:
+            logger.error(f"Failed to embed subtitles for job {job_id}: {str(subtitle_error)}")
+            set_job_status(job_id, {
+                'status': 'completed_srt_only',
+                'filename': filename,
+                'error': f'Failed to embed subtitles: {str(subtitle_error)}',
+                **caption_info
+            }, job_metrics)
         
         # Log final memory usage
         memory = psutil.virtual_memory()
@@ -288,76 +579,803 @@ def process_video_task(job_id, filepath, filename):
         # Force garbage collection
         gc.collect()
             
+    except JobCancelled as e:
+        logger.info(f"Job {job_id} cancelled: {e}")
+        set_job_status(job_id, {
+            'status': 'cancelled',
+            'filename': filename,
+            'error': str(e)
+        }, job_metrics)
+        # Nothing of a cancelled job is served, so free its storage right away
+        for path, _ in job_store.job_files(job_id):
+            remove_job_file(path)
     except Exception as e:
         logger.error(f"Video processing failed for job {job_id}: {str(e)}")
-        with processing_lock:
-            job_status[job_id] = {
+        set_job_status(job_id, {
+            'status': 'failed',
+            'filename': filename,
+            'error': str(e)
+        }, job_metrics)
+
+def run_preview_render(job_id, filepath, filename, srt_path, ext, duration, caption_info, cancel_token, job_metrics):
+    """Render the low-res preview and finish the job, leaving the full render for /render/<job_id>
+
+    Returns False if the preview failed, so the caller renders full quality right away.
+    """
+    preview_filename = f"{job_id}_preview{ext}"
+    preview_path = os.path.join(PROCESSED_FOLDER, preview_filename)
+    preview_seconds = BURN_IN_PRESETS['preview']['seconds']
+    job_store.record_file(job_id, preview_path, 0)
+    try:
+        with scheduler.encode_slot() as encode_threads, job_metrics.stage('preview_render'):
+            overlay_subtitles(filepath, srt_path, preview_path, mode='preview', threads=encode_threads,
+                              cancel_token=cancel_token,
+                              duration=min(duration, preview_seconds) if duration and preview_seconds else duration,
+                              on_progress=encode_reporter(job_id))
+        record_job_file(job_id, preview_path)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        logger.error(f"Preview render failed for job {job_id}, rendering full quality instead: {e}")
+        remove_job_file(preview_path)
+        return False
+    
+    logger.info(f"Preview ready for job {job_id}; full render deferred until requested")
+    set_job_status(job_id, {
+        'status': 'completed',
+        'filename': filename,
+        'duration': duration,
+        'preview_url': f"/download/{preview_filename}",
+        **caption_info,
+        'final_status': 'pending',
+        'render_url': f"/render/{job_id}"
+    }, job_metrics)
+    return True
+
+def render_final_task(job_id):
+    """Scheduler entry point for a deferred full-quality render requested through /render/<job_id>"""
+    info = job_store.get(job_id)
+    payload = job_store.get_payload(job_id)
+    if not info or not payload or not job_store.update(job_id, expect={'final_status': ('queued',)},
+                                                       final_status='rendering'):
+        return
+    cancel_token = CancelToken()
+    with running_jobs_lock:
+        running_jobs[job_id] = cancel_token
+    output_options = dict(payload['output_options'])
+    output_options.pop('preview', None)
+    output_video_filename = f"{job_id}_with_subtitles{os.path.splitext(payload['filename'])[1]}"
+    output_video_path = os.path.join(PROCESSED_FOLDER, output_video_filename)
+    srt_path = os.path.join(PROCESSED_FOLDER, f"{job_id}_captions.srt")
+    job_store.record_file(job_id, output_video_path, 0)
+    try:
+        if not os.path.exists(payload['filepath']):
+            raise Exception('The original upload has expired. Please upload again.')
+        started = time.perf_counter()
+        with scheduler.encode_slot() as encode_threads:
+            threads = min(output_options.get('threads') or encode_threads, encode_threads)
+            output_mode = overlay_subtitles(payload['filepath'], srt_path, output_video_path,
+                                            **dict(output_options, threads=threads),
+                                            duration=info.get('duration'), on_progress=encode_reporter(job_id),
+                                            cancel_token=cancel_token)
+        encode_seconds = round(time.perf_counter() - started, 2)
+        STAGE_SECONDS.observe(encode_seconds, stage='final_render')
+        record_job_file(job_id, output_video_path)
+        job_store.update(job_id, final_status='ready', download_url=f"/download/{output_video_filename}",
+                         output_mode=output_mode, encode_seconds=encode_seconds)
+        logger.info(f"Full render finished for job {job_id} ({output_mode} mode, {encode_seconds}s)")
+        remove_job_file(payload['filepath'])
+    except JobCancelled as e:
+        logger.info(f"Full render for job {job_id} cancelled: {e}")
+        remove_job_file(output_video_path)
+        job_store.update(job_id, final_status='cancelled', final_error=str(e))
+    except Exception as e:
+        logger.error(f"Full render failed for job {job_id}: {e}")
+        remove_job_file(output_video_path)
+        job_store.update(job_id, final_status='failed', final_error=str(e))
+    finally:
+        with running_jobs_lock:
+            running_jobs.pop(job_id, None)
+    with job_updates:
+        job_updates.notify_all()
+
+def process_video_task(job_id, filepath, filename, stream=False, output_options=None, content_hash=None,
+                       requested_model=None, profile=False):
+    """Scheduler entry point: runs the job with timing, RSS sampling and optional profiling"""
+    info = job_store.get(job_id) or {}
+    job_metrics = JobMetrics(info.get('timings'))
+    job_metrics.start_sampling()
+    profiler = start_profiler(job_id) if profile else None
+    cancel_token = CancelToken()
+    with running_jobs_lock:
+        running_jobs[job_id] = cancel_token
+    ran = False
+    try:
+        ran = run_video_task(job_id, filepath, filename, stream, output_options, content_hash,
+                             requested_model, job_metrics, cancel_token, info.get('duration')) is not False
+    finally:
+        with running_jobs_lock:
+            running_jobs.pop(job_id, None)
+        extra = {}
+        if profiler:
+            extra['profile_url'] = stop_profiler(job_id, profiler)
+        info = job_store.get(job_id)
+        job_metrics.finish(info.get('status') if ran and info else None)
+        if ran and info:
+            job_store.update(job_id, **job_metrics.as_status(), **extra)
+            with job_updates:
+                job_updates.notify_all()
+
+def transcribe_batch_group(batch_id, members):
+    """Transcribe short batch clips in one packed model pass, then queue each clip's render
+
+    Results go into the transcription cache under each upload's key, so the member
+    jobs skip straight to captions. If the packed pass fails they transcribe alone.
+    Cancelling the batch stops the pass, terminating ffmpeg or the worker running it.
+    """
+    members = [m for m in members if (job_store.get(m['job_id']) or {}).get('status') == 'queued']
+    model_name = members[0]['model'] if members else None
+    pcm_paths = []
+    with running_jobs_lock:
+        cancel_token = running_jobs.setdefault(batch_id, CancelToken())
+        batch_passes[batch_id] = batch_passes.get(batch_id, 0) + 1
+    try:
+        clips, durations, keys = [], [], []
+        for member in members:
+            cancel_token.check()
+            upload_key = make_cache_key(member['content_hash'], model_name, TRANSCRIBE_OPTIONS, model_registry.backend.name)
+            if transcription_cache.get_alias(upload_key):
+                continue
+            pcm_path = os.path.join(UPLOAD_FOLDER, f"{member['job_id']}_audio.pcm")
+            job_store.record_file(member['job_id'], pcm_path, 0)
+            pcm_paths.append(pcm_path)
+            audio = extract_audio(member['filepath'], pcm_path, cancel_token=cancel_token)
+            record_job_file(member['job_id'], pcm_path)
+            clips.append(audio)
+            durations.append(len(audio) / SAMPLE_RATE)
+            keys.append((upload_key, make_cache_key(hash_file(pcm_path), model_name, TRANSCRIBE_OPTIONS, model_registry.backend.name)))
+        
+        if len(clips) > 1:
+            started = time.perf_counter()
+            pack_path = os.path.join(UPLOAD_FOLDER, f"{batch_id}_{members[0]['job_id']}_pack.pcm")
+            job_store.record_file(batch_id, pack_path, 0)
+            pcm_paths.append(pack_path)
+            packed, offsets = pack_clips(clips)
+            packed.tofile(pack_path)
+            del packed
+            record_job_file(batch_id, pack_path)
+            audio = np.memmap(pack_path, dtype=np.float32, mode='c')
+            logger.info(f"Transcribing {len(clips)} clips of batch {batch_id} in one pass ({len(audio) / SAMPLE_RATE:.0f}s)")
+            result, loaded_name = run_transcription(batch_id, audio, pack_path, model_name, False, None, None,
+                                                    cancel_token=cancel_token)
+            del audio
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='batch_transcribe')
+            if loaded_name == model_name:
+                for (upload_key, cache_key), clip_result in zip(keys, unpack_result(result, offsets, durations)):
+                    if clip_result['segments']:
+                        transcription_cache.put(cache_key, clip_result)
+                        transcription_cache.put_alias(upload_key, cache_key)
+    except JobCancelled as e:
+        logger.info(f"Packed transcription for batch {batch_id} stopped: {e}")
+    except Exception as e:
+        logger.error(f"Packed transcription failed for batch {batch_id}, clips will run one by one: {e}")
+    finally:
+        with running_jobs_lock:
+            batch_passes[batch_id] -= 1
+            if not batch_passes[batch_id]:
+                del batch_passes[batch_id]
+                running_jobs.pop(batch_id, None)
+        clips = None
+        for pcm_path in pcm_paths:
+            remove_job_file(pcm_path)
+        for member in members:
+            scheduler.submit(member['job_id'], process_video_task, member['args'], member['priority'], force=True)
+
+def queue_batch(batch_id, jobs, pack=True):
+    """Queue a batch's jobs; clips under SHORT_CLIP_SECONDS share packed model passes"""
+    groups = []
+    current, current_seconds = [], 0
+    for job in jobs:
+        if not pack or not job['duration'] or job['duration'] >= SHORT_CLIP_SECONDS:
+            scheduler.submit(job['job_id'], process_video_task, job['args'], job['priority'], force=True)
+            continue
+        if current and current_seconds + job['duration'] > BATCH_PACK_SECONDS:
+            groups.append(current)
+            current, current_seconds = [], 0
+        current.append(job)
+        current_seconds += job['duration']
+    if current:
+        groups.append(current)
+    
+    for group in groups:
+        if len(group) == 1:
+            job = group[0]
+            scheduler.submit(job['job_id'], process_video_task, job['args'], job['priority'], force=True)
+        else:
+            scheduler.submit(f"{batch_id}-{group[0]['job_id']}", transcribe_batch_group,
+                             (batch_id, group), group[0]['priority'], force=True)
+
+def recover_final_render(job_id, payload):
+    """Requeue a deferred full render a previous process left queued or running"""
+    if not payload or not os.path.exists(payload['filepath']):
+        job_store.update(job_id, final_status='failed',
+                         final_error='The original upload has expired. Please upload again.')
+        return
+    job_store.update(job_id, final_status='queued', final_error=None)
+    try:
+        scheduler.submit(f"{job_id}-final", render_final_task, (job_id,), PRIORITY_LOW)
+        logger.info(f"Recovered interrupted full render for job {job_id}")
+    except QueueFullError:
+        job_store.update(job_id, final_status='failed',
+                         final_error='The full render was interrupted by a server restart. Please request it again.')
+
+def recover_interrupted_jobs():
+    """Requeue jobs a previous process left unfinished, or fail them if their upload is gone"""
+    for job_id, info, payload in job_store.claim_interrupted():
+        if info.get('status') == BATCH_STATUS:
+            # Members are recovered individually; the batch record only lists them
+            continue
+        if info.get('status') == 'completed':
+            recover_final_render(job_id, payload)
+            continue
+        filename = info.get('filename')
+        if job_store.control_state([job_id]).get(job_id, (False, None))[0]:
+            set_job_status(job_id, {'status': 'cancelled', 'filename': filename, 'error': 'Cancelled'})
+            continue
+        if not payload or not os.path.exists(payload['filepath']):
+            set_job_status(job_id, {
                 'status': 'failed',
                 'filename': filename,
-                'error': str(e)
-            }
+                'error': 'Processing was interrupted by a server restart. Please upload again.'
+            })
+            continue
+        
+        # The job is decoded from the start again, so /events would otherwise replay its captions twice
+        job_store.clear_segments(job_id)
+        set_job_status(job_id, {'status': 'queued', 'filename': filename, 'duration': info.get('duration')})
+        try:
+            scheduler.submit(
+                job_id, process_video_task,
+                (job_id, payload['filepath'], filename, payload['stream'],
+                 payload['output_options'], payload.get('content_hash'), payload.get('model'),
+                 payload.get('profile', False)),
+                payload['priority']
+            )
+            logger.info(f"Recovered interrupted job {job_id}")
+        except QueueFullError:
+            set_job_status(job_id, {
+                'status': 'failed',
+                'filename': filename,
+                'error': 'Processing was interrupted by a server restart. Please upload again.'
+            })
 
-@app.route('/upload', methods=['POST'])
-def upload_video():
-    if 'video' not in request.files:
-        return jsonify({'error': 'No video file provided'}), 400
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(error):
+    message = error.reason if isinstance(error, UploadTooLarge) else 'File too large. Maximum size is 100MB per file.'
+    status = 507 if isinstance(error, UploadTooLarge) and error.limit < MAX_UPLOAD_BYTES else 413
+    return jsonify({'error': message}), status
 
-    video = request.files['video']
-    if video.filename == '':
-        return jsonify({'error': 'Empty filename'}), 400
+@app.before_request
+def ensure_started():
+    """Finish startup on the first request when a server loaded app:app instead of create_app()"""
+    if services_started.is_set() or request.endpoint in ('healthz', 'readyz'):
+        return None
+    if startup_error:
+        return jsonify({'error': 'The server is misconfigured and did not start. See its log.'}), 503
+    create_app()
 
-    # Check file size (limit to 100MB per file)
-    if request.content_length and request.content_length > 100 * 1024 * 1024:
-        return jsonify({'error': 'File too large. Maximum size is 100MB per file.'}), 400
+@app.teardown_request
+def discard_unclaimed_uploads(exc):
+    """Delete partially streamed uploads from requests that were rejected or aborted"""
+    for sink in getattr(request, 'upload_sinks', []):
+        if not sink.claimed:
+            sink.discard()
+
+def check_upload_capacity(expected_size):
+    """Return (error_response, storage_budget) for a new upload of roughly expected_size bytes"""
+    # Reject early when the queue is full rather than accepting an upload we cannot process
+    try:
+        scheduler.check_capacity()
+    except QueueFullError as e:
+        return queue_full_response(e), 0
 
     # Check available storage space
-    current_storage = get_directory_size(TEMP_BASE_DIR)
-    estimated_size = request.content_length or 0
+    current_storage = get_storage_usage()
     
-    if current_storage + estimated_size > TEMP_STORAGE_LIMIT:
+    if current_storage + expected_size > TEMP_STORAGE_LIMIT:
         # Try cleanup first
         cleanup_old_files()
-        current_storage = get_directory_size(TEMP_BASE_DIR)
+        current_storage = get_storage_usage()
         
-        if current_storage + estimated_size > TEMP_STORAGE_LIMIT:
-            return jsonify({'error': 'Temporary storage full. Please try again in a few minutes.'}), 507
+        if current_storage + expected_size > TEMP_STORAGE_LIMIT:
+            return (jsonify({'error': 'Temporary storage full. Please try again in a few minutes.'}), 507), 0
+    return None, TEMP_STORAGE_LIMIT - current_storage
+
+def create_job(job_id, filepath, original_filename, form, content_hash, timings=None, batch_id=None):
+    """Validate and probe a stored upload and record the job; returns (job, error, status_code)
+
+    Rejected uploads are deleted. job holds what scheduler.submit needs plus the probed duration.
+    """
+    output_options, options_error = parse_output_options(form)
+    if options_error:
+        os.remove(filepath)
+        return None, options_error, 400
+    
+    # Probe before queueing so unusable uploads never cost a worker slot
+    timings = dict(timings or {})
+    try:
+        probe_started = time.perf_counter()
+        media_info = probe_media(filepath)
+        timings['probe'] = round(time.perf_counter() - probe_started, 3)
+        STAGE_SECONDS.observe(timings['probe'], stage='probe')
+    except Exception as e:
+        os.remove(filepath)
+        return None, str(e), 400
+    if not media_info['has_audio']:
+        os.remove(filepath)
+        return None, 'The video has no audio track to transcribe.', 400
+    if media_info['duration'] and media_info['duration'] > MAX_DURATION_SECONDS:
+        os.remove(filepath)
+        return None, f'Video is too long. Maximum length is {MAX_DURATION_SECONDS // 60} minutes.', 413
+    
+    model_name = model_registry.resolve(form.get('model'))
+    if not model_name:
+        os.remove(filepath)
+        return None, f"Unknown model. Choose one of: {', '.join(model_registry.allowed)}", 400
+    
+    stream = str(form.get('stream', 'false')).lower() == 'true'
+    profile = PROFILING_ENABLED and str(form.get('profile', 'false')).lower() == 'true'
+    priority = get_job_priority(form.get('priority'), media_info['duration'])
+    info = {'status': 'queued', 'filename': original_filename, 'duration': media_info['duration'], 'timings': timings}
+    if batch_id:
+        info['batch_id'] = batch_id
+    # The payload is what recover_interrupted_jobs needs to re-run the job after a restart
+    job_store.create(
+        job_id,
+        info,
+        payload={
+            'filepath': filepath,
+            'filename': original_filename,
+            'stream': stream,
+            'output_options': output_options,
+            'priority': priority,
+            'content_hash': content_hash,
+            'model': model_name,
+            'profile': profile
+        }
+    )
+    record_job_file(job_id, filepath)
+    return {
+        'job_id': job_id,
+        'filepath': filepath,
+        'filename': original_filename,
+        'content_hash': content_hash,
+        'duration': media_info['duration'],
+        'model': model_name,
+        'priority': priority,
+        'args': (job_id, filepath, original_filename, stream, output_options, content_hash, model_name, profile)
+    }, None, None
+
+def start_job(job_id, filepath, original_filename, form, content_hash, timings=None):
+    """Probe a stored upload, record the job and queue it; returns a Flask response"""
+    job, error, status_code = create_job(job_id, filepath, original_filename, form, content_hash, timings)
+    if error:
+        return jsonify({'error': error}), status_code
+    
+    try:
+        position = scheduler.submit(job_id, process_video_task, job['args'], job['priority'])
+    except QueueFullError as e:
+        cleanup_job_files(job_id)
+        return queue_full_response(e)
+
+    logger.info(f"Upload successful for job {job_id}, queue position {position}")
+    return jsonify({'job_id': job_id, 'queue_position': position}), 202
+
+@app.route('/upload', methods=['POST'])
+def upload_video():
+    # Check file size (limit to 100MB per file)
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify({'error': 'File too large. Maximum size is 100MB per file.'}), 400
+
+    error_response, storage_budget = check_upload_capacity(request.content_length or 0)
+    if error_response:
+        return error_response
+
+    upload_started = time.perf_counter()
+    # The body is only read from here on; uploads without a Content-Length are still
+    # stopped as soon as they pass the size limit or the remaining storage
+    request.upload_budget = storage_budget
+    if 'video' not in request.files:
+        return jsonify({'error': 'No video file provided'}), 400
+
+    video = request.files['video']
+    if video.filename == '':
+        return jsonify({'error': 'Empty filename'}), 400
 
     job_id = str(uuid.uuid4())
     filename = f"{job_id}_{video.filename}"
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     
     try:
-        video.save(filepath)
-        
-        with processing_lock:
-            file_timestamps[job_id] = datetime.now()
-            job_status[job_id] = {'status': 'uploaded', 'filename': video.filename}
-        
-        # Start processing in background thread
-        thread = threading.Thread(target=process_video_task, args=(job_id, filepath, video.filename))
-        thread.daemon = True  # Make thread daemon so it doesn't prevent app shutdown
-        thread.start()
-
-        logger.info(f"Upload successful for job {job_id}")
-        return jsonify({'job_id': job_id}), 202
+        sink = video.stream
+        sink.claim(filepath)
+        upload_seconds = time.perf_counter() - upload_started
+        STAGE_SECONDS.observe(upload_seconds, stage='upload')
+        return start_job(job_id, filepath, video.filename, request.form, sink.hexdigest(),
+                         {'upload': round(upload_seconds, 3)})
         
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+@app.route('/batches', methods=['POST'])
+def create_batch():
+    """Upload many videos (repeated 'videos' fields) or one zip ('archive') as a single batch
+
+    Every file becomes a normal job sharing the form options; a file that fails
+    validation is reported in 'rejected' without failing the rest.
+    """
+    error_response, storage_budget = check_upload_capacity(request.content_length or 0)
+    if error_response:
+        return error_response
+    
+    # One request carries many files, so only the storage budget bounds the whole of it; each
+    # video is still capped at MAX_UPLOAD_BYTES while it streams, and a zip at the budget
+    request.max_content_length = TEMP_STORAGE_LIMIT + 1024 * 1024
+    request.max_archive_bytes = TEMP_STORAGE_LIMIT
+    request.upload_budget = storage_budget
+    
+    staged = [(os.path.basename(video.filename), video.stream)
+              for video in request.files.getlist('videos') if video.filename]
+    archive = request.files.get('archive')
+    if archive and archive.filename:
+        archive.stream.close()
+        try:
+            staged.extend(extract_archive(
+                archive.stream.path, UPLOAD_FOLDER, MAX_UPLOAD_BYTES,
+                storage_budget - sum(sink.bytes_written for _, sink in staged) - archive.stream.bytes_written,
+                MAX_BATCH_FILES
+            ))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        finally:
+            archive.stream.discard()
+    
+    if not staged:
+        return jsonify({'error': "No videos provided. Send 'videos' files or a zip 'archive'."}), 400
+    if len(staged) > MAX_BATCH_FILES:
+        for _, sink in staged:
+            sink.discard()
+        return jsonify({'error': f'Too many files. A batch can hold up to {MAX_BATCH_FILES} videos.'}), 400
+    
+    batch_id = str(uuid.uuid4())
+    jobs, rejected = [], []
+    for name, sink in staged:
+        if sink.bytes_written > MAX_UPLOAD_BYTES:
+            # Only a 'videos' part named .zip gets past the streaming cap
+            sink.discard()
+            rejected.append({'filename': name, 'error': 'File too large. Maximum size is 100MB per file.'})
+            continue
+        job_id = str(uuid.uuid4())
+        filepath = os.path.join(UPLOAD_FOLDER, f"{job_id}_{name}")
+        sink.claim(filepath)
+        job, error, _ = create_job(job_id, filepath, name, request.form, sink.hexdigest(), batch_id=batch_id)
+        if error:
+            rejected.append({'filename': name, 'error': error})
+        else:
+            jobs.append(job)
+    
+    if not jobs:
+        return jsonify({'error': 'No usable videos in the batch', 'rejected': rejected}), 400
+    
+    job_store.create(batch_id, {
+        'status': BATCH_STATUS,
+        'job_ids': [job['job_id'] for job in jobs],
+        'rejected': rejected
+    })
+    queue_batch(batch_id, jobs, pack=str(request.form.get('pack', 'true')).lower() != 'false')
+    logger.info(f"Batch {batch_id} queued with {len(jobs)} jobs ({len(rejected)} rejected)")
+    return jsonify({
+        'batch_id': batch_id,
+        'jobs': [{'job_id': job['job_id'], 'filename': job['filename']} for job in jobs],
+        'rejected': rejected
+    }), 202
+
+def get_batch(batch_id):
+    """Return (batch record, [(job_id, status dict or None)]) or (None, None)"""
+    batch = job_store.get(batch_id)
+    if batch is None or batch.get('status') != BATCH_STATUS:
+        return None, None
+    return batch, [(job_id, job_store.get(job_id)) for job_id in batch.get('job_ids', [])]
+
+@app.route('/batches/<batch_id>', methods=['GET'])
+def batch_status(batch_id):
+    """Aggregate progress of a batch plus each member's status"""
+    batch, members = get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found or expired'}), 404
+    job_store.touch([batch_id] + [job_id for job_id, _ in members])
+    
+    counts = {}
+    progress = 0
+    jobs = []
+    for job_id, info in members:
+        info = info or {'status': 'expired'}
+        status = info.get('status')
+        counts[status] = counts.get(status, 0) + 1
+        if status in TERMINAL_STATUSES or status == 'expired':
+            job_progress = 100
+        elif status == 'transcribing':
+            job_progress = STATUS_PROGRESS['transcribing'] + 0.7 * info.get('progress', 0)
+        elif status == 'embedding_subtitles':
+            job_progress = STATUS_PROGRESS['embedding_subtitles'] + 0.15 * (info.get('progress') or 0)
+        else:
+            job_progress = STATUS_PROGRESS.get(status, 0)
+        progress += job_progress
+        jobs.append(url_signer.sign_fields({
+            key: info[key] for key in ('status', 'filename', 'error') + URL_FIELDS
+            if key in info
+        }))
+        jobs[-1]['job_id'] = job_id
+    
+    done = sum(counts.get(status, 0) for status in TERMINAL_STATUSES + ['expired'])
+    if done < len(members):
+        status = 'processing'
+    elif counts.get('completed', 0) == len(members):
+        status = 'completed'
+    else:
+        status = 'completed_with_errors'
+    return jsonify({
+        'batch_id': batch_id,
+        'status': status,
+        'progress': round(progress / len(members)) if members else 100,
+        'total': len(members),
+        'counts': counts,
+        'jobs': jobs,
+        'rejected': batch.get('rejected', []),
+        'download_url': url_signer.sign(f"/batches/{batch_id}/download") if done else None
+    })
+
+@app.route('/batches/<batch_id>/download', methods=['GET'])
+def download_batch(batch_id):
+    """Stream a zip of every finished member's captions and videos (?include=captions for captions only)"""
+    if check_download_link() is None:
+        return jsonify({'error': 'Download link is invalid or has expired'}), 403
+    batch, members = get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Batch not found or expired'}), 404
+    include_videos = request.args.get('include', 'all') != 'captions'
+    
+    entries = []
+    used_names = set()
+    for job_id, info in members:
+        if not info or info.get('status') not in ('completed', 'completed_srt_only'):
+            continue
+        base = os.path.splitext(info.get('filename') or job_id)[0]
+        name = base
+        suffix = 2
+        while name in used_names:
+            name = f"{base}-{suffix}"
+            suffix += 1
+        used_names.add(name)
+        for extension in CAPTION_FORMATS:
+            entries.append((f"{name}.{extension}", os.path.join(PROCESSED_FOLDER, f"{job_id}_captions.{extension}")))
+        if include_videos and info.get('download_url'):
+            video_filename = info['download_url'].rsplit('/', 1)[-1]
+            entries.append((f"{name}{os.path.splitext(video_filename)[1]}", os.path.join(PROCESSED_FOLDER, video_filename)))
+    
+    if not entries:
+        return jsonify({'error': 'No finished videos in this batch yet'}), 404
+    response = Response(stream_with_context(stream_zip(entries)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="CapVid-batch-{batch_id[:8]}.zip"'
+    return response
+
+@app.route('/uploads', methods=['POST'])
+def create_resumable_upload():
+    """Start a resumable upload: JSON body with filename, size and any /upload form options"""
+    data = request.get_json(silent=True) or {}
+    filename = os.path.basename(str(data.get('filename', '')))
+    try:
+        size = int(data.get('size', 0))
+    except (TypeError, ValueError):
+        size = 0
+    if not filename or size <= 0:
+        return jsonify({'error': 'filename and size are required'}), 400
+    if size > MAX_UPLOAD_BYTES:
+        return jsonify({'error': 'File too large. Maximum size is 100MB per file.'}), 400
+    
+    error_response, _ = check_upload_capacity(size)
+    if error_response:
+        return error_response
+    
+    form = {key: str(value) for key, value in data.items() if key not in ('filename', 'size')}
+    upload_id = resumable_uploads.create(filename, size, form)
+    # Ledger the session so reconciliation treats it as owned until it goes stale
+    record_job_file(upload_id, resumable_uploads.part_path(upload_id))
+    record_job_file(upload_id, resumable_uploads.meta_path(upload_id))
+    return jsonify({'upload_id': upload_id, 'offset': 0, 'size': size}), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def resumable_upload_status(upload_id):
+    meta = resumable_uploads.get(upload_id)
+    if meta is None:
+        return jsonify({'error': 'Upload not found or expired'}), 404
+    response = jsonify({'upload_id': upload_id, 'offset': meta['offset'], 'size': meta['size']})
+    response.headers['Upload-Offset'] = str(meta['offset'])
+    return response
+
+@app.route('/uploads/<upload_id>', methods=['PATCH'])
+def append_resumable_upload(upload_id):
+    """Append the raw request body at the Upload-Offset header; the last chunk starts the job"""
+    meta = resumable_uploads.get(upload_id)
+    if meta is None:
+        return jsonify({'error': 'Upload not found or expired'}), 404
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    
+    sink = resumable_uploads.open_sink(upload_id, offset, meta['size'])
+    if sink is None:
+        # Another request holds the upload, or client and server disagree on how much
+        # arrived; tell the client where to resume
+        current = (resumable_uploads.get(upload_id) or meta)['offset']
+        response = jsonify({'error': 'Offset mismatch or another chunk is being written', 'offset': current})
+        response.headers['Upload-Offset'] = str(current)
+        return response, 409
+    try:
+        received = copy_stream(request.stream, sink)
+    except UploadTooLarge:
+        sink.close()
+        resumable_uploads.discard(upload_id)
+        job_store.forget_file(resumable_uploads.part_path(upload_id))
+        job_store.forget_file(resumable_uploads.meta_path(upload_id))
+        return jsonify({'error': 'Upload is larger than the size it was started with'}), 400
+    finally:
+        sink.close()
+    record_job_file(upload_id, resumable_uploads.part_path(upload_id))
+    
+    if received < meta['size']:
+        response = jsonify({'upload_id': upload_id, 'offset': received, 'size': meta['size']})
+        response.headers['Upload-Offset'] = str(received)
+        return response
+    
+    # Complete: hand the file to a job exactly like a single-request upload
+    job_id = str(uuid.uuid4())
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{job_id}_{meta['filename']}")
+    part_path = resumable_uploads.part_path(upload_id)
+    os.replace(part_path, filepath)
+    job_store.forget_file(part_path)
+    job_store.forget_file(resumable_uploads.meta_path(upload_id))
+    resumable_uploads.finish(upload_id)
+    return start_job(job_id, filepath, meta['filename'], meta['form'], hash_file(filepath))
+
+def parse_output_options(form):
+    """Validate output_mode/preset/threads form fields for overlay_subtitles"""
+    mode = form.get('output_mode', 'quality')
+    if mode not in OUTPUT_MODES:
+        return None, f"Invalid output_mode. Choose one of: {', '.join(OUTPUT_MODES)}"
+    
+    options = {'mode': mode}
+    preset = form.get('preset')
+    if preset:
+        if preset not in ALLOWED_PRESETS:
+            return None, f"Invalid preset. Choose one of: {', '.join(ALLOWED_PRESETS)}"
+        options['preset'] = preset
+    
+    threads = form.get('threads')
+    if threads:
+        try:
+            options['threads'] = max(1, min(int(threads), os.cpu_count() or 1))
+        except ValueError:
+            return None, 'threads must be an integer'
+    
+    # Soft subtitles are a quick remux already, so only burn-in jobs get a preview
+    preview = str(form.get('preview', 'true' if PREVIEW_RENDER_DEFAULT else 'false')).lower() == 'true'
+    if preview and mode != 'soft':
+        options['preview'] = True
+    return options, None
+
+def get_job_priority(requested, duration):
+    """Resolve the queue priority: explicit request wins, otherwise short clips go first"""
+    if requested in PRIORITY_NAMES:
+        return PRIORITY_NAMES[requested]
+    return PRIORITY_HIGH if duration is not None and duration < SHORT_CLIP_SECONDS else PRIORITY_NORMAL
+
+def queue_full_response(error):
+    """503 with Retry-After so clients back off while the queue drains"""
+    response = jsonify({
+        'error': 'Server is busy processing other videos. Please try again shortly.',
+        'queue_length': error.queue_length,
+        'retry_after': error.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @app.route('/status/<job_id>', methods=['GET'])
 def get_status(job_id):
-    with processing_lock:
-        if job_id not in job_status:
-            logger.warning(f"Job {job_id} not found in status dictionary")
-            return jsonify({'error': 'Job not found or expired'}), 404
-        
-        status_info = job_status[job_id].copy()  # Create a copy to avoid race conditions
-        logger.info(f"Status check for job {job_id}: {status_info.get('status', 'unknown')}")
-        return jsonify(status_info)
+    status_info = job_store.get(job_id)
+    if status_info is None:
+        logger.warning(f"Job {job_id} not found in job store")
+        return jsonify({'error': 'Job not found or expired'}), 404
+    job_store.touch([job_id])
+    
+    if status_info.get('status') == 'queued':
+        queue_info = scheduler.queue_info(job_id)
+        if queue_info:
+            status_info.update(queue_info)
+    
+    logger.info(f"Status check for job {job_id}: {status_info.get('status', 'unknown')}")
+    return jsonify(url_signer.sign_fields(status_info))
+
+@app.route('/events/<job_id>', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events: caption segments as they are decoded, plus status changes"""
+    if job_store.get(job_id) is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    def generate():
+        sent_segments = 0
+        last_status = None
+        idle_seconds = 0
+        last_touch = 0
+        while True:
+            if time.time() - last_touch > 15:
+                # An open stream counts as polling, so the job is not cancelled as abandoned
+                job_store.touch([job_id])
+                last_touch = time.time()
+            status_info = job_store.get(job_id)
+            if status_info is None:
+                yield format_event('expired', {'job_id': job_id})
+                return
+            new_segments = job_store.get_segments(job_id, sent_segments)
+            
+            if new_segments:
+                sent_segments += len(new_segments)
+                yield format_event('segments', {'segments': new_segments, 'count': sent_segments})
+            if status_info != last_status:
+                last_status = status_info
+                event_data = url_signer.sign_fields(status_info)
+                if event_data.get('status') == 'queued':
+                    event_data.update(scheduler.queue_info(job_id) or {})
+                yield format_event('status', event_data)
+                if status_info.get('status') in TERMINAL_STATUSES:
+                    return
+            elif not new_segments:
+                idle_seconds += 1
+                if idle_seconds % 15 == 0:
+                    # Keep-alive comment so proxies do not close an idle stream
+                    yield ": keep-alive\n\n"
+                # Local updates wake us immediately; updates from other workers are seen within a second
+                with job_updates:
+                    job_updates.wait(timeout=1)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def check_download_link():
+    """Seconds left on the request's signed link, or None if it is missing, forged or expired"""
+    return url_signer.verify(request.path, request.args.get('expires'), request.args.get('signature'))
+
+def download_response(filename, download_name, max_age):
+    response = send_processed_file(app.config['PROCESSED_FOLDER'], filename, download_name, max_age)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Range, If-None-Match'
+    response.headers['Access-Control-Allow-Methods'] = 'GET'
+    response.headers['Access-Control-Expose-Headers'] = 'Content-Range, Accept-Ranges, ETag, Content-Length'
+    return response
 
 @app.route('/download/<filename>', methods=['GET'])
 def download_file(filename):
+    max_age = check_download_link()
+    if max_age is None:
+        return jsonify({'error': 'Download link is invalid or has expired'}), 403
     path = os.path.join(app.config['PROCESSED_FOLDER'], filename)
     if not os.path.exists(path):
         return jsonify({'error': 'File not found or expired'}), 404
@@ -367,9 +1385,9 @@ def download_file(filename):
     
     # Get original filename from job status
     original_filename = "video"  # default fallback
-    with processing_lock:
-        if job_id in job_status and 'filename' in job_status[job_id]:
-            original_filename = job_status[job_id]['filename']
+    status_info = job_store.get(job_id)
+    if status_info and 'filename' in status_info:
+        original_filename = status_info['filename']
     
     # Remove extension from original filename
     original_name_without_ext = os.path.splitext(original_filename)[0]
@@ -378,53 +1396,221 @@ def download_file(filename):
     original_extension = filename.split('.')[-1]
     capvid_filename = f"CapVid-{original_name_without_ext}.{original_extension}"
     
-    response = send_from_directory(
-        app.config['PROCESSED_FOLDER'], 
-        filename, 
-        as_attachment=True,
-        download_name=capvid_filename
-    )
-    response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-    response.headers['Access-Control-Allow-Methods'] = 'GET'
-    return response
+    return download_response(filename, capvid_filename, max_age)
 
 @app.route('/download_srt/<filename>', methods=['GET'])
 def download_srt(filename):
+    max_age = check_download_link()
+    if max_age is None:
+        return jsonify({'error': 'Download link is invalid or has expired'}), 403
     path = os.path.join(app.config['PROCESSED_FOLDER'], filename)
     if not os.path.exists(path):
         return jsonify({'error': 'SRT file not found or expired'}), 404
     
-    response = send_from_directory(app.config['PROCESSED_FOLDER'], filename, as_attachment=True)
+    return download_response(filename, filename, max_age)
+
+@app.route('/captions/<job_id>', methods=['GET'])
+def render_job_captions(job_id):
+    """Render a finished job's captions from its cached transcript
+
+    Query: format (srt, vtt, ass or json), max_chars, max_lines and max_duration
+    to repack the cues without re-running the pipeline, added to the signed
+    captions_url from the job status.
+    """
+    if check_download_link() is None:
+        return jsonify({'error': 'Download link is invalid or has expired'}), 403
+    fmt = request.args.get('format', 'srt').lower()
+    if fmt not in CAPTION_FORMATS:
+        return jsonify({'error': f"Invalid format. Choose one of: {', '.join(CAPTION_FORMATS)}"}), 400
+    try:
+        limits = CaptionLimits(
+            max_chars=min(max(int(request.args.get('max_chars', CaptionLimits().max_chars)), 10), 80),
+            max_lines=min(max(int(request.args.get('max_lines', CaptionLimits().max_lines)), 1), 3),
+            max_duration=min(max(float(request.args.get('max_duration', CaptionLimits().max_duration)), 1.0), 15.0)
+        )
+    except ValueError:
+        return jsonify({'error': 'max_chars, max_lines and max_duration must be numbers'}), 400
+
+    info = job_store.get(job_id)
+    if not info or not info.get('transcript_key'):
+        return jsonify({'error': 'Captions not found or not ready yet'}), 404
+    # Read the file itself: another worker process may have written it after this one built its index
+    result = transcription_cache.read(info['transcript_key'])
+    if result is None:
+        return jsonify({'error': 'Transcript has expired from the cache'}), 410
+
+    name = os.path.splitext(info.get('filename') or job_id)[0]
+    response = Response(
+        stream_with_context(render_captions(result['segments'], fmt, info.get('language'), limits)),
+        mimetype=CAPTION_MIMETYPES[fmt]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="CapVid-{name}.{fmt}"'
     response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
-    response.headers['Access-Control-Allow-Methods'] = 'GET'
     return response
 
+@app.route('/profile/<job_id>', methods=['GET'])
+def download_profile(job_id):
+    """cProfile stats for a job run with profile=true (open with pstats or snakeviz)"""
+    if not PROFILING_ENABLED:
+        return jsonify({'error': 'Profiling is disabled on this server'}), 404
+    if check_download_link() is None:
+        return jsonify({'error': 'Download link is invalid or has expired'}), 403
+    filename = f"{job_id}_profile.prof"
+    if not os.path.exists(os.path.join(app.config['PROCESSED_FOLDER'], filename)):
+        return jsonify({'error': 'Profile not found or expired'}), 404
+    return send_from_directory(app.config['PROCESSED_FOLDER'], filename, as_attachment=True)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics: stage histograms, queue depth, cache and ffmpeg counters"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/cleanup/<job_id>', methods=['POST'])
 def cleanup_job(job_id):
-    """Manual cleanup endpoint for specific job - only cleanup after completion"""
-    with processing_lock:
-        if job_id in job_status:
-            status = job_status[job_id].get('status')
-            if status not in ['completed', 'failed', 'completed_srt_only']:
-                return jsonify({'error': 'Cannot cleanup job that is still processing'}), 400
-    
-    cleanup_job_files(job_id)
+    """Manual cleanup endpoint for specific job - only cleanup after completion
+
+    A batch id cleans up every member job along with the batch record.
+    """
+    status_info = job_store.get(job_id)
+    job_ids = [job_id]
+    if status_info is not None and status_info.get('status') == BATCH_STATUS:
+        job_ids = status_info.get('job_ids', []) + [job_id]
+    
+    # Check everything first so a batch is never left half cleaned up
+    for member_id in job_ids:
+        member_info = job_store.get(member_id) or {}
+        member_status = member_info.get('status')
+        if member_status not in TERMINAL_STATUSES + ['queued', BATCH_STATUS, None] or member_info.get('final_status') == 'rendering':
+            return jsonify({'error': 'Cannot cleanup job that is still processing'}), 400
+    
+    for member_id in job_ids:
+        if job_store.transition(member_id, ['queued'], {'status': 'cancelled', 'error': 'Cancelled'}):
+            scheduler.cancel(member_id)
+            logger.info(f"Removed queued job {member_id} before processing started")
+        cleanup_job_files(member_id)
     return jsonify({'message': f'Job {job_id} cleaned up successfully'}), 200
 
+@app.route('/render/<job_id>', methods=['POST'])
+def request_final_render(job_id):
+    """Queue the full-quality render of a job that finished with a preview"""
+    info = job_store.get(job_id)
+    if info is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    job_store.touch([job_id])
+    final_status = info.get('final_status')
+    if final_status is None:
+        return jsonify({'error': 'Job has no deferred render'}), 400
+    if final_status == 'ready':
+        return jsonify(url_signer.sign_fields({'final_status': final_status, 'download_url': info['download_url']}))
+    
+    if final_status in RENDERABLE_FINAL_STATUSES:
+        payload = job_store.get_payload(job_id)
+        if not payload or not os.path.exists(payload['filepath']):
+            return jsonify({'error': 'The original upload has expired. Please upload again.'}), 410
+        # Mark it queued first so the task sees the request when a worker picks it up; only
+        # one of two concurrent requests gets to make the move
+        if job_store.update(job_id, expect={'final_status': RENDERABLE_FINAL_STATUSES},
+                            final_status='queued', final_error=None):
+            # Own the job so a restart of this process is what recovery looks for, and drop
+            # the flag left by cancelling an earlier render
+            job_store.take_over(job_id)
+            job_store.request_cancel(job_id, cancel=False)
+            try:
+                scheduler.submit(f"{job_id}-final", render_final_task, (job_id,), PRIORITY_LOW)
+            except QueueFullError as e:
+                job_store.update(job_id, expect={'final_status': ('queued',)}, final_status=final_status)
+                return queue_full_response(e)
+            logger.info(f"Queued full render for job {job_id}")
+            final_status = 'queued'
+        else:
+            final_status = (job_store.get(job_id) or {}).get('final_status')
+    
+    response = {'final_status': final_status}
+    response.update(scheduler.queue_info(f"{job_id}-final") or {})
+    return jsonify(response), 202
+
+@app.route('/cancel/<job_id>', methods=['POST'])
+def cancel_job(job_id):
+    """Stop a queued or running job (a batch id stops every unfinished member)
+
+    Queued jobs are cancelled on the spot. Running jobs are flagged, and the process
+    running them stops at its next checkpoint, terminating ffmpeg if it is encoding.
+    """
+    status_info = job_store.get(job_id)
+    if status_info is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    job_ids = [job_id]
+    if status_info.get('status') == BATCH_STATUS:
+        job_ids = status_info.get('job_ids', [])
+        # Stops a packed pass over the batch's short clips
+        job_store.request_cancel(job_id)
+    
+    cancelled, stopping = [], []
+    for member_id in job_ids:
+        member_info = job_store.get(member_id)
+        if member_info and member_info.get('final_status') in UNFINISHED_FINAL_STATUSES:
+            # The job is done; what is left to stop is its full render
+            if job_store.update(member_id, expect={'final_status': ('queued',)},
+                                final_status='cancelled', final_error='Cancelled'):
+                scheduler.cancel(f"{member_id}-final")
+                cancelled.append(member_id)
+            elif job_store.request_cancel(member_id):
+                stopping.append(member_id)
+            continue
+        if member_info is None or member_info.get('status') in TERMINAL_STATUSES:
+            continue
+        if job_store.transition(member_id, ['queued'], dict(member_info, status='cancelled', error='Cancelled')):
+            scheduler.cancel(member_id)
+            for path, _ in job_store.job_files(member_id):
+                remove_job_file(path)
+            cancelled.append(member_id)
+        elif job_store.request_cancel(member_id):
+            stopping.append(member_id)
+    with job_updates:
+        job_updates.notify_all()
+    # Do not wait for the watcher if the job runs in this process
+    check_cancellation()
+    
+    if not cancelled and not stopping:
+        return jsonify({'error': 'Job has already finished'}), 400
+    logger.info(f"Cancel requested for job {job_id}: {len(cancelled)} cancelled, {len(stopping)} stopping")
+    return jsonify({
+        'message': f'Cancellation requested for job {job_id}',
+        'cancelled': cancelled,
+        'stopping': stopping
+    }), 202 if stopping else 200
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness only: answers without touching models, storage or the job store"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Ready once startup finished and the default Whisper model has been loaded"""
+    if startup_error:
+        return jsonify({'ready': False, 'error': startup_error}), 503
+    if not services_started.is_set():
+        return jsonify({'ready': False, 'starting': True}), 503
+    if worker_pool:
+        status = worker_pool.stats()
+        status['ready'] = worker_pool.is_ready()
+    else:
+        status = model_registry.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
 @app.route('/storage_info', methods=['GET'])
 def storage_info():
     """Get current storage usage information"""
-    current_usage = get_directory_size(TEMP_BASE_DIR)
-    with processing_lock:
-        active_jobs = len(job_status)
+    current_usage = get_storage_usage()
+    active_jobs = job_store.count()
     
     return jsonify({
         'current_usage_mb': round(current_usage / 1024 / 1024, 2),
         'limit_mb': round(TEMP_STORAGE_LIMIT / 1024 / 1024, 2),
         'usage_percentage': round((current_usage / TEMP_STORAGE_LIMIT) * 100, 2),
-        'active_jobs': active_jobs
+        'active_jobs': active_jobs,
+        'queue': scheduler.stats()
     })
 
 @app.route('/system_info', methods=['GET'])
@@ -434,42 +1620,113 @@ def system_info():
     memory = psutil.virtual_memory()
     
     return jsonify({
-        'whisper_models': ["tiny", "base", "small"],
-        'current_model': 'adaptive (tiny/base/small based on memory)',
+        'whisper_models': model_registry.allowed,
+        'models': worker_pool.stats() if worker_pool else model_registry.status(),
         'temp_storage_mb': round(TEMP_STORAGE_LIMIT / 1024 / 1024, 2),
         'memory_total_gb': round(memory.total / (1024**3), 1),
         'memory_available_gb': round(memory.available / (1024**3), 1),
         'memory_used_gb': round(memory.used / (1024**3), 1),
+        'transcription_cache': transcription_cache.stats(),
+        'stage_seconds': STAGE_SECONDS.summary(),
         'features': [
             'Auto language detection',
             'Word-level timestamps',
             'Enhanced accuracy settings',
             'Automatic cleanup',
             'Temporary storage management',
-            'Adaptive model selection',
-            'Extended job retention (2 hours)'
+            'Warm model registry with per-job model choice',
+            'Extended job retention (2 hours)',
+            'Bounded worker pool with priority queue',
+            'Persistent job store with restart recovery',
+            'Transcription cache for repeat uploads',
+            'Parallel chunked transcription for long videos',
+            'Live caption streaming (SSE)',
+            'Soft subtitle muxing and fast burn-in presets',
+            'Single-pass audio extraction with upfront media probing',
+            'Streaming and resumable uploads',
+            'Recycled transcription worker processes',
+            'Per-stage timings and Prometheus metrics',
+            'Batch uploads with packed model passes and zipped downloads',
+            'SRT, WebVTT, ASS and JSON word-timeline captions with line packing',
+            'Quick preview render with on-demand full-quality render'
         ]
     })
 
-# Cleanup on app shutdown
-import atexit
-
 def cleanup_on_exit():
     """Clean up temporary directory on app shutdown"""
+    if PERSISTENT_STORAGE:
+        # Jobs in CAPVID_DATA_DIR are recovered by the next process
+        return
     try:
         shutil.rmtree(TEMP_BASE_DIR)
         logger.info(f"Cleaned up temporary directory: {TEMP_BASE_DIR}")
     except:
         pass
 
-atexit.register(cleanup_on_exit)
+def create_app():
+    """Set up storage, the job store, the job queue, models and background threads; returns the Flask app
+
+    Importing this module only defines the routes, so tests, tooling and forked web
+    workers load it in a fraction of a second. Servers call this once per process,
+    e.g. gunicorn 'app:create_app()'. Whisper and torch are only imported by the
+    process that transcribes, when it loads its first model. Calling it again is a no-op.
+    """
+    global TEMP_BASE_DIR, UPLOAD_FOLDER, PROCESSED_FOLDER, url_signer, resumable_uploads
+    global job_store, transcription_cache, scheduler, model_registry, worker_pool, startup_error
+    with services_lock:
+        if services_started.is_set():
+            return app
+        
+        if not PERSISTENT_STORAGE and 'gunicorn' in sys.modules:
+            # gunicorn restarts its worker (timeouts, max_requests); on a fresh temp dir the new one
+            # would lose the queued jobs, uploads and signing key of the one it replaced
+            startup_error = 'Set CAPVID_DATA_DIR when running under gunicorn'
+            raise RuntimeError(startup_error)
+        # Worker and chunk processes are forked from a server started before any of our threads
+        start_process_server()
+        # Use system temporary directory with size limit, or CAPVID_DATA_DIR to keep jobs across restarts
+        TEMP_BASE_DIR = os.environ.get('CAPVID_DATA_DIR') or tempfile.mkdtemp(prefix='capvid_')
+        UPLOAD_FOLDER = os.path.join(TEMP_BASE_DIR, 'uploads')
+        PROCESSED_FOLDER = os.path.join(TEMP_BASE_DIR, 'processed')
+        app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+        app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+        atexit.register(cleanup_on_exit)
+        
+        # Download links are signed and expire
+        url_signer = UrlSigner(load_secret(TEMP_BASE_DIR))
+        resumable_uploads = ResumableUploads(UPLOAD_FOLDER)
+        job_store = create_job_store(JOB_STORE_BACKEND, os.path.join(TEMP_BASE_DIR, 'jobs.db'))
+        # Re-uploads of the same video skip straight to caption generation
+        transcription_cache = TranscriptionCache()
+        # Bounded worker pool so concurrent uploads queue instead of fighting over CPU/RAM. The queue
+        # lives in this process and is sized for the whole machine, so run a single web worker
+        scheduler = JobScheduler()
+        # Whisper models stay resident between jobs; several sizes can be loaded within a memory
+        # budget, with up to one instance of a model per concurrent job so jobs on one model do not queue
+        model_registry = ModelRegistry(max_instances=scheduler.num_workers)
+        
+        if WORKER_MODE == 'process':
+            # The registry here only validates model names; each worker process loads its own models
+            worker_pool = TranscriptionWorkerPool(scheduler.num_workers)
+            worker_pool.start()
+        else:
+            model_registry.start()
+        threading.Thread(target=periodic_cleanup, name='capvid-cleanup', daemon=True).start()
+        threading.Thread(target=watch_running_jobs, name='capvid-cancel-watch', daemon=True).start()
+        
+        # Pick up jobs left behind by a previous process
+        recover_interrupted_jobs()
+        
+        logger.info(f"Temporary storage directory: {TEMP_BASE_DIR}")
+        logger.info(f"Storage limit: {TEMP_STORAGE_LIMIT / 1024 / 1024:.1f}MB")
+        services_started.set()
+    return app
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     host = os.environ.get('HOST', '0.0.0.0')
     debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     
-    logger.info(f"Temporary storage directory: {TEMP_BASE_DIR}")
-    logger.info(f"Storage limit: {TEMP_STORAGE_LIMIT / 1024 / 1024:.1f}MB")
-    
-    app.run(host=host, port=port, debug=debug)
+    create_app().run(host=host, port=port, debug=debug)
@@ -0,0 +1,89 @@
+import os
+import uuid
+import zipfile
+from uploads import UploadSink, UploadTooLarge, copy_stream, UPLOAD_CHUNK_SIZE
+
+# Already-compressed media gains nothing from deflate; captions shrink a lot
+DEFLATE_EXTENSIONS = ('.srt', '.vtt', '.ass', '.json', '.txt')
+
+
+def extract_archive(archive_path, dest_folder, file_limit, budget, max_files):
+    """Unpack the files of a zip upload into dest_folder; returns [(original_name, sink)]
+
+    Each member is written through an UploadSink, so the per-file limit and the
+    remaining storage budget are enforced on the decompressed bytes (zip bombs stop
+    at the limit) and every file is hashed on the way. Sinks are left unclaimed for
+    the caller to move into place.
+    """
+    extracted = []
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [
+                m for m in archive.infolist()
+                if not m.is_dir()
+                and not m.filename.startswith('__MACOSX/')
+                and not os.path.basename(m.filename).startswith('.')
+            ]
+            if len(members) > max_files:
+                raise ValueError(f"Archive contains {len(members)} files; the limit is {max_files}")
+            for member in members:
+                limit = min(file_limit, budget)
+                reason = None if limit == file_limit else 'Temporary storage full. Please try again in a few minutes.'
+                sink = UploadSink(os.path.join(dest_folder, f"{uuid.uuid4()}.part"), limit, reason=reason)
+                extracted.append((os.path.basename(member.filename), sink))
+                with archive.open(member) as source:
+                    copy_stream(source, sink)
+                sink.close()
+                budget -= sink.bytes_written
+    except zipfile.BadZipFile:
+        for _, sink in extracted:
+            sink.discard()
+        raise ValueError('Archive is not a valid zip file')
+    except (UploadTooLarge, ValueError, OSError):
+        for _, sink in extracted:
+            sink.discard()
+        raise
+    return extracted
+
+
+class _ZipBuffer:
+    """Write-only file object that zipfile streams into; drained after every chunk"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_zip(entries, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Yield a zip of (arcname, path) entries chunk by chunk without building it in memory
+
+    The output is not seekable, so zipfile writes data descriptors after each member
+    instead of patching headers; missing files are skipped.
+    """
+    output = _ZipBuffer()
+    with zipfile.ZipFile(output, 'w') as archive:
+        for arcname, path in entries:
+            if not os.path.exists(path):
+                continue
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = (zipfile.ZIP_DEFLATED if arcname.lower().endswith(DEFLATE_EXTENSIONS)
+                                  else zipfile.ZIP_STORED)
+            with open(path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as dest:
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    dest.write(chunk)
+                    if len(output.buffer) >= chunk_size:
+                        yield output.drain()
+            if output.buffer:
+                yield output.drain()
+    yield output.drain()
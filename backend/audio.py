@@ -0,0 +1,132 @@
+import os
+import json
+import subprocess
+import numpy as np
+from metrics import FFMPEG_EXITS
+from cancellation import run_process
+
+SAMPLE_RATE = 16000  # Whisper expects 16 kHz mono
+FRAME_SECONDS = 0.03
+SMOOTH_SECONDS = 0.3
+
+
+def probe_media(filepath):
+    """Read duration and stream codecs with ffprobe without decoding anything"""
+    command = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration:stream=codec_type,codec_name',
+        '-of', 'json',
+        filepath
+    ]
+    try:
+        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        info = json.loads(result.stdout)
+    except subprocess.CalledProcessError as e:
+        raise Exception(f"Could not read media file: {e.stderr.strip()[-500:]}")
+    except ValueError:
+        raise Exception("Could not read media file: invalid ffprobe output")
+
+    streams = info.get('streams', [])
+    audio_codecs = [s.get('codec_name') for s in streams if s.get('codec_type') == 'audio']
+    video_codecs = [s.get('codec_name') for s in streams if s.get('codec_type') == 'video']
+    try:
+        duration = float(info.get('format', {}).get('duration'))
+    except (TypeError, ValueError):
+        duration = None
+    return {
+        'duration': duration,
+        'has_audio': bool(audio_codecs),
+        'has_video': bool(video_codecs),
+        'audio_codec': audio_codecs[0] if audio_codecs else None,
+        'video_codec': video_codecs[0] if video_codecs else None
+    }
+
+
+def extract_audio(filepath, pcm_path, sample_rate=SAMPLE_RATE, cancel_token=None):
+    """Decode the audio track once to raw float32 mono PCM and memory-map it
+
+    ffmpeg writes straight to pcm_path, so the samples never pass through a Python
+    buffer. The copy-on-write map can be handed to Whisper, the VAD splitter and
+    the cache hasher without another decode.
+    """
+    command = [
+        'ffmpeg',
+        '-nostdin',
+        '-y',
+        '-threads', '0',
+        '-i', filepath,
+        '-vn',
+        '-f', 'f32le',
+        '-ac', '1',
+        '-acodec', 'pcm_f32le',
+        '-ar', str(sample_rate),
+        pcm_path
+    ]
+    returncode, stderr = run_process(command, cancel_token)
+    FFMPEG_EXITS.inc(step='extract_audio', code=returncode)
+    if returncode != 0:
+        raise Exception(f"Failed to decode audio: {stderr[-500:]}")
+
+    if os.path.getsize(pcm_path) == 0:
+        raise Exception("The video does not contain any decodable audio")
+    return np.memmap(pcm_path, dtype=np.float32, mode='c')
+
+
+def frame_energy_db(audio, sample_rate=SAMPLE_RATE):
+    """Smoothed per-frame RMS energy in dB, one value per 30ms frame"""
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    num_frames = len(audio) // frame_length
+    if num_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    # A strided view of the (memory-mapped) samples; einsum sums the squares frame by
+    # frame, so no squared copy of the whole signal is ever allocated
+    frames = audio[:num_frames * frame_length].reshape(num_frames, frame_length)
+    rms = np.sqrt(np.einsum('ij,ij->i', frames, frames, dtype=np.float32) / frame_length)
+    energy = 20 * np.log10(np.maximum(rms, 1e-10))
+
+    # Moving average so a single quiet frame between syllables is not picked as a pause
+    width = max(1, int(SMOOTH_SECONDS / FRAME_SECONDS))
+    kernel = np.ones(width, dtype=np.float32) / width
+    return np.convolve(energy, kernel, mode='same')
+
+
+def find_split_points(audio, chunk_seconds, search_seconds=10.0, sample_rate=SAMPLE_RATE):
+    """Pick sample offsets near every chunk_seconds boundary that fall in the quietest pause"""
+    duration = len(audio) / sample_rate
+    if duration <= chunk_seconds * 1.5:
+        return []
+
+    energy = frame_energy_db(audio, sample_rate)
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    search_frames = int(search_seconds / FRAME_SECONDS)
+    # Every chunk is at least half a chunk long, so the search never reaches back to
+    # the previous split and the loop always moves forward
+    min_chunk_frames = max(1, int(chunk_seconds / 2 / FRAME_SECONDS))
+
+    split_points = []
+    previous = 0
+    target = chunk_seconds
+    while target < duration - chunk_seconds / 2:
+        center = int(target / FRAME_SECONDS)
+        low = max(previous + min_chunk_frames, center - search_frames)
+        high = min(len(energy), center + search_frames)
+        if high <= low:
+            break
+        quietest = low + int(np.argmin(energy[low:high]))
+        split_points.append(quietest * frame_length + frame_length // 2)
+        previous = quietest
+        # Measure the next chunk from where this one actually ended
+        target = quietest * FRAME_SECONDS + chunk_seconds
+    return split_points
+
+
+def split_audio(audio, chunk_seconds, sample_rate=SAMPLE_RATE):
+    """Split audio at silence boundaries; returns a list of (offset_seconds, samples)"""
+    boundaries = [0] + find_split_points(audio, chunk_seconds, sample_rate=sample_rate) + [len(audio)]
+    return [
+        (start / sample_rate, audio[start:end])
+        for start, end in zip(boundaries[:-1], boundaries[1:])
+        if end > start
+    ]
@@ -0,0 +1,519 @@
+"""End-to-end benchmark for the caption pipeline
+
+Synthesizes test videos with ffmpeg (colour bars plus a speech-like tone with
+pauses), runs them through process_video_task directly and through /upload with
+the Flask test client, and writes per-stage latency, jobs/hour, peak memory and
+disk usage as JSON.
+
+    python benchmark.py run --stub --durations 30,120 --concurrency 4 -o new.json
+    python benchmark.py compare old.json new.json
+
+--stub swaps Whisper for a fake model so a run takes seconds and needs no weights.
+--backends whisper,int8 also loads the model with each inference backend and
+reports load time, memory, real-time factor and word error rate against the
+first backend (pass --speech with a real recording for a meaningful WER).
+"""
+import os
+import io
+import re
+import gc
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_RATE = 16000
+SAMPLE_INTERVAL = 0.25
+# Lower is better for these; jobs_per_hour is the only higher-is-better metric
+LOWER_IS_BETTER = ('mean', 'p50', 'p95', 'peak_rss_mb', 'peak_disk_mb', 'wall_seconds')
+
+
+class StubModel:
+    """Stands in for a Whisper model: one segment per 3 seconds, sleeping rtf x audio length"""
+
+    def __init__(self, rtf):
+        self.rtf = rtf
+
+    def transcribe(self, audio, **options):
+        duration = len(audio) / SAMPLE_RATE
+        time.sleep(duration * self.rtf)
+        segments = stub_segments(duration)
+        return {'text': ''.join(s['text'] for s in segments), 'segments': segments, 'language': 'en'}
+
+
+def load_stub(rtf, model_name):
+    # A module-level function, so chunk processes can unpickle the loader
+    return StubModel(rtf)
+
+
+def stub_segments(duration):
+    segments = []
+    start = 0.0
+    while start < duration:
+        end = min(duration, start + 3.0)
+        words = [
+            {'word': f' word{i}', 'start': start + i * (end - start) / 4, 'end': start + (i + 1) * (end - start) / 4}
+            for i in range(4)
+        ]
+        segments.append({
+            'id': len(segments), 'seek': int(start * 100), 'start': start, 'end': end,
+            'text': ' word0 word1 word2 word3', 'words': words
+        })
+        start = end
+    return segments
+
+
+def synthesize_media(path, duration, resolution, frequency=440):
+    """Colour bars and a 3 Hz amplitude-modulated tone with a short pause every 4 seconds"""
+    audio_expr = f"sin(2*PI*{frequency}*t)*(0.5+0.5*sin(2*PI*3*t))*gt(mod(t\\,4)\\,0.6)"
+    command = [
+        'ffmpeg', '-nostdin', '-y', '-v', 'error',
+        '-f', 'lavfi', '-i', f"smptebars=size={resolution}:rate=25:duration={duration}",
+        '-f', 'lavfi', '-i', f"aevalsrc={audio_expr}:s={SAMPLE_RATE}:d={duration}",
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-shortest',
+        path
+    ]
+    subprocess.run(command, check=True, capture_output=True)
+    return path
+
+
+def summarize(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 3),
+        'p50': round(ordered[int(0.5 * (len(ordered) - 1))], 3),
+        'p95': round(ordered[int(0.95 * (len(ordered) - 1))], 3),
+        'max': round(ordered[-1], 3)
+    }
+
+
+def directory_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResourceSampler:
+    """Peak RSS of this process tree and peak bytes under a directory, sampled in the background"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        import psutil
+        from metrics import process_tree_rss
+        process = psutil.Process()
+        while True:
+            try:
+                self.peak_rss = max(self.peak_rss, process_tree_rss(process))
+            except psutil.Error:
+                pass
+            self.peak_disk = max(self.peak_disk, directory_bytes(self.directory))
+            if self._stop.wait(SAMPLE_INTERVAL):
+                return
+
+
+def load_app(args, data_dir):
+    """Import app.py configured for an isolated benchmark run"""
+    os.environ['CAPVID_DATA_DIR'] = data_dir
+    os.environ['CAPVID_JOB_STORE'] = 'memory'
+    # A fresh cache so repeated runs measure transcription, not cache hits
+    os.environ['CAPVID_CACHE_DIR'] = os.path.join(data_dir, 'cache')
+    if args.workers:
+        os.environ['CAPVID_WORKERS'] = str(args.workers)
+    if args.stub:
+        os.environ['CAPVID_PRELOAD_MODELS'] = ''
+        os.environ['CAPVID_WORKER_MODE'] = 'thread'
+    import logging
+    import app as capvid
+    # app.py configures INFO logging on import; per-job log lines would swamp the report
+    logging.getLogger().setLevel(logging.WARNING)
+    capvid.create_app()
+    if args.stub:
+        # Nothing is preloaded with the stub, so swapping the loader after startup is early enough
+        capvid.model_registry.loader = functools.partial(load_stub, args.stub_rtf)
+        # Language detection needs the real Whisper package
+        capvid.TRANSCRIBE_OPTIONS['language'] = 'en'
+    return capvid
+
+
+def job_record(capvid, job_id, started):
+    info = capvid.job_store.get(job_id) or {}
+    return {
+        'status': info.get('status'),
+        'seconds': time.time() - started,
+        'timings': info.get('timings') or {},
+        'peak_rss_mb': info.get('peak_rss_mb')
+    }
+
+
+def run_direct(capvid, media, args):
+    """Call process_video_task for each upload, concurrency at a time, bypassing HTTP and the queue"""
+    def one(path):
+        job_id = str(uuid.uuid4())
+        filepath = os.path.join(capvid.UPLOAD_FOLDER, f"{job_id}_{os.path.basename(path)}")
+        shutil.copy(path, filepath)
+        capvid.job_store.create(job_id, {'status': 'queued', 'filename': os.path.basename(path)})
+        capvid.record_job_file(job_id, filepath)
+        started = time.time()
+        capvid.process_video_task(job_id, filepath, os.path.basename(path),
+                                  output_options={'mode': args.output_mode}, requested_model=args.model)
+        record = job_record(capvid, job_id, started)
+        capvid.cleanup_job_files(job_id)
+        return record
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        return list(pool.map(one, media))
+
+
+def run_http(capvid, media, args):
+    """POST every upload through the Flask test client at once and poll /status until done
+
+    A job whose status can no longer be read (e.g. a 404 once it expired) or that
+    runs past --job-timeout is recorded as failed instead of being polled forever.
+    """
+    client = capvid.app.test_client()
+
+    def one(path):
+        started = time.time()
+        with open(path, 'rb') as f:
+            form = {'video': (f, os.path.basename(path)), 'output_mode': args.output_mode}
+            if args.model:
+                form['model'] = args.model
+            response = client.post('/upload', data=form, content_type='multipart/form-data')
+        if response.status_code != 202:
+            return {'status': f"http {response.status_code}", 'seconds': time.time() - started, 'timings': {}}
+        job_id = response.get_json()['job_id']
+        finished_at = None
+        while True:
+            response = client.get(f"/status/{job_id}")
+            if response.status_code != 200:
+                return {'status': f"http {response.status_code}", 'seconds': time.time() - started, 'timings': {}}
+            if time.time() - started > args.job_timeout:
+                client.post(f"/cancel/{job_id}")
+                client.post(f"/cleanup/{job_id}")
+                return {'status': 'timeout', 'seconds': time.time() - started, 'timings': {}}
+            info = response.get_json()
+            if info.get('status') in capvid.TERMINAL_STATUSES:
+                finished_at = finished_at or time.time()
+                # Total time and peak RSS land just after the terminal status
+                if 'total' in (info.get('timings') or {}) or time.time() - finished_at > 2:
+                    break
+            time.sleep(0.1)
+        record = job_record(capvid, job_id, started)
+        client.post(f"/cleanup/{job_id}")
+        return record
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        return list(pool.map(one, media))
+
+
+def scenario_result(name, records, wall_seconds, sampler):
+    completed = [r for r in records if r['status'] in ('completed', 'completed_srt_only')]
+    stages = {}
+    for record in completed:
+        for stage, seconds in record['timings'].items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        'name': name,
+        'jobs': len(records),
+        'failed': len(records) - len(completed),
+        'wall_seconds': round(wall_seconds, 3),
+        'jobs_per_hour': round(len(completed) / wall_seconds * 3600, 1) if wall_seconds else None,
+        'job_seconds': summarize([r['seconds'] for r in completed]),
+        'stages': {stage: summarize(values) for stage, values in sorted(stages.items())},
+        'peak_rss_mb': round(sampler.peak_rss / 1024 / 1024, 1),
+        'peak_disk_mb': round(sampler.peak_disk / 1024 / 1024, 1)
+    }
+
+
+def bench_generate_srt(capvid, work_dir, segments=5000):
+    from helpers import generate_srt
+    fake = stub_segments(segments * 3.0)
+    path = os.path.join(work_dir, 'bench.srt')
+    started = time.perf_counter()
+    generate_srt(fake, path)
+    return {'segments': len(fake), 'seconds': round(time.perf_counter() - started, 4)}
+
+
+def bench_overlay(capvid, media_path, work_dir):
+    from helpers import generate_srt, overlay_subtitles, OUTPUT_MODES
+    srt_path = os.path.join(work_dir, 'overlay.srt')
+    duration = float(capvid.probe_media(media_path)['duration'] or 0)
+    generate_srt(stub_segments(duration), srt_path)
+    results = {}
+    for mode in OUTPUT_MODES:
+        output_path = os.path.join(work_dir, f"overlay_{mode}.mp4")
+        started = time.perf_counter()
+        try:
+            overlay_subtitles(media_path, srt_path, output_path, mode=mode)
+            results[mode] = round(time.perf_counter() - started, 3)
+        except Exception as e:
+            results[mode] = {'error': str(e)[:200]}
+    return results
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance between two transcripts over the reference length"""
+    ref = re.findall(r"[\w']+", reference.lower())
+    hyp = re.findall(r"[\w']+", hypothesis.lower())
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, word in enumerate(ref, start=1):
+        current = [i]
+        for j, other in enumerate(hyp, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word != other)))
+        previous = current
+    return round(previous[-1] / len(ref), 4)
+
+
+def bench_inference(capvid, media_path, work_dir, args):
+    """Transcribe one file with every backend; the first backend is the accuracy reference"""
+    from audio import extract_audio
+    from inference import create_backend
+    from model_registry import model_memory_bytes
+    audio = extract_audio(media_path, os.path.join(work_dir, 'inference.pcm'))
+    duration = len(audio) / SAMPLE_RATE
+    model_name = args.model or capvid.model_registry.default_model
+    results = {'model': model_name, 'media': os.path.basename(media_path),
+               'audio_seconds': round(duration, 2), 'backends': {}}
+    reference = None
+    for name in args.backends.split(','):
+        print(f"Transcribing with the {name} backend", file=sys.stderr)
+        backend = create_backend(name, args.inference_threads)
+        started = time.perf_counter()
+        model = backend.load(model_name)
+        load_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        text = model.transcribe(audio, **capvid.TRANSCRIBE_OPTIONS)['text']
+        seconds = time.perf_counter() - started
+        if reference is None:
+            reference = text
+        results['backends'][name] = {
+            'load_seconds': round(load_seconds, 3),
+            'transcribe_seconds': round(seconds, 3),
+            'realtime_factor': round(seconds / duration, 4) if duration else None,
+            'memory_mb': round((model_memory_bytes(model) or 0) / 1024 / 1024, 1),
+            'wer_vs_reference': word_error_rate(reference, text),
+            'text': text
+        }
+        # Only one copy of the weights at a time
+        del model
+        gc.collect()
+    return results
+
+
+def environment_info():
+    try:
+        ffmpeg = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg,
+        'git_commit': commit
+    }
+
+
+def run_benchmark(args):
+    data_dir = tempfile.mkdtemp(prefix='capvid_bench_')
+    media_dir = os.path.join(data_dir, 'media')
+    os.makedirs(media_dir)
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with quiet:
+            capvid = load_app(args, data_dir)
+            results = {
+                'meta': dict(environment_info(), started_at=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                             args={k: v for k, v in vars(args).items() if k != 'func'}),
+                'scenarios': [],
+                'micro': {}
+            }
+            for resolution in args.resolutions.split(','):
+                for duration in [int(d) for d in args.durations.split(',')]:
+                    # Distinct tones per copy so concurrent uploads never share a cache entry
+                    media = [
+                        synthesize_media(os.path.join(media_dir, f"{resolution}_{duration}s_{i}.mp4"),
+                                         duration, resolution, 300 + 40 * i)
+                        for i in range(args.concurrency)
+                    ]
+                    for mode in args.modes.split(','):
+                        runner = run_direct if mode == 'direct' else run_http
+                        name = f"{mode}-{resolution}-{duration}s-x{args.concurrency}"
+                        print(f"Running {name}", file=sys.stderr)
+                        with ResourceSampler(data_dir) as sampler:
+                            started = time.time()
+                            records = runner(capvid, media, args)
+                            wall = time.time() - started
+                        scenario = scenario_result(name, records, wall, sampler)
+                        scenario.update({'mode': mode, 'resolution': resolution, 'duration': duration,
+                                         'concurrency': args.concurrency})
+                        results['scenarios'].append(scenario)
+                    if not results['micro'].get('overlay_subtitles'):
+                        results['micro']['overlay_subtitles'] = {
+                            'media': os.path.basename(media[0]),
+                            'seconds': bench_overlay(capvid, media[0], data_dir)
+                        }
+            results['micro']['generate_srt'] = bench_generate_srt(capvid, data_dir)
+            if args.backends:
+                if args.stub:
+                    print("Skipping the backend comparison: it needs real Whisper weights", file=sys.stderr)
+                else:
+                    results['micro']['inference'] = bench_inference(capvid, args.speech or media[0], data_dir, args)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    for scenario in results['scenarios']:
+        print(f"{scenario['name']}: {scenario['jobs_per_hour']} jobs/h, "
+              f"p95 job {(scenario['job_seconds'] or {}).get('p95')}s, "
+              f"peak RSS {scenario['peak_rss_mb']}MB, peak disk {scenario['peak_disk_mb']}MB, "
+              f"{scenario['failed']} failed")
+    inference = results['micro'].get('inference')
+    if inference:
+        reference = next(iter(inference['backends']))
+        for name, backend in inference['backends'].items():
+            print(f"{inference['model']} on {name}: {backend['transcribe_seconds']}s for "
+                  f"{inference['audio_seconds']}s of audio (RTF {backend['realtime_factor']}), "
+                  f"load {backend['load_seconds']}s, {backend['memory_mb']}MB, "
+                  f"WER {backend['wer_vs_reference']:.1%} vs {reference}")
+    print(f"Results written to {args.output}")
+
+
+def scenarios_by_name(results):
+    """Index scenarios by name, folding the micro benchmarks into one pseudo-scenario"""
+    scenarios = {s['name']: s for s in results['scenarios']}
+    micro = results.get('micro') or {}
+    stages = {}
+    if micro.get('generate_srt'):
+        stages['generate_srt'] = {'mean': micro['generate_srt']['seconds']}
+    for mode, seconds in ((micro.get('overlay_subtitles') or {}).get('seconds') or {}).items():
+        if isinstance(seconds, (int, float)):
+            stages[f"overlay_{mode}"] = {'mean': seconds}
+    for name, backend in ((micro.get('inference') or {}).get('backends') or {}).items():
+        stages[f"inference_{name}"] = {'mean': backend['transcribe_seconds']}
+    if stages:
+        scenarios['micro'] = {'name': 'micro', 'stages': stages}
+    return scenarios
+
+
+def compare_runs(args):
+    """Print metric changes between two result files; exit 1 if anything regressed past the threshold"""
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = scenarios_by_name(json.load(f))
+    with open(args.candidate, 'r', encoding='utf-8') as f:
+        candidate = scenarios_by_name(json.load(f))
+
+    def metrics_of(scenario):
+        values = {
+            'jobs_per_hour': scenario.get('jobs_per_hour'),
+            'wall_seconds': scenario.get('wall_seconds'),
+            'peak_rss_mb': scenario.get('peak_rss_mb'),
+            'peak_disk_mb': scenario.get('peak_disk_mb')
+        }
+        for key in ('mean', 'p95'):
+            values[f"job.{key}"] = (scenario.get('job_seconds') or {}).get(key)
+        for stage, summary in (scenario.get('stages') or {}).items():
+            for key in ('mean', 'p95'):
+                values[f"{stage}.{key}"] = (summary or {}).get(key)
+        return values
+
+    regressions = 0
+    for name in sorted(set(baseline) & set(candidate)):
+        print(name)
+        old, new = metrics_of(baseline[name]), metrics_of(candidate[name])
+        for metric in sorted(set(old) & set(new)):
+            before, after = old[metric], new[metric]
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = change < 0 if metric == 'jobs_per_hour' else (
+                change > 0 and metric.rsplit('.', 1)[-1] in LOWER_IS_BETTER)
+            # Sub-10ms stages are noise at this resolution
+            significant = abs(after - before) >= args.min_delta or metric.endswith(('_mb', 'jobs_per_hour'))
+            flag = ''
+            if worse and abs(change) > args.threshold and significant:
+                flag = '  REGRESSION'
+                regressions += 1
+            print(f"  {metric:32} {before:>10} -> {after:<10} {change:+.1%}{flag}")
+    for name in sorted(set(baseline) ^ set(candidate)):
+        print(f"{name}: only in {'baseline' if name in baseline else 'candidate'}")
+    print(f"{regressions} regression(s) over {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Run the benchmark and write JSON results')
+    run.add_argument('--stub', action='store_true', help='Use a fake model instead of Whisper')
+    run.add_argument('--stub-rtf', type=float, default=0.02, help='Stub model seconds per second of audio')
+    run.add_argument('--model', help='Whisper model to request (default: the server default)')
+    run.add_argument('--durations', default='30,120', help='Comma-separated video lengths in seconds')
+    run.add_argument('--resolutions', default='640x360,1280x720', help='Comma-separated WxH sizes')
+    run.add_argument('--concurrency', type=int, default=2, help='Uploads in flight at once')
+    run.add_argument('--workers', type=int, help='Override CAPVID_WORKERS')
+    run.add_argument('--modes', default='direct,http', help='direct (process_video_task) and/or http')
+    run.add_argument('--job-timeout', type=float, default=1800, help='Seconds before an http job counts as failed')
+    run.add_argument('--output-mode', default='fast', help='soft, fast or quality')
+    run.add_argument('--backends', help='Comma-separated inference backends to compare, e.g. whisper,int8')
+    run.add_argument('--inference-threads', type=int, help='torch threads for the backend comparison')
+    run.add_argument('--speech', help='Recording to transcribe for the backend comparison (default: a synthesized clip)')
+    run.add_argument('-o', '--output', default='benchmark_results.json')
+    run.add_argument('-v', '--verbose', action='store_true', help='Keep pipeline output on stdout')
+    run.set_defaults(func=run_benchmark)
+
+    compare = commands.add_parser('compare', help='Compare two result files')
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=0.10, help='Relative change counted as a regression')
+    compare.add_argument('--min-delta', type=float, default=0.01, help='Ignore absolute changes smaller than this')
+    compare.set_defaults(func=compare_runs)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == '__main__':
+    main()
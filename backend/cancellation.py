@@ -0,0 +1,99 @@
+import subprocess
+import threading
+
+# Only the end of a child's stderr is kept; it holds the error, and long encodes log a lot
+STDERR_TAIL_BYTES = 16 * 1024
+
+
+class JobCancelled(Exception):
+    """Raised at a cancellation checkpoint once a job's token has been cancelled"""
+
+
+class CancelToken:
+    """Cancellation flag for one job, checked between stages and chunks
+
+    Blocking work that cannot poll the flag (an ffmpeg child, a worker process)
+    registers a callback that stops it as soon as cancel() is called.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason='Cancelled'):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+    def on_cancel(self, callback):
+        """Call callback on cancel (immediately if already cancelled); returns a function that unregisters it"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def _drain_tail(stream, tail):
+    for chunk in iter(lambda: stream.read(4096), b''):
+        tail += chunk
+        del tail[:-STDERR_TAIL_BYTES]
+
+
+def run_process(command, cancel_token=None, on_output_line=None):
+    """Run a child process to completion; returns (returncode, tail of stderr)
+
+    stdout is passed line by line to on_output_line as it is written, if given.
+    The child is terminated if the token is cancelled while it runs, and
+    JobCancelled is raised instead of returning.
+    """
+    if cancel_token:
+        cancel_token.check()
+    process = subprocess.Popen(
+        command, stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if on_output_line else subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    unregister = cancel_token.on_cancel(process.terminate) if cancel_token else None
+    tail = bytearray()
+    drainer = threading.Thread(target=_drain_tail, args=(process.stderr, tail), daemon=True)
+    drainer.start()
+    try:
+        if on_output_line:
+            for line in process.stdout:
+                on_output_line(line.decode(errors='replace'))
+        process.wait()
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        if unregister:
+            unregister()
+        drainer.join()
+        for stream in (process.stdout, process.stderr):
+            if stream:
+                stream.close()
+    if cancel_token:
+        cancel_token.check()
+    return process.returncode, tail.decode(errors='replace')
@@ -0,0 +1,258 @@
+import json
+from collections import namedtuple
+
+# Broadcast-style limits: two lines of at most 42 characters, on screen for at most 6 seconds
+MAX_CHARS_PER_LINE = 42
+MAX_LINES = 2
+MAX_CUE_SECONDS = 6.0
+# A pause this long between words always starts a new cue
+PAUSE_SECONDS = 0.8
+# Cues are formatted and written in batches of this many, one write call per format
+WRITE_BATCH = 500
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+CAPTION_FORMATS = ('srt', 'vtt', 'ass', 'json')
+CAPTION_MIMETYPES = {
+    'srt': 'application/x-subrip',
+    'vtt': 'text/vtt',
+    'ass': 'text/x-ssa',
+    'json': 'application/json'
+}
+
+Cue = namedtuple('Cue', ['start', 'end', 'lines', 'words'])
+Word = namedtuple('Word', ['text', 'start', 'end', 'probability'])
+
+
+class CaptionLimits(namedtuple('CaptionLimits', ['max_chars', 'max_lines', 'max_duration'])):
+    __slots__ = ()
+
+    def __new__(cls, max_chars=MAX_CHARS_PER_LINE, max_lines=MAX_LINES, max_duration=MAX_CUE_SECONDS):
+        return super().__new__(cls, max_chars, max_lines, max_duration)
+
+
+def segment_words(segment):
+    """Words of a segment with their timings; spread over the segment by length if Whisper gave none"""
+    words = [
+        Word(w['word'].strip(), w['start'], w['end'], w.get('probability'))
+        for w in segment.get('words') or [] if w['word'].strip()
+    ]
+    if words:
+        return words
+    tokens = segment['text'].split()
+    total = sum(len(token) for token in tokens) or 1
+    span = segment['end'] - segment['start']
+    position = segment['start']
+    for token in tokens:
+        length = span * len(token) / total
+        words.append(Word(token, position, position + length, None))
+        position += length
+    return words
+
+
+def pack_cues(segments, limits=None):
+    """Pack words into cues of at most max_lines lines of max_chars, each at most max_duration long
+
+    Words fill a line greedily; a word that overflows the last line, a cue that would
+    run past max_duration, or a long pause starts the next cue. Cues never span
+    Whisper segments, which already end at sentence boundaries.
+    """
+    limits = limits or CaptionLimits()
+    for segment in segments:
+        lines = []
+        line = []
+        line_length = 0
+        cue_words = []
+        for word in segment_words(segment):
+            if cue_words:
+                too_long = word.end - cue_words[0].start > limits.max_duration
+                paused = word.start - cue_words[-1].end >= PAUSE_SECONDS
+                if line_length + 1 + len(word.text) > limits.max_chars:
+                    lines.append(' '.join(line))
+                    line, line_length = [], 0
+                    if len(lines) >= limits.max_lines or too_long or paused:
+                        yield Cue(cue_words[0].start, cue_words[-1].end, lines, cue_words)
+                        lines, cue_words = [], []
+                elif too_long or paused:
+                    lines.append(' '.join(line))
+                    yield Cue(cue_words[0].start, cue_words[-1].end, lines, cue_words)
+                    lines, line, line_length, cue_words = [], [], 0, []
+            line.append(word.text)
+            line_length += len(word.text) + (1 if line_length else 0)
+            cue_words.append(word)
+        if cue_words:
+            lines.append(' '.join(line))
+            yield Cue(cue_words[0].start, cue_words[-1].end, lines, cue_words)
+
+
+def _clock(seconds, divisor):
+    """(hours, minutes, seconds, fraction) with the fraction in 1/divisor units, rounded once"""
+    units = int(round(max(seconds, 0) * divisor))
+    whole, fraction = divmod(units, divisor)
+    minutes, secs = divmod(whole, 60)
+    hours, minutes = divmod(minutes, 60)
+    return hours, minutes, secs, fraction
+
+
+class SrtFormat:
+    def header(self):
+        return ''
+
+    def cue(self, index, cue):
+        start = '%02d:%02d:%02d,%03d' % _clock(cue.start, 1000)
+        end = '%02d:%02d:%02d,%03d' % _clock(cue.end, 1000)
+        return (str(index), '\n', start, ' --> ', end, '\n', '\n'.join(cue.lines), '\n\n')
+
+    def footer(self, language):
+        return ''
+
+
+class VttFormat:
+    def header(self):
+        return 'WEBVTT\n\n'
+
+    def cue(self, index, cue):
+        start = '%02d:%02d:%02d.%03d' % _clock(cue.start, 1000)
+        end = '%02d:%02d:%02d.%03d' % _clock(cue.end, 1000)
+        text = '\n'.join(cue.lines).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        return (start, ' --> ', end, '\n', text, '\n\n')
+
+    def footer(self, language):
+        return ''
+
+
+class AssFormat:
+    """Advanced SubStation Alpha with one Default style matching the burn-in style"""
+
+    HEADER = (
+        '[Script Info]\n'
+        'ScriptType: v4.00+\n'
+        'PlayResX: 384\n'
+        'PlayResY: 288\n'
+        'WrapStyle: 2\n'
+        'ScaledBorderAndShadow: yes\n'
+        '\n'
+        '[V4+ Styles]\n'
+        'Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, '
+        'Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, '
+        'Alignment, MarginL, MarginR, MarginV, Encoding\n'
+        'Style: Default,Arial,16,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,'
+        '0,0,0,0,100,100,0,0,1,1,1,2,10,10,10,1\n'
+        '\n'
+        '[Events]\n'
+        'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n'
+    )
+
+    def header(self):
+        return self.HEADER
+
+    def cue(self, index, cue):
+        start = '%d:%02d:%02d.%02d' % _clock(cue.start, 100)
+        end = '%d:%02d:%02d.%02d' % _clock(cue.end, 100)
+        # Braces would open an override block, so they are shown as parentheses
+        text = '\\N'.join(cue.lines).replace('{', '(').replace('}', ')')
+        return ('Dialogue: 0,', start, ',', end, ',Default,,0,0,0,,', text, '\n')
+
+    def footer(self, language):
+        return ''
+
+
+class JsonFormat:
+    """Word timeline grouped by cue: {"cues": [{start, end, lines, words: [...]}], "language": ...}"""
+
+    def header(self):
+        return '{"cues": ['
+
+    def cue(self, index, cue):
+        data = json.dumps({
+            'start': round(cue.start, 3),
+            'end': round(cue.end, 3),
+            'lines': cue.lines,
+            'words': [
+                {'word': w.text, 'start': round(w.start, 3), 'end': round(w.end, 3), 'probability': w.probability}
+                for w in cue.words
+            ]
+        }, ensure_ascii=False, default=float)
+        return (data,) if index == 1 else (',\n', data)
+
+    def footer(self, language):
+        return '], "language": ' + json.dumps(language) + '}\n'
+
+
+FORMATTERS = {
+    'srt': SrtFormat,
+    'vtt': VttFormat,
+    'ass': AssFormat,
+    'json': JsonFormat
+}
+
+
+class CaptionWriter:
+    """Write packed cues to one file per format in a single pass over the segments
+
+    Segments may arrive in several batches (streamed transcription); pass flush=True
+    to make each batch visible to readers as soon as it is written.
+    """
+
+    def __init__(self, paths, limits=None, flush=False):
+        self.limits = limits or CaptionLimits()
+        self.flush = flush
+        self.count = 0
+        self.outputs = []
+        for fmt, path in paths.items():
+            formatter = FORMATTERS[fmt]()
+            f = open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_BYTES)
+            f.write(formatter.header())
+            self.outputs.append((formatter, f))
+
+    def write_segments(self, segments):
+        pending = []
+        for cue in pack_cues(segments, self.limits):
+            pending.append(cue)
+            if len(pending) >= WRITE_BATCH:
+                self._write(pending)
+                pending = []
+        if pending:
+            self._write(pending)
+        if self.flush:
+            for _, f in self.outputs:
+                f.flush()
+
+    def _write(self, cues):
+        first = self.count + 1
+        self.count += len(cues)
+        for formatter, f in self.outputs:
+            pieces = []
+            for index, cue in enumerate(cues, start=first):
+                pieces.extend(formatter.cue(index, cue))
+            f.write(''.join(pieces))
+
+    def close(self, language=None):
+        for formatter, f in self.outputs:
+            f.write(formatter.footer(language))
+            f.close()
+
+
+def export_captions(segments, paths, language=None, limits=None):
+    """Write every format in paths ({format: path}) from one pass; returns the cue count"""
+    writer = CaptionWriter(paths, limits)
+    try:
+        writer.write_segments(segments)
+    finally:
+        writer.close(language)
+    return writer.count
+
+
+def render_captions(segments, fmt, language=None, limits=None):
+    """Yield one caption format in chunks of WRITE_BATCH cues, for streaming responses"""
+    formatter = FORMATTERS[fmt]()
+    yield formatter.header()
+    pieces = []
+    index = 0
+    for index, cue in enumerate(pack_cues(segments, limits), start=1):
+        pieces.extend(formatter.cue(index, cue))
+        if index % WRITE_BATCH == 0:
+            yield ''.join(pieces)
+            pieces = []
+    if pieces:
+        yield ''.join(pieces)
+    yield formatter.footer(language)
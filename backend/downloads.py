@@ -0,0 +1,98 @@
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import mimetypes
+from flask import Response, send_from_directory
+
+# Signed links stay valid this long; the files themselves are kept for two hours after upload
+DOWNLOAD_URL_TTL = int(os.environ.get('CAPVID_DOWNLOAD_URL_TTL', 3600))
+# '' serves files from Flask (sendfile through wsgi.file_wrapper under gunicorn),
+# 'x-sendfile' hands them to Apache/lighttpd, 'x-accel' to an nginx internal location
+DOWNLOAD_OFFLOAD = os.environ.get('CAPVID_DOWNLOAD_OFFLOAD', '').lower()
+ACCEL_PREFIX = os.environ.get('CAPVID_ACCEL_PREFIX', '/protected/')
+
+# Status fields that hold download links
+URL_FIELDS = ('download_url', 'preview_url', 'srt_url', 'vtt_url', 'ass_url', 'json_url', 'captions_url', 'profile_url')
+
+
+def load_secret(base_dir):
+    """CAPVID_DOWNLOAD_SECRET, or a random key shared through base_dir by every worker on the host"""
+    secret = os.environ.get('CAPVID_DOWNLOAD_SECRET')
+    if secret:
+        return secret.encode()
+    path = os.path.join(base_dir, 'download_secret')
+    if not os.path.exists(path):
+        temp_path = f"{path}.{os.getpid()}"
+        with open(temp_path, 'wb') as f:
+            f.write(secrets.token_bytes(32))
+        try:
+            # link() fails if another worker got there first, so all of them end up with one key
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class UrlSigner:
+    """HMAC-signed, expiring download links
+
+    Expiry times are rounded up to a quarter of the TTL, so every status poll in
+    that window hands out the same URL and a CDN in front can cache the file once.
+    """
+
+    def __init__(self, secret, ttl=DOWNLOAD_URL_TTL):
+        self.secret = secret
+        self.ttl = ttl
+        self.granularity = max(1, ttl // 4)
+
+    def _signature(self, path, expires):
+        digest = hmac.new(self.secret, f"{path}:{expires}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest[:18]).decode()
+
+    def sign(self, path, now=None):
+        now = time.time() if now is None else now
+        expires = -(-int(now + self.ttl) // self.granularity) * self.granularity
+        return f"{path}?expires={expires}&signature={self._signature(path, expires)}"
+
+    def verify(self, path, expires, signature):
+        """Seconds the link has left, or None if it is forged or expired"""
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return None
+        remaining = expires - int(time.time())
+        if remaining <= 0 or not hmac.compare_digest(self._signature(path, expires), signature or ''):
+            return None
+        return remaining
+
+    def sign_fields(self, info):
+        """Copy of a status dict with its download links signed"""
+        signed = dict(info)
+        for field in URL_FIELDS:
+            if signed.get(field):
+                signed[field] = self.sign(signed[field])
+        return signed
+
+
+def send_processed_file(directory, filename, download_name, max_age):
+    """Send a finished file with Range, ETag and conditional request support
+
+    The response may be cached for max_age seconds, the life left in its signed link.
+    """
+    if DOWNLOAD_OFFLOAD == 'x-accel':
+        # nginx serves the internal location itself, ranges and validators included
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = f"{ACCEL_PREFIX.rstrip('/')}/{filename}"
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response
+    # USE_X_SENDFILE (set from DOWNLOAD_OFFLOAD) makes Flask send only the header here
+    return send_from_directory(directory, filename, as_attachment=True, download_name=download_name,
+                               conditional=True, etag=True, max_age=max_age)
@@ -1,22 +1,124 @@
 import os
-import subprocess
+from metrics import FFMPEG_EXITS
+from cancellation import JobCancelled, run_process
+from captions import export_captions
 
 def generate_srt(segments, srt_path):
-    with open(srt_path, "w", encoding="utf-8") as srt_file:
-        for i, segment in enumerate(segments, start=1):
-            start = format_time(segment['start'])
-            end = format_time(segment['end'])
-            text = segment['text'].strip()
-            srt_file.write(f"{i}\n{start} --> {end}\n{text}\n\n")
-
-def format_time(seconds):
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((seconds - int(seconds)) * 1000)
-    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
-
-def overlay_subtitles(input_path, srt_path, output_path):
+    """Write packed SRT cues; see captions.py for the other formats"""
+    export_captions(segments, {'srt': srt_path})
+
+# Output modes: soft muxes a subtitle track without re-encoding, fast/quality burn captions in
+OUTPUT_MODES = ['soft', 'fast', 'quality']
+BURN_IN_PRESETS = {
+    'fast': {'preset': 'veryfast', 'crf': '26'},
+    'quality': {'preset': 'medium', 'crf': '23'},
+    # Quick low-res render to check captions before the full-quality one
+    'preview': {
+        'preset': 'ultrafast',
+        'crf': '30',
+        'height': int(os.environ.get('CAPVID_PREVIEW_HEIGHT', 360)),
+        'seconds': int(os.environ.get('CAPVID_PREVIEW_SECONDS', 0)) or None
+    }
+}
+ALLOWED_PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium']
+# Subtitle codec each container can carry as a soft track
+SOFT_SUBTITLE_CODECS = {
+    '.mp4': 'mov_text',
+    '.m4v': 'mov_text',
+    '.mov': 'mov_text',
+    '.mkv': 'srt',
+    '.webm': 'webvtt'
+}
+SUBTITLE_STYLE = 'FontSize=16,PrimaryColour=&H00ffffff,BorderStyle=1,Outline=1,Shadow=1'
+# Machine-readable progress on stdout instead of the human stats line on stderr
+PROGRESS_ARGS = ['-progress', 'pipe:1', '-nostats']
+
+class FfmpegProgress:
+    """Parse ffmpeg -progress output; on_update gets percent, fps, speed and ETA after each block
+
+    percent and the ETA need the input duration and are None without it.
+    """
+
+    def __init__(self, duration, on_update):
+        self.duration = duration
+        self.on_update = on_update
+        self.values = {}
+
+    def feed(self, line):
+        key, _, value = line.strip().partition('=')
+        if key != 'progress':
+            self.values[key] = value
+            return
+        self.on_update(self.snapshot(finished=value == 'end'))
+
+    def _number(self, key, suffix=''):
+        try:
+            return float(self.values.get(key, '').rstrip(suffix))
+        except ValueError:
+            return None
+
+    def snapshot(self, finished=False):
+        out_time = (self._number('out_time_us') or 0) / 1000000
+        speed = self._number('speed', 'x')
+        percent = eta = None
+        if self.duration:
+            percent = 100.0 if finished else min(99.9, out_time / self.duration * 100)
+            if speed:
+                eta = 0 if finished else max(0, (self.duration - out_time) / speed)
+        return {
+            'percent': round(percent, 1) if percent is not None else None,
+            'fps': self._number('fps'),
+            'speed': speed,
+            'eta_seconds': round(eta) if eta is not None else None
+        }
+
+def build_soft_subtitle_command(input_path, srt_path, output_path, subtitle_codec):
+    return [
+        'ffmpeg',
+        '-y',
+        *PROGRESS_ARGS,
+        '-i', input_path,
+        '-i', srt_path,
+        '-map', '0:v?',
+        '-map', '0:a?',
+        '-map', '1:0',
+        '-c', 'copy',
+        '-c:s', subtitle_codec,
+        output_path
+    ]
+
+def build_burn_in_command(input_path, srt_path, output_path, preset, crf, threads=None, height=None, seconds=None):
+    # Escape paths properly for Windows
+    srt_path_escaped = srt_path.replace("\\", "\\\\").replace(":", "\\:")
+    video_filter = f"subtitles='{srt_path_escaped}':force_style='{SUBTITLE_STYLE}'"
+    if height:
+        # Scale first so the captions are rendered at the output size
+        video_filter = f"scale=-2:'min({height},ih)'," + video_filter
+    command = [
+        'ffmpeg',
+        '-y',
+        *PROGRESS_ARGS,
+        '-i', input_path,
+        '-vf', video_filter,
+        '-c:a', 'copy',
+        '-c:v', 'libx264',
+        '-preset', preset,
+        '-crf', crf
+    ]
+    if threads:
+        command += ['-threads', str(threads)]
+    if seconds:
+        command += ['-t', str(seconds)]
+    command.append(output_path)
+    return command
+
+def overlay_subtitles(input_path, srt_path, output_path, mode='quality', preset=None, threads=None, cancel_token=None,
+                      duration=None, on_progress=None):
+    """Add subtitles to the video; returns the output mode that actually ran
+
+    Cancelling cancel_token terminates ffmpeg and raises JobCancelled. on_progress
+    receives FfmpegProgress snapshots while ffmpeg runs.
+    """
     try:
         # Use absolute paths for Windows compatibility
         input_path = os.path.abspath(input_path)
@@ -27,31 +129,44 @@ def overlay_subtitles(input_path, srt_path, output_path):
         print(f"SRT path: {srt_path}")
         print(f"Output path: {output_path}")
 
-        # Escape paths properly for Windows
-        srt_path_escaped = srt_path.replace("\\", "\\\\").replace(":", "\\:")
-        
-        command = [
-            'ffmpeg',
-            '-y',
-            '-i', input_path,
-            '-vf', f"subtitles='{srt_path_escaped}':force_style='FontSize=16,PrimaryColour=&H00ffffff,BorderStyle=1,Outline=1,Shadow=1'",
-            '-c:a', 'copy',
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '23',
-            output_path
-        ]
+        if mode not in OUTPUT_MODES and mode not in BURN_IN_PRESETS:
+            raise ValueError(f"Unknown output mode: {mode}")
+
+        subtitle_codec = SOFT_SUBTITLE_CODECS.get(os.path.splitext(output_path)[1].lower())
+        if mode == 'soft' and subtitle_codec is None:
+            # Containers like AVI cannot carry a text track, so burn in quickly instead
+            print("Container does not support soft subtitles, falling back to fast burn-in")
+            mode = 'fast'
+
+        if mode == 'soft':
+            command = build_soft_subtitle_command(input_path, srt_path, output_path, subtitle_codec)
+        else:
+            settings = BURN_IN_PRESETS[mode]
+            command = build_burn_in_command(
+                input_path, srt_path, output_path,
+                preset if preset in ALLOWED_PRESETS else settings['preset'],
+                settings['crf'],
+                threads,
+                settings.get('height'),
+                settings.get('seconds')
+            )
         
         print("Running ffmpeg command:", ' '.join(command))
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        print("FFmpeg completed successfully")
-        return True
+        progress = FfmpegProgress(duration, on_progress) if on_progress else None
+        returncode, stderr = run_process(command, cancel_token, progress.feed if progress else None)
+        FFMPEG_EXITS.inc(step=mode, code=returncode)
         
-    except subprocess.CalledProcessError as e:
-        error_msg = f"FFmpeg failed: {e.stderr}"
-        print(error_msg)
-        raise Exception(error_msg)
+    except JobCancelled:
+        print("FFmpeg terminated: job cancelled")
+        raise
     except Exception as e:
         error_msg = f"Failed to embed subtitles: {str(e)}"
         print(error_msg)
         raise Exception(error_msg)
+    
+    if returncode != 0:
+        error_msg = f"FFmpeg failed: {stderr}"
+        print(error_msg)
+        raise Exception(error_msg)
+    print("FFmpeg completed successfully")
+    return mode
@@ -0,0 +1,75 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 'whisper' is the reference fp32 PyTorch path; 'int8' quantizes its Linear layers for CPU
+INFERENCE_BACKEND = os.environ.get('CAPVID_INFERENCE_BACKEND', 'whisper').lower()
+# Threads torch uses for inference in this process; 0 keeps the torch default (one per core)
+INFERENCE_THREADS = int(os.environ.get('CAPVID_INFERENCE_THREADS', 0))
+
+
+class WhisperBackend:
+    """Reference backend: the stock Whisper model in fp32
+
+    A backend only decides how a model is loaded; the object it returns must behave
+    like a Whisper model (transcribe, detect_language, dims, device), so the rest
+    of the pipeline does not care which backend produced it.
+    """
+
+    name = 'whisper'
+
+    def __init__(self, num_threads=None):
+        self.num_threads = INFERENCE_THREADS if num_threads is None else num_threads
+
+    def configure_threads(self):
+        if not self.num_threads:
+            return
+        import torch
+        torch.set_num_threads(self.num_threads)
+
+    def load(self, model_name):
+        import whisper
+        self.configure_threads()
+        return whisper.load_model(model_name)
+
+
+class Int8Backend(WhisperBackend):
+    """Whisper with int8 dynamic quantization of its Linear layers, for CPU inference
+
+    Weights of the attention and MLP projections, most of the model, are stored as
+    int8 and activations are quantized on the fly, which cuts their memory to a
+    quarter and speeds up CPU matmuls. Convolutions, embeddings and layer norms stay
+    in fp32. Expect a small accuracy loss; benchmark.py --backends measures it.
+    """
+
+    name = 'int8'
+
+    def load(self, model_name):
+        import torch
+        import whisper
+        self.configure_threads()
+        model = whisper.load_model(model_name, device='cpu')
+        for module in model.modules():
+            # Whisper's Linear subclass only adds dtype casting; quantize_dynamic
+            # matches exact types, so hand it plain nn.Linear modules
+            if isinstance(module, torch.nn.Linear):
+                module.__class__ = torch.nn.Linear
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.eval()
+        return model
+
+
+BACKENDS = {
+    'whisper': WhisperBackend,
+    'int8': Int8Backend
+}
+
+
+def create_backend(name=None, num_threads=None):
+    """Backend named by name or CAPVID_INFERENCE_BACKEND, falling back to the reference one"""
+    name = (name or INFERENCE_BACKEND).lower()
+    if name not in BACKENDS:
+        logger.error(f"Unknown inference backend {name}, using whisper. Choose one of: {', '.join(BACKENDS)}")
+        name = 'whisper'
+    return BACKENDS[name](num_threads)
@@ -0,0 +1,541 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import logging
+import psutil
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ['completed', 'failed', 'completed_srt_only', 'cancelled']
+# Deferred full renders that are still owed to a completed job
+UNFINISHED_FINAL_STATUSES = ['queued', 'rendering']
+# Jobs owned by another host are only presumed dead after this long without an update
+STALE_JOB_SECONDS = 30 * 60
+
+
+def current_owner():
+    """Identify this process so interrupted jobs can be told apart from running ones"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def owner_is_alive(owner, updated_at):
+    """Best-effort liveness check for the process that last owned a job"""
+    if owner == current_owner():
+        # Only called at startup, so this is an earlier process that had our pid
+        return False
+    try:
+        host, pid = owner.rsplit(':', 1)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False
+    if host == socket.gethostname():
+        return psutil.pid_exists(pid)
+    return time.time() - updated_at < STALE_JOB_SECONDS
+
+
+def _matches(info, expect):
+    return all(info.get(field) in values for field, values in (expect or {}).items())
+
+
+class JobStore(ABC):
+    """Interface shared by the job store backends
+
+    A job has a public status dict (what /status returns), a creation time used for
+    cleanup ordering, an owner process, and a private payload holding what is needed
+    to re-run it after a restart.
+    """
+
+    @abstractmethod
+    def create(self, job_id, info, payload=None, created_at=None):
+        """Add a job owned by this process"""
+
+    @abstractmethod
+    def get(self, job_id):
+        """Return the job's status dict, or None if it does not exist"""
+
+    @abstractmethod
+    def get_payload(self, job_id):
+        """Return the job's private payload, or None"""
+
+    @abstractmethod
+    def set(self, job_id, info):
+        """Replace the status dict; returns False if the job no longer exists"""
+
+    @abstractmethod
+    def update(self, job_id, expect=None, **fields):
+        """Merge fields into the status dict; returns False if the job no longer exists
+
+        expect maps fields to the values they must currently have, e.g.
+        {'final_status': ('pending', 'failed')}; if any differs nothing is changed
+        and False is returned, so two requests cannot both make the same move.
+        """
+
+    @abstractmethod
+    def transition(self, job_id, from_statuses, info):
+        """Atomically replace the status dict only if the current status is in from_statuses"""
+
+    @abstractmethod
+    def delete(self, job_id):
+        """Remove the job with its segments and file ledger; returns False if it did not exist"""
+
+    @abstractmethod
+    def count(self):
+        """Number of jobs in the store"""
+
+    @abstractmethod
+    def list_jobs(self, statuses=None, created_before=None):
+        """Return (job_id, created_at, status) tuples, oldest first"""
+
+    @abstractmethod
+    def append_segments(self, job_id, segments):
+        """Add caption segments to the job's live transcript"""
+
+    @abstractmethod
+    def clear_segments(self, job_id):
+        """Empty the job's live transcript, e.g. before a recovered job is decoded again"""
+
+    # Control state lives beside the status dict so set() never overwrites it
+
+    @abstractmethod
+    def request_cancel(self, job_id, cancel=True):
+        """Flag a job for cancellation by whichever process runs it (cancel=False clears the flag)
+
+        Returns False if the job does not exist.
+        """
+
+    @abstractmethod
+    def touch(self, job_ids):
+        """Record that a client just checked on these jobs"""
+
+    @abstractmethod
+    def control_state(self, job_ids):
+        """Return {job_id: (cancel_requested, last_polled)} for the jobs that still exist
+
+        last_polled falls back to the creation time for jobs nobody has checked on yet.
+        """
+
+    @abstractmethod
+    def get_segments(self, job_id, offset=0):
+        """Segments from offset on, in the order they were appended"""
+
+    @abstractmethod
+    def take_over(self, job_id):
+        """Make this process the job's owner, e.g. before it runs work another process started"""
+
+    @abstractmethod
+    def claim_interrupted(self):
+        """Take over jobs whose owner process is gone; returns [(job_id, info, payload)]
+
+        That is every non-terminal job, plus completed jobs whose deferred render
+        (final_status) was queued or running when the owner died.
+        """
+
+    # Storage ledger: bytes on disk per job, so usage never needs a directory walk
+
+    @abstractmethod
+    def record_file(self, job_id, path, size):
+        """Add or resize a file in the job's ledger"""
+
+    @abstractmethod
+    def forget_file(self, path):
+        """Drop a file from the ledger"""
+
+    @abstractmethod
+    def job_files(self, job_id):
+        """Return [(path, size)] for every file recorded against the job"""
+
+    @abstractmethod
+    def all_files(self):
+        """Return [(path, job_id, size)] for reconciliation against the disk"""
+
+    @abstractmethod
+    def bytes_by_job(self):
+        """Return {job_id: bytes recorded against it}"""
+
+    @abstractmethod
+    def total_bytes(self):
+        """Bytes recorded across all jobs"""
+
+
+class MemoryJobStore(JobStore):
+    """Process-local store; jobs are lost on restart. Intended for tests and single-worker dev runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._segments = {}
+        self._files = {}  # path -> (job_id, size)
+
+    def create(self, job_id, info, payload=None, created_at=None):
+        with self._lock:
+            self._jobs[job_id] = {
+                'info': dict(info),
+                'payload': payload,
+                'created_at': created_at or time.time(),
+                'owner': current_owner(),
+                'cancel_requested': False,
+                'polled_at': None
+            }
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job['info']) if job else None
+
+    def get_payload(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job['payload'] if job else None
+
+    def set(self, job_id, info):
+        with self._lock:
+            if job_id not in self._jobs:
+                return False
+            self._jobs[job_id]['info'] = dict(info)
+            return True
+
+    def update(self, job_id, expect=None, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or not _matches(job['info'], expect):
+                return False
+            job['info'].update(fields)
+            return True
+
+    def transition(self, job_id, from_statuses, info):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job['info'].get('status') not in from_statuses:
+                return False
+            job['info'] = dict(info)
+            return True
+
+    def delete(self, job_id):
+        with self._lock:
+            self._segments.pop(job_id, None)
+            for path in [p for p, (owner, _) in self._files.items() if owner == job_id]:
+                del self._files[path]
+            return self._jobs.pop(job_id, None) is not None
+
+    def count(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def list_jobs(self, statuses=None, created_before=None):
+        with self._lock:
+            jobs = [
+                (job_id, job['created_at'], job['info'].get('status'))
+                for job_id, job in self._jobs.items()
+                if (statuses is None or job['info'].get('status') in statuses)
+                and (created_before is None or job['created_at'] < created_before)
+            ]
+        return sorted(jobs, key=lambda job: job[1])
+
+    def append_segments(self, job_id, segments):
+        with self._lock:
+            self._segments.setdefault(job_id, []).extend(segments)
+
+    def clear_segments(self, job_id):
+        with self._lock:
+            self._segments.pop(job_id, None)
+
+    def get_segments(self, job_id, offset=0):
+        with self._lock:
+            return list(self._segments.get(job_id, [])[offset:])
+
+    def request_cancel(self, job_id, cancel=True):
+        with self._lock:
+            if job_id not in self._jobs:
+                return False
+            self._jobs[job_id]['cancel_requested'] = cancel
+            return True
+
+    def touch(self, job_ids):
+        now = time.time()
+        with self._lock:
+            for job_id in job_ids:
+                if job_id in self._jobs:
+                    self._jobs[job_id]['polled_at'] = now
+
+    def control_state(self, job_ids):
+        with self._lock:
+            return {
+                job_id: (job['cancel_requested'], job['polled_at'] or job['created_at'])
+                for job_id, job in ((job_id, self._jobs.get(job_id)) for job_id in job_ids) if job
+            }
+
+    def take_over(self, job_id):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]['owner'] = current_owner()
+
+    def claim_interrupted(self):
+        # Nothing survives a restart, so there is never anything to recover
+        return []
+
+    def record_file(self, job_id, path, size):
+        with self._lock:
+            self._files[path] = (job_id, size)
+
+    def forget_file(self, path):
+        with self._lock:
+            self._files.pop(path, None)
+
+    def job_files(self, job_id):
+        with self._lock:
+            return [(path, size) for path, (owner, size) in self._files.items() if owner == job_id]
+
+    def all_files(self):
+        with self._lock:
+            return [(path, job_id, size) for path, (job_id, size) in self._files.items()]
+
+    def bytes_by_job(self):
+        totals = {}
+        with self._lock:
+            for job_id, size in self._files.values():
+                totals[job_id] = totals.get(job_id, 0) + size
+        return totals
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(size for _, size in self._files.values())
+
+
+class SqliteJobStore(JobStore):
+    """SQLite-backed store in WAL mode, shared by every web worker pointing at the same file"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                info TEXT NOT NULL,
+                payload TEXT,
+                owner TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+            CREATE TABLE IF NOT EXISTS segments (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_job ON files (job_id);
+        ''')
+        # Columns added after the first release; older databases gain them here
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+        if 'cancel_requested' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0')
+        if 'polled_at' not in columns:
+            conn.execute('ALTER TABLE jobs ADD COLUMN polled_at REAL')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit mode; multi-statement changes use explicit BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def create(self, job_id, info, payload=None, created_at=None):
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO jobs (job_id, status, info, payload, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (job_id, info.get('status'), json.dumps(info), json.dumps(payload), current_owner(), created_at or now, now)
+        )
+
+    def get(self, job_id):
+        row = self._conn().execute('SELECT info FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_payload(self, job_id):
+        row = self._conn().execute('SELECT payload FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def set(self, job_id, info):
+        cursor = self._conn().execute(
+            'UPDATE jobs SET status = ?, info = ?, updated_at = ? WHERE job_id = ?',
+            (info.get('status'), json.dumps(info), time.time(), job_id)
+        )
+        return cursor.rowcount > 0
+
+    def update(self, job_id, expect=None, **fields):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT info FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            info = json.loads(row[0]) if row else None
+            if info is None or not _matches(info, expect):
+                conn.execute('ROLLBACK')
+                return False
+            info.update(fields)
+            conn.execute(
+                'UPDATE jobs SET status = ?, info = ?, updated_at = ? WHERE job_id = ?',
+                (info.get('status'), json.dumps(info), time.time(), job_id)
+            )
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def transition(self, job_id, from_statuses, info):
+        placeholders = ', '.join('?' for _ in from_statuses)
+        cursor = self._conn().execute(
+            f'UPDATE jobs SET status = ?, info = ?, updated_at = ? WHERE job_id = ? AND status IN ({placeholders})',
+            (info.get('status'), json.dumps(info), time.time(), job_id, *from_statuses)
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, job_id):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM segments WHERE job_id = ?', (job_id,))
+            conn.execute('DELETE FROM files WHERE job_id = ?', (job_id,))
+            cursor = conn.execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+            conn.execute('COMMIT')
+            return cursor.rowcount > 0
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def count(self):
+        return self._conn().execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+    def list_jobs(self, statuses=None, created_before=None):
+        query = 'SELECT job_id, created_at, status FROM jobs'
+        clauses = []
+        params = []
+        if statuses is not None:
+            clauses.append(f"status IN ({', '.join('?' for _ in statuses)})")
+            params.extend(statuses)
+        if created_before is not None:
+            clauses.append('created_at < ?')
+            params.append(created_before)
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY created_at'
+        return [tuple(row) for row in self._conn().execute(query, params)]
+
+    def append_segments(self, job_id, segments):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            start = conn.execute('SELECT COUNT(*) FROM segments WHERE job_id = ?', (job_id,)).fetchone()[0]
+            conn.executemany(
+                'INSERT INTO segments (job_id, seq, data) VALUES (?, ?, ?)',
+                [(job_id, start + i, json.dumps(segment)) for i, segment in enumerate(segments)]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def clear_segments(self, job_id):
+        self._conn().execute('DELETE FROM segments WHERE job_id = ?', (job_id,))
+
+    def get_segments(self, job_id, offset=0):
+        rows = self._conn().execute(
+            'SELECT data FROM segments WHERE job_id = ? AND seq >= ? ORDER BY seq', (job_id, offset)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def request_cancel(self, job_id, cancel=True):
+        cursor = self._conn().execute('UPDATE jobs SET cancel_requested = ? WHERE job_id = ?', (int(cancel), job_id))
+        return cursor.rowcount > 0
+
+    def touch(self, job_ids):
+        now = time.time()
+        self._conn().executemany('UPDATE jobs SET polled_at = ? WHERE job_id = ?', [(now, job_id) for job_id in job_ids])
+
+    def control_state(self, job_ids):
+        job_ids = list(job_ids)
+        if not job_ids:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT job_id, cancel_requested, COALESCE(polled_at, created_at) FROM jobs "
+            f"WHERE job_id IN ({', '.join('?' for _ in job_ids)})",
+            job_ids
+        )
+        return {job_id: (bool(cancel_requested), last_polled) for job_id, cancel_requested, last_polled in rows}
+
+    def take_over(self, job_id):
+        self._conn().execute(
+            'UPDATE jobs SET owner = ?, updated_at = ? WHERE job_id = ?',
+            (current_owner(), time.time(), job_id)
+        )
+
+    def claim_interrupted(self):
+        conn = self._conn()
+        placeholders = ', '.join('?' for _ in TERMINAL_STATUSES)
+        rows = conn.execute(
+            f"SELECT job_id, info, payload, owner, updated_at FROM jobs "
+            f"WHERE status NOT IN ({placeholders}) OR status = 'completed' ORDER BY created_at",
+            TERMINAL_STATUSES
+        ).fetchall()
+
+        claimed = []
+        me = current_owner()
+        for job_id, info, payload, owner, updated_at in rows:
+            info = json.loads(info)
+            if info.get('status') == 'completed' and info.get('final_status') not in UNFINISHED_FINAL_STATUSES:
+                continue
+            if owner_is_alive(owner, updated_at):
+                continue
+            # Compare-and-set on the owner so two starting workers cannot both claim a job
+            cursor = conn.execute(
+                'UPDATE jobs SET owner = ?, updated_at = ? WHERE job_id = ? AND owner IS ?',
+                (me, time.time(), job_id, owner)
+            )
+            if cursor.rowcount:
+                claimed.append((job_id, info, json.loads(payload) if payload else None))
+        return claimed
+
+    def record_file(self, job_id, path, size):
+        self._conn().execute(
+            'INSERT INTO files (path, job_id, size) VALUES (?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET job_id = excluded.job_id, size = excluded.size',
+            (path, job_id, size)
+        )
+
+    def forget_file(self, path):
+        self._conn().execute('DELETE FROM files WHERE path = ?', (path,))
+
+    def job_files(self, job_id):
+        return [tuple(row) for row in self._conn().execute('SELECT path, size FROM files WHERE job_id = ?', (job_id,))]
+
+    def all_files(self):
+        return [tuple(row) for row in self._conn().execute('SELECT path, job_id, size FROM files')]
+
+    def bytes_by_job(self):
+        return dict(self._conn().execute('SELECT job_id, SUM(size) FROM files GROUP BY job_id').fetchall())
+
+    def total_bytes(self):
+        return self._conn().execute('SELECT COALESCE(SUM(size), 0) FROM files').fetchone()[0]
+
+
+def create_job_store(backend, db_path=None):
+    """Build the configured store: 'sqlite' (default) or 'memory'"""
+    if backend == 'memory':
+        return MemoryJobStore()
+    if backend == 'sqlite':
+        return SqliteJobStore(db_path)
+    raise ValueError(f"Unknown job store backend: {backend}")
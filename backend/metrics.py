@@ -0,0 +1,226 @@
+import time
+import threading
+import bisect
+from collections import deque
+from contextlib import contextmanager
+import psutil
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RECENT_SAMPLES = 500
+RSS_SAMPLE_SECONDS = 0.5
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join(f'{k}="{v}"' for k, v in pairs)
+    return f'{{{body}}}'
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Read at scrape time from func, which returns a number or a {((label, value), ...): value} mapping
+
+    metric_type='counter' exposes a running total kept elsewhere (e.g. cache hit counts).
+    """
+
+    def __init__(self, name, help_text, func, metric_type='gauge'):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+        self.metric_type = metric_type
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        value = self.func()
+        if isinstance(value, dict):
+            for labels, v in value.items():
+                lines.append(f"{self.name}{_format_labels(_label_key(dict(labels)))} {v}")
+        elif value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative buckets for Prometheus plus a window of recent values for quick percentiles"""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}  # label key -> [bucket counts, sum, count, recent values]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0, deque(maxlen=RECENT_SAMPLES)]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+            series[3].append(value)
+
+    def summary(self):
+        """count, mean, p50 and p95 per label set, the percentiles over recent observations"""
+        result = {}
+        with self._lock:
+            for key, (_, total, count, recent) in self._series.items():
+                ordered = sorted(recent)
+                label = ','.join(v for _, v in key) or 'all'
+                result[label] = {
+                    'count': count,
+                    'mean': round(total / count, 3),
+                    'p50': round(ordered[int(0.5 * (len(ordered) - 1))], 3),
+                    'p95': round(ordered[int(0.95 * (len(ordered) - 1))], 3)
+                }
+        return result
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count, _) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {round(total, 6)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text):
+        return self._add(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, func, metric_type='gauge'):
+        return self._add(Gauge(name, help_text, func, metric_type))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram('capvid_stage_seconds', 'Wall time of each job stage')
+JOB_SECONDS = REGISTRY.histogram('capvid_job_seconds', 'Wall time from job start to a terminal status')
+QUEUE_WAIT_SECONDS = REGISTRY.histogram('capvid_queue_wait_seconds', 'Time jobs spent waiting for a worker')
+JOB_PEAK_RSS = REGISTRY.histogram(
+    'capvid_job_peak_rss_bytes', 'Peak RSS of the server and its child processes during a job',
+    buckets=tuple(mb * 1024 * 1024 for mb in (256, 512, 1024, 2048, 4096, 8192, 16384))
+)
+JOBS_TOTAL = REGISTRY.counter('capvid_jobs_total', 'Jobs finished, by terminal status')
+FFMPEG_EXITS = REGISTRY.counter('capvid_ffmpeg_exits_total', 'ffmpeg runs by step and exit code')
+
+
+def process_tree_rss(process):
+    """RSS of a process plus its children (ffmpeg, transcription workers)"""
+    total = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+class JobMetrics:
+    """Per-job stage timings and peak RSS, sampled in a background thread while the job runs
+
+    RSS is process-wide, so with several jobs running side by side each job's peak
+    includes the others' memory.
+    """
+
+    def __init__(self, timings=None):
+        self.timings = dict(timings or {})
+        self.peak_rss = 0
+        self.started = time.perf_counter()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        self.timings[name] = round(self.timings.get(name, 0) + seconds, 3)
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+    def start_sampling(self):
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self):
+        process = psutil.Process()
+        while True:
+            try:
+                self.peak_rss = max(self.peak_rss, process_tree_rss(process))
+            except psutil.Error:
+                pass
+            if self._stop.wait(RSS_SAMPLE_SECONDS):
+                return
+
+    def finish(self, status):
+        """Stop sampling and record the job-level metrics; status None only stops sampling"""
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        if status is None:
+            return
+        total = time.perf_counter() - self.started
+        self.timings['total'] = round(total, 3)
+        JOB_SECONDS.observe(total)
+        JOBS_TOTAL.inc(status=status)
+        if self.peak_rss:
+            JOB_PEAK_RSS.observe(self.peak_rss)
+
+    def as_status(self):
+        return {
+            'timings': dict(self.timings),
+            'peak_rss_mb': round(self.peak_rss / 1024 / 1024, 1) if self.peak_rss else None
+        }
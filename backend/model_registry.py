@@ -0,0 +1,282 @@
+import os
+import gc
+import time
+import threading
+import logging
+from contextlib import contextmanager
+import psutil
+from inference import create_backend
+
+logger = logging.getLogger(__name__)
+
+# Approximate resident size of each fp32 Whisper checkpoint, used to plan loads
+MODEL_SIZE_ESTIMATES = {
+    'tiny': 150 * 1024 * 1024,
+    'base': 290 * 1024 * 1024,
+    'small': 970 * 1024 * 1024,
+    'medium': 3 * 1024 * 1024 * 1024,
+    'large': 6 * 1024 * 1024 * 1024
+}
+DEFAULT_ALLOWED_MODELS = 'tiny,base,small'
+FALLBACK_MODEL = 'tiny'
+
+
+def model_memory_bytes(model):
+    """Parameter and buffer bytes of a torch model, or None for anything else"""
+    try:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        for module in model.modules():
+            # Dynamically quantized layers keep their packed weights outside parameters()
+            weight = getattr(module, 'weight', None)
+            if callable(weight):
+                packed = weight()
+                total += packed.numel() * packed.element_size()
+        return total
+    except AttributeError:
+        return None
+
+
+class ModelEntry:
+    def __init__(self, name):
+        self.name = name
+        # Whisper installs KV-cache hooks on the model for each decode, so two threads
+        # must never run the same instance at once: a job borrows one from free
+        self.instances = []
+        self.free = []
+        self.loading = 0
+        self.load_seconds = None
+        self.memory_bytes = 0  # per instance
+        self.last_used = 0.0
+        self.in_use = 0
+        self.uses = 0
+        self.error = None
+
+
+class ModelRegistry:
+    """Keeps several Whisper models resident within a memory budget
+
+    Models are loaded on demand (or preloaded at startup), shared between jobs, and
+    unloaded least-recently-used first when a new load needs room or once they have
+    been idle for idle_seconds. Models that a job is using are never unloaded.
+
+    An instance runs one job at a time. While every loaded instance of a model is
+    busy, use() loads another, up to max_instances and as long as it fits the
+    budget; otherwise it waits for one to be handed back.
+    """
+
+    def __init__(self, loader=None, allowed=None, default_model=None, preload=None,
+                 memory_budget=None, idle_seconds=None, backend=None, max_instances=None):
+        self.backend = backend or create_backend()
+        self.loader = loader or self.backend.load
+        self.allowed = allowed or os.environ.get('CAPVID_ALLOWED_MODELS', DEFAULT_ALLOWED_MODELS).split(',')
+        self.default_model = default_model or os.environ.get('CAPVID_DEFAULT_MODEL', 'small')
+        if self.default_model not in self.allowed:
+            self.allowed.append(self.default_model)
+        preload = preload if preload is not None else os.environ.get('CAPVID_PRELOAD_MODELS', self.default_model)
+        self.preload_models = [name for name in preload.split(',') if name] if isinstance(preload, str) else list(preload)
+        total_memory = psutil.virtual_memory().total
+        self.memory_budget = memory_budget or int(os.environ.get('CAPVID_MODEL_MEMORY_BUDGET', total_memory * 0.5))
+        self.idle_seconds = idle_seconds or int(os.environ.get('CAPVID_MODEL_IDLE_SECONDS', 30 * 60))
+        self.max_instances = int(os.environ.get('CAPVID_MODEL_INSTANCES', 0)) or max_instances or 1
+        self._lock = threading.Lock()
+        # Signalled whenever an instance is handed back or a load ends
+        self._changed = threading.Condition(self._lock)
+        self._entries = {name: ModelEntry(name) for name in self.allowed}
+        self._preload_done = threading.Event()
+        self._janitor = None
+
+    def start(self):
+        """Preload the configured models and start the idle-unload thread, both in the background"""
+        if self._janitor is not None:
+            return
+        threading.Thread(target=self._preload, name='capvid-model-preload', daemon=True).start()
+        self._janitor = threading.Thread(target=self._janitor_loop, name='capvid-model-janitor', daemon=True)
+        self._janitor.start()
+
+    def _preload(self):
+        for name in self.preload_models:
+            try:
+                with self.use(name):
+                    pass
+            except Exception as e:
+                logger.error(f"Failed to preload model {name}: {e}")
+        self._preload_done.set()
+
+    def wait_preloaded(self, timeout=None):
+        """Block until the preload thread has tried every configured model; False on timeout"""
+        return self._preload_done.wait(timeout)
+
+    def is_ready(self):
+        """True once preloading finished and the default model is resident"""
+        if not self._preload_done.is_set():
+            return False
+        entry = self._entries.get(self.default_model)
+        return entry is not None and bool(entry.instances)
+
+    def resolve(self, name):
+        """Map a requested model name to an allowed one (None means the default)"""
+        if not name:
+            return self.default_model
+        return name if name in self._entries else None
+
+    @contextmanager
+    def use(self, name=None):
+        """Borrow a loaded instance for one job, waiting if none is free and no more fit; yields (model, actual_name)"""
+        name = self.resolve(name) or self.default_model
+        try:
+            entry, model = self._acquire(name)
+        except Exception as e:
+            if name == FALLBACK_MODEL:
+                raise
+            logger.error(f"Failed to load model {name}: {e}. Falling back to {FALLBACK_MODEL}")
+            entry, model = self._acquire(FALLBACK_MODEL)
+        try:
+            yield model, entry.name
+        finally:
+            with self._changed:
+                if model in entry.instances:
+                    entry.free.append(model)
+                entry.in_use -= 1
+                entry.last_used = time.time()
+                self._changed.notify_all()
+
+    def _acquire(self, name):
+        with self._changed:
+            entry = self._entries.setdefault(name, ModelEntry(name))
+            entry.in_use += 1
+            while True:
+                if entry.free:
+                    model = entry.free.pop()
+                    entry.uses += 1
+                    entry.last_used = time.time()
+                    return entry, model
+                if self._can_grow(entry):
+                    entry.loading += 1
+                    break
+                self._changed.wait()
+        try:
+            model = self._load(entry)
+        except Exception:
+            with self._changed:
+                entry.loading -= 1
+                entry.in_use -= 1
+                self._changed.notify_all()
+            raise
+        with self._changed:
+            entry.loading -= 1
+            entry.instances.append(model)
+            entry.uses += 1
+            entry.last_used = time.time()
+            self._changed.notify_all()
+        return entry, model
+
+    def _can_grow(self, entry):
+        """Whether a caller finding no free instance should load one; call with the lock held"""
+        if not entry.instances:
+            # Only one thread loads the first instance; the rest wait for it
+            return not entry.loading
+        if len(entry.instances) + entry.loading >= self.max_instances:
+            return False
+        evictable = sum(
+            e.memory_bytes * len(e.instances) for e in self._entries.values()
+            if e.instances and e.in_use == 0 and e is not entry
+        )
+        return self._resident_bytes() - evictable + entry.memory_bytes <= self.memory_budget
+
+    def _load(self, entry):
+        needed = entry.memory_bytes or MODEL_SIZE_ESTIMATES.get(entry.name.split('.')[0], 0)
+        self._make_room(needed, exclude=entry.name)
+
+        copy = len(entry.instances) + 1
+        logger.info(f"Loading Whisper model: {entry.name} ({self.backend.name} backend, instance {copy})")
+        rss_before = psutil.Process().memory_info().rss
+        started = time.time()
+        try:
+            model = self.loader(entry.name)
+        except Exception as e:
+            entry.error = str(e)
+            raise
+        entry.load_seconds = round(time.time() - started, 2)
+        measured = model_memory_bytes(model)
+        entry.memory_bytes = measured if measured else max(0, psutil.Process().memory_info().rss - rss_before)
+        entry.error = None
+        logger.info(f"Loaded Whisper model {entry.name} in {entry.load_seconds}s ({entry.memory_bytes / 1024 / 1024:.0f}MB)")
+        return model
+
+    def _resident_bytes(self):
+        return sum(e.memory_bytes * len(e.instances) for e in self._entries.values())
+
+    def _make_room(self, needed, exclude=None):
+        """Unload idle models, least recently used first, until needed bytes fit the budget"""
+        with self._lock:
+            idle = sorted(
+                (e for e in self._entries.values() if e.instances and e.in_use == 0 and e.name != exclude),
+                key=lambda e: e.last_used
+            )
+            victims = []
+            resident = self._resident_bytes()
+            for entry in idle:
+                if resident + needed <= self.memory_budget:
+                    break
+                victims.append(entry)
+                resident -= entry.memory_bytes * len(entry.instances)
+            if resident + needed > self.memory_budget:
+                logger.warning(f"Model memory budget exceeded: {(resident + needed) / 1024 / 1024:.0f}MB "
+                               f"of {self.memory_budget / 1024 / 1024:.0f}MB, models in use cannot be unloaded")
+        for entry in victims:
+            self._unload(entry)
+
+    def _unload(self, entry, keep=0):
+        """Drop an entry's free instances beyond keep, if no job is using it"""
+        with self._lock:
+            if entry.in_use or entry.loading or len(entry.instances) <= keep:
+                return
+            dropped = len(entry.instances) - keep
+            del entry.instances[keep:]
+            entry.free = list(entry.instances)
+        gc.collect()
+        if keep:
+            logger.info(f"Unloaded {dropped} idle instance(s) of Whisper model {entry.name}")
+        else:
+            logger.info(f"Unloaded Whisper model: {entry.name}")
+
+    def unload_idle(self):
+        """Unload models unused for idle_seconds, keeping one instance of the default model warm"""
+        cutoff = time.time() - self.idle_seconds
+        with self._lock:
+            idle = [
+                e for e in self._entries.values()
+                if e.instances and e.in_use == 0 and e.last_used < cutoff
+            ]
+        for entry in idle:
+            self._unload(entry, keep=1 if entry.name == self.default_model else 0)
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(60)
+            self.unload_idle()
+
+    def status(self):
+        with self._lock:
+            return {
+                'default_model': self.default_model,
+                'backend': self.backend.name,
+                'ready': self.is_ready(),
+                'memory_budget_mb': round(self.memory_budget / 1024 / 1024),
+                'resident_mb': round(self._resident_bytes() / 1024 / 1024),
+                'max_instances': self.max_instances,
+                'models': {
+                    e.name: {
+                        'loaded': bool(e.instances),
+                        'instances': len(e.instances),
+                        'load_seconds': e.load_seconds,
+                        'memory_mb': round(e.memory_bytes / 1024 / 1024),
+                        'in_use': e.in_use,
+                        'uses': e.uses,
+                        'idle_seconds': round(time.time() - e.last_used) if e.last_used else None,
+                        'error': e.error
+                    }
+                    for e in self._entries.values()
+                }
+            }
@@ -0,0 +1,214 @@
+import os
+import heapq
+import itertools
+import threading
+import time
+import logging
+from contextlib import contextmanager
+import psutil
+from metrics import QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Rough per-job working set: Whisper small + decoded audio + one libx264 encode
+JOB_MEMORY_ESTIMATE = 1.5 * 1024 * 1024 * 1024  # 1.5GB in bytes
+DEFAULT_MAX_QUEUE = 20
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+# Seconds of waiting worth one priority level, so queued work ages past newer urgent jobs
+DEFAULT_AGING_SECONDS = 60
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+    def __init__(self, queue_length, retry_after):
+        super().__init__(f"Job queue is full ({queue_length} jobs waiting)")
+        self.queue_length = queue_length
+        self.retry_after = retry_after
+
+
+class DuplicateJobError(Exception):
+    """Raised when a job id is submitted while it is still waiting in the queue"""
+
+    def __init__(self, job_id):
+        super().__init__(f"Job {job_id} is already queued")
+        self.job_id = job_id
+
+
+def default_worker_count():
+    """Size the worker pool from CPU cores and available memory"""
+    override = os.environ.get('CAPVID_WORKERS')
+    if override:
+        return max(1, int(override))
+
+    cores = os.cpu_count() or 1
+    memory = psutil.virtual_memory()
+    by_memory = int(memory.available // JOB_MEMORY_ESTIMATE)
+    # Whisper and libx264 are both multi-threaded, so half the cores is plenty
+    by_cpu = max(1, cores // 2)
+    return max(1, min(by_cpu, by_memory))
+
+
+class JobScheduler:
+    """Fixed-size worker pool fed by a priority queue (FIFO within a priority)
+
+    Priorities age: every aging_seconds a job waits counts as one priority level, so
+    a long upload queued behind a stream of short clips still gets its turn. Aging
+    is the same for every job, which makes the order fixed at submit time: a job
+    ranks by priority * aging_seconds + submit time.
+    """
+
+    def __init__(self, num_workers=None, max_queue=None, aging_seconds=None):
+        self.num_workers = num_workers or default_worker_count()
+        self.max_queue = max_queue or int(os.environ.get('CAPVID_MAX_QUEUE', DEFAULT_MAX_QUEUE))
+        self.aging_seconds = aging_seconds or int(os.environ.get('CAPVID_PRIORITY_AGING_SECONDS', DEFAULT_AGING_SECONDS))
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = {}
+        self._workers = []
+        self._encodes = 0
+        # Exponential moving average of job duration for ETA estimates
+        self._avg_duration = None
+
+    def start(self):
+        """Start worker threads if they are not running yet"""
+        with self._cond:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"capvid-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        logger.info(f"Started {self.num_workers} worker(s), max queue {self.max_queue}")
+
+    def submit(self, job_id, func, args=(), priority=PRIORITY_NORMAL, force=False):
+        """Queue a job; raises QueueFullError when the queue is at capacity
+
+        force skips the limit for work that was already accepted as a whole, such as
+        the members of a batch. DuplicateJobError is raised if job_id is already
+        queued, since the second entry would run the same work twice.
+        """
+        self.start()
+        with self._cond:
+            if job_id in self._entries:
+                raise DuplicateJobError(job_id)
+            if not force:
+                self._check_capacity()
+            submitted = time.time()
+            entry = [priority * self.aging_seconds + submitted, next(self._counter), job_id, func, args, submitted]
+            heapq.heappush(self._heap, entry)
+            self._entries[job_id] = entry
+            self._cond.notify()
+            return self._position(job_id)
+
+    def check_capacity(self):
+        """Raise QueueFullError if a new job would be turned away right now"""
+        with self._cond:
+            self._check_capacity()
+
+    def cancel(self, job_id):
+        """Drop a job that has not started yet; returns True if it was queued"""
+        with self._cond:
+            entry = self._entries.pop(job_id, None)
+            if entry is None:
+                return False
+            # Lazy deletion: mark the heap entry dead, skipped by the workers
+            entry[3] = None
+            return True
+
+    @contextmanager
+    def encode_slot(self):
+        """Register an ffmpeg encode for its duration; yields its share of the cores for -threads
+
+        The share is fixed when the encode starts, so encodes that began while
+        fewer were running keep their larger share until they finish.
+        """
+        with self._cond:
+            self._encodes += 1
+            threads = max(1, (os.cpu_count() or 1) // self._encodes)
+        try:
+            yield threads
+        finally:
+            with self._cond:
+                self._encodes -= 1
+
+    def queue_info(self, job_id):
+        """Return queue position and ETA for a waiting job, or None"""
+        with self._cond:
+            if job_id not in self._entries:
+                return None
+            position = self._position(job_id)
+            return {
+                'queue_position': position,
+                'queue_length': len(self._entries),
+                'eta_seconds': self._eta(position)
+            }
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.num_workers,
+                'running': len(self._running),
+                'encoding': self._encodes,
+                'queued': len(self._entries),
+                'max_queue': self.max_queue,
+                'avg_job_seconds': round(self._avg_duration, 1) if self._avg_duration else None
+            }
+
+    def _position(self, job_id):
+        entry = self._entries[job_id]
+        key = (entry[0], entry[1])
+        return 1 + sum(1 for e in self._entries.values() if (e[0], e[1]) < key)
+
+    def _eta(self, position):
+        if self._avg_duration is None:
+            return None
+        # Workers free up as their running jobs finish; the job at position takes the
+        # position-th free slot, after (position - 1) // num_workers full waves
+        now = time.time()
+        remaining = sorted(max(0.0, self._avg_duration - (now - started)) for started in self._running.values())
+        remaining += [0.0] * (self.num_workers - len(remaining))
+        waves, slot = divmod(position - 1, self.num_workers)
+        return round(remaining[slot] + waves * self._avg_duration + self._avg_duration, 1)
+
+    def _check_capacity(self):
+        if len(self._entries) >= self.max_queue:
+            raise QueueFullError(len(self._entries), self._retry_after())
+
+    def _retry_after(self):
+        if self._avg_duration is None:
+            return 60
+        return max(1, int(self._avg_duration * max(1, len(self._entries) // self.num_workers)))
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    while not self._heap:
+                        self._cond.wait()
+                    entry = heapq.heappop(self._heap)
+                    if entry[3] is not None:
+                        break
+                _, _, job_id, func, args, submitted = entry
+                self._entries.pop(job_id, None)
+                self._running[job_id] = time.time()
+
+            started = time.time()
+            QUEUE_WAIT_SECONDS.observe(started - submitted)
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Worker crashed while running job {job_id}: {e}")
+            finally:
+                duration = time.time() - started
+                with self._cond:
+                    self._running.pop(job_id, None)
+                    if self._avg_duration is None:
+                        self._avg_duration = duration
+                    else:
+                        self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+# The backend modules import each other by their flat names, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def capvid():
+    """The app module, started once on a throwaway data dir without preloading any model"""
+    os.environ.setdefault('CAPVID_JOB_STORE', 'memory')
+    os.environ['CAPVID_PRELOAD_MODELS'] = ''
+    os.environ.pop('CAPVID_DATA_DIR', None)
+    import app
+    app.create_app()
+    return app
+
+
+@pytest.fixture
+def client(capvid):
+    return capvid.app.test_client()
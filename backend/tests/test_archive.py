@@ -0,0 +1,91 @@
+import io
+import os
+import zipfile
+import pytest
+from archive import extract_archive, stream_zip
+from uploads import UploadTooLarge
+
+
+def make_zip(path, files, compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(path, 'w', compression) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_extract_skips_mac_metadata_dotfiles_and_folders(tmp_path):
+    archive_path = make_zip(tmp_path / 'upload.zip', {
+        'clips/a.mp4': b'aaaa',
+        'b.mov': b'bb',
+        '__MACOSX/clips/._a.mp4': b'resource fork',
+        'clips/.DS_Store': b'finder',
+        'clips/': b'',
+    })
+    extracted = extract_archive(archive_path, str(tmp_path), file_limit=100, budget=1000, max_files=10)
+    assert [name for name, _ in extracted] == ['a.mp4', 'b.mov']
+    a_sink = extracted[0][1]
+    with open(a_sink.path, 'rb') as f:
+        assert f.read() == b'aaaa'
+    assert a_sink.bytes_written == 4
+
+
+def test_extract_stops_a_zip_bomb_at_the_file_limit(tmp_path):
+    archive_path = make_zip(tmp_path / 'bomb.zip', {'ok.mp4': b'x', 'bomb.mp4': b'\0' * 100000},
+                            compression=zipfile.ZIP_DEFLATED)
+    assert os.path.getsize(archive_path) < 1000
+    with pytest.raises(UploadTooLarge):
+        extract_archive(archive_path, str(tmp_path), file_limit=1000, budget=10 ** 6, max_files=10)
+    # Nothing that was already unpacked is left behind
+    assert sorted(os.listdir(tmp_path)) == ['bomb.zip']
+
+
+def test_extract_enforces_the_storage_budget_and_file_count(tmp_path):
+    archive_path = make_zip(tmp_path / 'upload.zip', {'a.mp4': b'a' * 60, 'b.mp4': b'b' * 60})
+    with pytest.raises(UploadTooLarge) as error:
+        extract_archive(archive_path, str(tmp_path), file_limit=100, budget=100, max_files=10)
+    assert 'storage' in error.value.description
+    with pytest.raises(ValueError):
+        extract_archive(archive_path, str(tmp_path), file_limit=100, budget=1000, max_files=1)
+
+
+def test_extract_rejects_files_that_are_not_zips(tmp_path):
+    path = tmp_path / 'upload.zip'
+    path.write_bytes(b'not a zip')
+    with pytest.raises(ValueError):
+        extract_archive(str(path), str(tmp_path), file_limit=100, budget=1000, max_files=10)
+
+
+def test_stream_zip_deflates_captions_only(tmp_path):
+    (tmp_path / 'a.srt').write_bytes(b'1\n00:00:00,000 --> 00:00:01,000\nHello\n\n' * 200)
+    (tmp_path / 'a.mp4').write_bytes(os.urandom(5000))
+    chunks = list(stream_zip([
+        ('a.srt', str(tmp_path / 'a.srt')),
+        ('a.mp4', str(tmp_path / 'a.mp4')),
+        ('missing.vtt', str(tmp_path / 'missing.vtt')),
+    ], chunk_size=1024))
+    assert len(chunks) > 2
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+        assert archive.testzip() is None
+        info = {i.filename: i for i in archive.infolist()}
+        assert sorted(info) == ['a.mp4', 'a.srt']
+        assert info['a.srt'].compress_type == zipfile.ZIP_DEFLATED
+        assert info['a.mp4'].compress_type == zipfile.ZIP_STORED
+        assert archive.read('a.mp4') == (tmp_path / 'a.mp4').read_bytes()
+
+
+def test_batch_zip_link_is_signed(capvid, client):
+    capvid.job_store.create('batch-zip', {'status': capvid.BATCH_STATUS, 'job_ids': ['zip-job1', 'zip-job2']})
+    capvid.job_store.create('zip-job1', {'status': 'completed_srt_only', 'filename': 'talk.mp4'})
+    capvid.job_store.create('zip-job2', {'status': 'failed', 'filename': 'broken.mp4'})
+    with open(os.path.join(capvid.PROCESSED_FOLDER, 'zip-job1_captions.srt'), 'wb') as f:
+        f.write(b'1\n')
+
+    download_url = client.get('/batches/batch-zip').get_json()['download_url']
+    assert download_url.startswith('/batches/batch-zip/download?expires=')
+    assert client.get('/batches/batch-zip/download').status_code == 403
+    assert client.get(download_url.replace('batch-zip', 'batch-other', 1)).status_code == 403
+
+    response = client.get(download_url + '&include=captions')
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.namelist() == ['talk.srt']
@@ -0,0 +1,75 @@
+import sys
+import threading
+import time
+import pytest
+from cancellation import CancelToken, JobCancelled, run_process, STDERR_TAIL_BYTES
+
+
+def python(code):
+    return [sys.executable, '-c', code]
+
+
+def test_run_process_returns_the_exit_code_and_stderr():
+    returncode, stderr = run_process(python('import sys; sys.stderr.write("bad input"); sys.exit(3)'))
+    assert returncode == 3
+    assert stderr == 'bad input'
+
+
+def test_run_process_keeps_only_the_end_of_stderr():
+    code = 'import sys; sys.stderr.write("x" * 100000 + "the error")'
+    returncode, stderr = run_process(python(code))
+    assert returncode == 0
+    assert len(stderr) == STDERR_TAIL_BYTES
+    assert stderr.endswith('the error')
+
+
+def test_run_process_streams_stdout_lines():
+    lines = []
+    run_process(python('print("frame=1"); print("progress=end")'), on_output_line=lines.append)
+    assert [line.strip() for line in lines] == ['frame=1', 'progress=end']
+
+
+def test_cancel_terminates_the_child():
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+    started = time.time()
+    with pytest.raises(JobCancelled):
+        run_process(python('import time; time.sleep(30)'), cancel_token=token)
+    assert time.time() - started < 5
+
+
+def test_cancel_terminates_a_child_that_is_writing_output():
+    token = CancelToken()
+    lines = []
+
+    def on_line(line):
+        lines.append(line)
+        token.cancel('Stopped')
+    code = 'import sys, time\nwhile True:\n    print("tick", flush=True)\n    time.sleep(0.05)'
+    with pytest.raises(JobCancelled, match='Stopped'):
+        run_process(python(code), cancel_token=token, on_output_line=on_line)
+    assert lines
+
+
+def test_an_already_cancelled_token_starts_nothing(tmp_path):
+    token = CancelToken()
+    token.cancel()
+    marker = tmp_path / 'ran'
+    with pytest.raises(JobCancelled):
+        run_process(python(f'open({str(marker)!r}, "w")'), cancel_token=token)
+    assert not marker.exists()
+
+
+def test_on_cancel_runs_callbacks_once_and_can_unregister():
+    token = CancelToken()
+    calls = []
+    token.on_cancel(lambda: calls.append('kept'))
+    unregister = token.on_cancel(lambda: calls.append('removed'))
+    unregister()
+    token.cancel('first')
+    token.cancel('second')
+    assert calls == ['kept']
+    assert token.reason == 'first'
+    # Registering after the fact runs the callback right away
+    token.on_cancel(lambda: calls.append('late'))
+    assert calls == ['kept', 'late']
@@ -0,0 +1,53 @@
+from captions import CaptionLimits, pack_cues, segment_words
+
+
+def words(*timed):
+    return [{'word': f' {text}', 'start': start, 'end': end} for text, start, end in timed]
+
+
+def test_short_segment_is_one_cue():
+    segment = {'start': 0.0, 'end': 1.0, 'text': ' Hi there', 'words': words(('Hi', 0.0, 0.4), ('there', 0.5, 1.0))}
+    cues = list(pack_cues([segment]))
+    assert len(cues) == 1
+    assert cues[0].lines == ['Hi there']
+    assert (cues[0].start, cues[0].end) == (0.0, 1.0)
+
+
+def test_lines_respect_max_chars_and_max_lines():
+    timed = [(f'word{i}', i * 0.2, i * 0.2 + 0.15) for i in range(12)]
+    segment = {'start': 0.0, 'end': 2.4, 'text': '', 'words': words(*timed)}
+    cues = list(pack_cues([segment], CaptionLimits(max_chars=12, max_lines=2, max_duration=60)))
+
+    assert all(len(line) <= 12 for cue in cues for line in cue.lines)
+    assert all(len(cue.lines) <= 2 for cue in cues)
+    assert [w.text for cue in cues for w in cue.words] == [text for text, _, _ in timed]
+
+
+def test_long_cue_is_split_at_max_duration():
+    timed = [(f'w{i}', float(i), i + 0.5) for i in range(10)]
+    segment = {'start': 0.0, 'end': 10.0, 'text': '', 'words': words(*timed)}
+    cues = list(pack_cues([segment], CaptionLimits(max_chars=80, max_lines=2, max_duration=4.0)))
+
+    assert len(cues) > 1
+    assert all(cue.end - cue.start <= 4.0 for cue in cues)
+
+
+def test_pause_starts_a_new_cue():
+    segment = {'start': 0.0, 'end': 3.0, 'text': '', 'words': words(('One', 0.0, 0.5), ('Two', 2.0, 2.5))}
+    cues = list(pack_cues([segment]))
+    assert [cue.lines for cue in cues] == [['One'], ['Two']]
+
+
+def test_cues_never_span_segments():
+    segments = [
+        {'start': 0.0, 'end': 0.5, 'text': ' A', 'words': words(('A', 0.0, 0.5))},
+        {'start': 0.6, 'end': 1.0, 'text': ' B', 'words': words(('B', 0.6, 1.0))}
+    ]
+    assert [cue.lines for cue in pack_cues(segments)] == [['A'], ['B']]
+
+
+def test_words_are_spread_by_length_without_timestamps():
+    spread = segment_words({'start': 0.0, 'end': 3.0, 'text': ' a bb', 'words': []})
+    assert [w.text for w in spread] == ['a', 'bb']
+    assert spread[0].end == spread[1].start == 1.0
+    assert spread[1].end == 3.0
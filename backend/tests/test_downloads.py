@@ -0,0 +1,84 @@
+import os
+import time
+from urllib.parse import urlsplit, parse_qs
+from downloads import UrlSigner
+
+
+def parts(url):
+    split = urlsplit(url)
+    query = parse_qs(split.query)
+    return split.path, query['expires'][0], query['signature'][0]
+
+
+def test_signed_link_verifies_until_it_expires():
+    signer = UrlSigner(b'secret', ttl=3600)
+    path, expires, signature = parts(signer.sign('/download/a.mp4'))
+    remaining = signer.verify(path, expires, signature)
+    assert 3600 <= remaining <= 3600 + signer.granularity
+
+    expired = UrlSigner(b'secret', ttl=3600)
+    path, expires, signature = parts(expired.sign('/download/a.mp4', now=time.time() - 3 * 3600))
+    assert expired.verify(path, expires, signature) is None
+
+
+def test_expiry_is_rounded_so_polls_share_a_url():
+    signer = UrlSigner(b'secret', ttl=3600)
+    now = 900 * 1000
+    assert signer.sign('/download/a.mp4', now=now + 1) == signer.sign('/download/a.mp4', now=now + 899)
+
+
+def test_tampered_links_are_rejected():
+    signer = UrlSigner(b'secret', ttl=3600)
+    path, expires, signature = parts(signer.sign('/download/a.mp4'))
+    assert signer.verify('/download/b.mp4', expires, signature) is None
+    assert signer.verify(path, str(int(expires) + 900), signature) is None
+    assert signer.verify(path, expires, signature[:-1] + ('A' if signature[-1] != 'A' else 'B')) is None
+    assert signer.verify(path, 'soon', signature) is None
+    assert signer.verify(path, expires, None) is None
+    assert UrlSigner(b'other', ttl=3600).verify(path, expires, signature) is None
+
+
+def test_sign_fields_signs_only_link_fields():
+    signer = UrlSigner(b'secret')
+    signed = signer.sign_fields({'status': 'completed', 'download_url': '/download/a.mp4', 'srt_url': None})
+    assert signed['status'] == 'completed'
+    assert signed['download_url'].startswith('/download/a.mp4?expires=')
+    assert signed['srt_url'] is None
+
+
+def processed_file(capvid, filename, data=b'data'):
+    path = os.path.join(capvid.PROCESSED_FOLDER, filename)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def test_download_requires_a_valid_signature(capvid, client):
+    processed_file(capvid, 'job1_captions.srt', b'1\n')
+    assert client.get('/download_srt/job1_captions.srt').status_code == 403
+    signed = capvid.url_signer.sign('/download_srt/job1_captions.srt')
+    assert client.get(signed).data == b'1\n'
+    assert client.get(signed.replace('job1', 'job2')).status_code == 403
+
+
+def test_status_links_are_signed(capvid, client):
+    capvid.job_store.create('job2', {'status': 'completed', 'srt_url': '/download_srt/job2_captions.srt'})
+    processed_file(capvid, 'job2_captions.srt', b'2\n')
+    srt_url = client.get('/status/job2').get_json()['srt_url']
+    assert 'signature=' in srt_url
+    assert client.get(srt_url).data == b'2\n'
+
+
+def test_profile_needs_profiling_enabled_and_a_signed_link(capvid, client, monkeypatch):
+    processed_file(capvid, 'job3_profile.prof')
+    signed = capvid.url_signer.sign('/profile/job3')
+    assert client.get(signed).status_code == 404
+
+    monkeypatch.setattr(capvid, 'PROFILING_ENABLED', True)
+    assert client.get('/profile/job3').status_code == 403
+    assert client.get(signed).data == b'data'
+
+
+def test_captions_and_batch_links_require_a_signature(capvid, client):
+    assert client.get('/captions/job4').status_code == 403
+    assert client.get('/batches/batch1/download').status_code == 403
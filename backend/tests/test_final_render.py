@@ -0,0 +1,68 @@
+import os
+import pytest
+
+
+@pytest.fixture
+def preview_job(capvid, tmp_path):
+    """A job that finished with a preview and still owes its full render"""
+    upload = tmp_path / 'upload.mp4'
+    upload.write_bytes(b'video')
+    job_id = f"render-{tmp_path.name}"
+    capvid.job_store.create(job_id, {'status': 'completed', 'filename': 'talk.mp4', 'final_status': 'pending'},
+                            payload={'filepath': str(upload), 'filename': 'talk.mp4',
+                                     'output_options': {'mode': 'fast', 'preview': True}})
+    yield job_id
+    capvid.job_store.delete(job_id)
+
+
+@pytest.fixture
+def submitted(capvid, monkeypatch):
+    jobs = []
+    monkeypatch.setattr(capvid.scheduler, 'submit',
+                        lambda job_id, func, args=(), priority=None, force=False: jobs.append((job_id, func, args)))
+    return jobs
+
+
+def test_render_is_queued_once(capvid, client, preview_job, submitted):
+    first = client.post(f'/render/{preview_job}')
+    second = client.post(f'/render/{preview_job}')
+    assert first.status_code == second.status_code == 202
+    assert first.get_json()['final_status'] == second.get_json()['final_status'] == 'queued'
+    assert [job_id for job_id, _, _ in submitted] == [f'{preview_job}-final']
+
+
+def test_cancel_drops_a_queued_render(capvid, client, preview_job, submitted):
+    client.post(f'/render/{preview_job}')
+    response = client.post(f'/cancel/{preview_job}')
+    assert response.get_json()['cancelled'] == [preview_job]
+    assert capvid.job_store.get(preview_job)['final_status'] == 'cancelled'
+
+    # The task finds nothing to do if a worker had already picked it up
+    capvid.render_final_task(preview_job)
+    assert capvid.job_store.get(preview_job)['final_status'] == 'cancelled'
+
+    # and the render can be asked for again
+    assert client.post(f'/render/{preview_job}').get_json()['final_status'] == 'queued'
+    assert len(submitted) == 2
+
+
+def test_cancel_stops_a_running_render(capvid, client, preview_job, submitted, monkeypatch):
+    def overlay_subtitles(input_path, srt_path, output_path, cancel_token=None, **options):
+        assert capvid.running_jobs[preview_job] is cancel_token
+        assert capvid.job_store.get(preview_job)['final_status'] == 'rendering'
+        response = client.post(f'/cancel/{preview_job}')
+        assert response.get_json()['stopping'] == [preview_job]
+        cancel_token.check()
+        raise AssertionError('the render was not cancelled')
+    monkeypatch.setattr(capvid, 'overlay_subtitles', overlay_subtitles)
+
+    client.post(f'/render/{preview_job}')
+    capvid.render_final_task(preview_job)
+    info = capvid.job_store.get(preview_job)
+    assert info['final_status'] == 'cancelled'
+    assert preview_job not in capvid.running_jobs
+    assert os.path.exists(capvid.job_store.get_payload(preview_job)['filepath'])
+
+    # A new request clears the cancel flag so the next render is not stopped straight away
+    client.post(f'/render/{preview_job}')
+    assert capvid.job_store.control_state([preview_job])[preview_job][0] is False
@@ -0,0 +1,46 @@
+import sys
+import threading
+import types
+import pytest
+
+
+def test_healthz_answers_without_any_service(capvid, client, monkeypatch):
+    monkeypatch.setattr(capvid, 'services_started', threading.Event())
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert response.get_json() == {'status': 'ok'}
+
+
+def test_readyz_waits_for_startup(capvid, client, monkeypatch):
+    monkeypatch.setattr(capvid, 'services_started', threading.Event())
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json() == {'ready': False, 'starting': True}
+
+
+def test_readyz_waits_for_the_default_model(capvid, client, monkeypatch):
+    # The test app preloads nothing, so the default model is not resident
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()['default_model'] == capvid.model_registry.default_model
+
+    monkeypatch.setattr(capvid.model_registry, 'is_ready', lambda: True)
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.get_json()['ready'] is True
+
+
+def test_gunicorn_without_a_data_dir_fails_once(capvid, client, monkeypatch):
+    monkeypatch.setattr(capvid, 'services_started', threading.Event())
+    monkeypatch.setattr(capvid, 'startup_error', None)
+    monkeypatch.setattr(capvid, 'PERSISTENT_STORAGE', False)
+    monkeypatch.setitem(sys.modules, 'gunicorn', types.ModuleType('gunicorn'))
+    with pytest.raises(RuntimeError, match='CAPVID_DATA_DIR'):
+        capvid.create_app()
+
+    # Later requests are turned away without running startup again
+    monkeypatch.setattr(capvid, 'start_process_server', lambda: pytest.fail('startup ran again'))
+    response = client.get('/storage_info')
+    assert response.status_code == 503
+    assert client.get('/readyz').get_json()['error'] == capvid.startup_error
+    assert client.get('/healthz').status_code == 200
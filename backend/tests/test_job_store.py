@@ -0,0 +1,145 @@
+import os
+import socket
+import pytest
+from job_store import JobStore, MemoryJobStore, SqliteJobStore, current_owner
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryJobStore()
+    return SqliteJobStore(str(tmp_path / 'jobs.db'))
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    return SqliteJobStore(str(tmp_path / 'jobs.db'))
+
+
+def orphan(store, job_id):
+    """Hand the job to a process on this host that no longer exists"""
+    store._conn().execute('UPDATE jobs SET owner = ? WHERE job_id = ?', (f"{socket.gethostname()}:999999999", job_id))
+
+
+def test_update_merges_fields(store):
+    store.create('job', {'status': 'queued', 'filename': 'a.mp4'})
+    assert store.update('job', status='transcribing', progress=10)
+    assert store.get('job') == {'status': 'transcribing', 'filename': 'a.mp4', 'progress': 10}
+    assert not store.update('missing', status='failed')
+
+
+def test_update_with_expect_only_moves_from_the_expected_values(store):
+    store.create('job', {'status': 'completed', 'final_status': 'pending'})
+    expect = {'final_status': ('pending', 'failed')}
+    assert store.update('job', expect=expect, final_status='queued')
+    # A second request racing the first sees 'queued' and changes nothing
+    assert not store.update('job', expect=expect, final_status='queued', final_error='late')
+    assert store.get('job') == {'status': 'completed', 'final_status': 'queued'}
+
+
+def test_transition_only_from_allowed_statuses(store):
+    store.create('job', {'status': 'transcribing'})
+    assert not store.transition('job', ['queued'], {'status': 'cancelled'})
+    assert store.get('job')['status'] == 'transcribing'
+    assert store.transition('job', ['queued', 'transcribing'], {'status': 'cancelled'})
+    assert store.get('job') == {'status': 'cancelled'}
+
+
+def test_list_jobs_filters_by_status_and_age(store):
+    store.create('old', {'status': 'completed'}, created_at=100)
+    store.create('new', {'status': 'queued'}, created_at=200)
+    assert [job_id for job_id, _, _ in store.list_jobs()] == ['old', 'new']
+    assert [job_id for job_id, _, _ in store.list_jobs(statuses=['completed'])] == ['old']
+    assert [job_id for job_id, _, _ in store.list_jobs(created_before=150)] == ['old']
+
+
+def test_cancel_request_survives_status_updates(store):
+    store.create('job', {'status': 'transcribing'})
+    assert store.request_cancel('job')
+    store.set('job', {'status': 'generating_captions'})
+    assert store.control_state(['job', 'missing'])['job'][0] is True
+    assert store.request_cancel('job', cancel=False)
+    assert store.control_state(['job'])['job'][0] is False
+
+
+def test_memory_store_has_nothing_to_recover():
+    store = MemoryJobStore()
+    store.create('job', {'status': 'transcribing'})
+    assert store.claim_interrupted() == []
+
+
+def test_claim_interrupted_takes_unfinished_jobs_of_dead_owners(sqlite_store):
+    sqlite_store.create('running', {'status': 'transcribing'}, {'filepath': 'a.mp4'})
+    sqlite_store.create('done', {'status': 'completed'})
+    sqlite_store.create('failed', {'status': 'failed'})
+    for job_id in ('running', 'done', 'failed'):
+        orphan(sqlite_store, job_id)
+
+    claimed = sqlite_store.claim_interrupted()
+    assert [(job_id, payload) for job_id, _, payload in claimed] == [('running', {'filepath': 'a.mp4'})]
+    owner = sqlite_store._conn().execute("SELECT owner FROM jobs WHERE job_id = 'running'").fetchone()[0]
+    assert owner == current_owner()
+
+
+def test_claim_interrupted_skips_jobs_of_live_owners(sqlite_store):
+    sqlite_store.create('job', {'status': 'transcribing'})
+    sqlite_store._conn().execute("UPDATE jobs SET owner = ?", (f"{socket.gethostname()}:{os.getppid()}",))
+    assert sqlite_store.claim_interrupted() == []
+
+
+def test_claim_interrupted_takes_unfinished_final_renders(sqlite_store):
+    sqlite_store.create('rendering', {'status': 'completed', 'final_status': 'rendering'})
+    sqlite_store.create('ready', {'status': 'completed', 'final_status': 'ready'})
+    for job_id in ('rendering', 'ready'):
+        orphan(sqlite_store, job_id)
+    assert [job_id for job_id, _, _ in sqlite_store.claim_interrupted()] == ['rendering']
+
+
+def test_take_over_makes_this_process_the_owner(sqlite_store):
+    sqlite_store.create('job', {'status': 'completed', 'final_status': 'queued'})
+    sqlite_store._conn().execute("UPDATE jobs SET owner = ?", (f"{socket.gethostname()}:{os.getppid()}",))
+    sqlite_store.take_over('job')
+    owner = sqlite_store._conn().execute('SELECT owner FROM jobs').fetchone()[0]
+    assert owner == current_owner()
+
+
+def test_file_ledger_totals(store):
+    store.create('a', {'status': 'completed'})
+    store.create('b', {'status': 'completed'})
+    store.record_file('a', '/tmp/a1', 10)
+    store.record_file('a', '/tmp/a2', 5)
+    store.record_file('b', '/tmp/b1', 7)
+    store.record_file('a', '/tmp/a1', 20)
+    assert store.bytes_by_job() == {'a': 25, 'b': 7}
+    store.forget_file('/tmp/b1')
+    assert store.total_bytes() == 25
+
+
+def test_delete_removes_segments_and_files(store):
+    store.create('job', {'status': 'completed'})
+    store.append_segments('job', [{'text': ' a'}, {'text': ' b'}])
+    store.record_file('job', '/tmp/job', 3)
+    assert store.get_segments('job', 1) == [{'text': ' b'}]
+    assert store.delete('job')
+    assert not store.delete('job')
+    assert store.get('job') is None
+    assert store.get_segments('job') == []
+    assert store.total_bytes() == 0
+    assert store.count() == 0
+
+
+def test_clear_segments_restarts_the_transcript(store):
+    store.create('job', {'status': 'transcribing'})
+    store.append_segments('job', [{'text': ' a'}, {'text': ' b'}])
+    store.clear_segments('job')
+    assert store.get_segments('job') == []
+    store.append_segments('job', [{'text': ' c'}])
+    assert store.get_segments('job') == [{'text': ' c'}]
+
+
+def test_backends_must_implement_the_whole_interface():
+    class Partial(JobStore):
+        def get(self, job_id):
+            return None
+    with pytest.raises(TypeError):
+        Partial()
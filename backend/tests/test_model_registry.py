@@ -0,0 +1,92 @@
+import threading
+import pytest
+from model_registry import ModelRegistry
+
+MB = 1024 * 1024
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+
+
+def make_registry(**kwargs):
+    loads = []
+
+    def loader(name):
+        loads.append(name)
+        return FakeModel(name)
+
+    options = dict(loader=loader, allowed=['tiny', 'base'], default_model='tiny', preload='', memory_budget=1024 * MB)
+    options.update(kwargs)
+    registry = ModelRegistry(**options)
+    return registry, loads
+
+
+@pytest.fixture(autouse=True)
+def no_instance_override(monkeypatch):
+    monkeypatch.delenv('CAPVID_MODEL_INSTANCES', raising=False)
+
+
+def test_concurrent_jobs_get_their_own_instance_up_to_the_limit():
+    registry, loads = make_registry(max_instances=2)
+    with registry.use('tiny') as (first, _):
+        with registry.use('tiny') as (second, _):
+            assert first is not second
+            assert registry.status()['models']['tiny']['instances'] == 2
+
+            # A third job waits for one of the two to be handed back
+            borrowed = []
+
+            def third_job():
+                with registry.use('tiny') as (model, _):
+                    borrowed.append(model)
+
+            waiter = threading.Thread(target=third_job)
+            waiter.start()
+            waiter.join(0.2)
+            assert waiter.is_alive()
+        waiter.join(5)
+        assert borrowed == [second]
+    assert loads == ['tiny', 'tiny']
+
+
+def test_sequential_jobs_reuse_one_instance():
+    registry, loads = make_registry(max_instances=4)
+    for _ in range(3):
+        with registry.use('tiny') as (model, name):
+            assert name == 'tiny'
+    assert loads == ['tiny']
+
+
+def test_extra_instances_must_fit_the_memory_budget(monkeypatch):
+    registry, loads = make_registry(max_instances=4, memory_budget=300 * MB)
+    monkeypatch.setattr('model_registry.model_memory_bytes', lambda model: 200 * MB)
+    with registry.use('tiny'):
+        done = threading.Event()
+
+        def second_job():
+            with registry.use('tiny'):
+                done.set()
+
+        threading.Thread(target=second_job, daemon=True).start()
+        assert not done.wait(0.2)
+    assert done.wait(5)
+    assert loads == ['tiny']
+
+
+def test_unload_idle_keeps_one_default_instance(monkeypatch):
+    registry, loads = make_registry(max_instances=2, idle_seconds=1)
+    with registry.use('tiny'), registry.use('tiny'), registry.use('base'):
+        pass
+    monkeypatch.setattr('model_registry.time.time', lambda: 10 ** 10)
+    registry.unload_idle()
+    models = registry.status()['models']
+    assert models['tiny']['instances'] == 1
+    assert models['base']['instances'] == 0
+
+
+def test_env_overrides_the_instance_limit(monkeypatch):
+    monkeypatch.setenv('CAPVID_MODEL_INSTANCES', '3')
+    registry, _ = make_registry(max_instances=8)
+    assert registry.max_instances == 3
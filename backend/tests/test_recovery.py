@@ -0,0 +1,17 @@
+def test_recovered_jobs_start_with_an_empty_transcript(capvid, monkeypatch, tmp_path):
+    upload = tmp_path / 'upload.mp4'
+    upload.write_bytes(b'video')
+    payload = {'filepath': str(upload), 'stream': True, 'output_options': {}, 'priority': 5}
+    capvid.job_store.create('recovered', {'status': 'transcribing', 'filename': 'talk.mp4'}, payload=payload)
+    capvid.job_store.append_segments('recovered', [{'start': 0.0, 'end': 1.0, 'text': 'decoded before the restart'}])
+    monkeypatch.setattr(capvid.job_store, 'claim_interrupted',
+                        lambda: [('recovered', capvid.job_store.get('recovered'), payload)])
+    submitted = []
+    monkeypatch.setattr(capvid.scheduler, 'submit',
+                        lambda job_id, func, args=(), priority=None, force=False: submitted.append(job_id))
+
+    capvid.recover_interrupted_jobs()
+    assert submitted == ['recovered']
+    assert capvid.job_store.get('recovered')['status'] == 'queued'
+    assert capvid.job_store.get_segments('recovered') == []
+    capvid.job_store.delete('recovered')
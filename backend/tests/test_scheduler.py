@@ -0,0 +1,170 @@
+import threading
+import pytest
+import scheduler as scheduler_module
+from scheduler import JobScheduler, QueueFullError, DuplicateJobError, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler_module.time, 'time', lambda: now[0])
+    return now
+
+
+def occupy(scheduler, job_id):
+    """Submit a job that holds a worker until the returned event is set"""
+    release = threading.Event()
+    started = threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(5)
+    scheduler.submit(job_id, hold)
+    assert started.wait(5)
+    return release
+
+
+def wait_until(predicate):
+    """Poll predicate for up to 5s; time.time is faked, so count attempts instead"""
+    for _ in range(500):
+        if predicate():
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError('condition not reached')
+
+
+class Recorder:
+    """Job function that records the order jobs ran in"""
+
+    def __init__(self, expected):
+        self.order = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, job_id):
+        self.order.append(job_id)
+        if len(self.order) == self.expected:
+            self.done.set()
+
+    def submit(self, scheduler, job_id, priority=PRIORITY_NORMAL):
+        scheduler.submit(job_id, self, (job_id,), priority)
+
+
+def test_higher_priority_runs_first_and_fifo_within_a_priority(clock):
+    scheduler = JobScheduler(num_workers=1, max_queue=10)
+    release = occupy(scheduler, 'busy')
+    recorder = Recorder(4)
+    for job_id, priority in [('normal-1', PRIORITY_NORMAL), ('low', PRIORITY_LOW),
+                             ('high', PRIORITY_HIGH), ('normal-2', PRIORITY_NORMAL)]:
+        recorder.submit(scheduler, job_id, priority)
+    assert [scheduler.queue_info(job_id)['queue_position'] for job_id in ('high', 'normal-1', 'normal-2', 'low')] == [1, 2, 3, 4]
+
+    release.set()
+    assert recorder.done.wait(5)
+    assert recorder.order == ['high', 'normal-1', 'normal-2', 'low']
+
+
+def test_waiting_jobs_age_past_newer_high_priority_jobs(clock):
+    scheduler = JobScheduler(num_workers=1, max_queue=10, aging_seconds=60)
+    release = occupy(scheduler, 'busy')
+    recorder = Recorder(3)
+    recorder.submit(scheduler, 'long', PRIORITY_NORMAL)
+    clock[0] += 3 * 60
+    recorder.submit(scheduler, 'early-short', PRIORITY_HIGH)
+    clock[0] += 3 * 60
+    recorder.submit(scheduler, 'late-short', PRIORITY_HIGH)
+    # Six minutes of waiting outweigh the five levels between normal and high
+    assert scheduler.queue_info('long')['queue_position'] == 2
+
+    release.set()
+    assert recorder.done.wait(5)
+    assert recorder.order == ['early-short', 'long', 'late-short']
+
+
+def test_full_queue_rejects_unless_forced(clock):
+    scheduler = JobScheduler(num_workers=1, max_queue=2)
+    release = occupy(scheduler, 'busy')
+    scheduler.submit('a', lambda: None)
+    scheduler.submit('b', lambda: None)
+    with pytest.raises(QueueFullError) as error:
+        scheduler.submit('c', lambda: None)
+    assert error.value.queue_length == 2
+    assert error.value.retry_after == 60
+    with pytest.raises(QueueFullError):
+        scheduler.check_capacity()
+    assert scheduler.submit('batch-member', lambda: None, force=True) == 3
+    release.set()
+
+
+def test_retry_after_is_at_least_one_second(clock):
+    scheduler = JobScheduler(num_workers=4, max_queue=1)
+    quick = threading.Event()
+
+    def tick():
+        clock[0] += 0.2
+        quick.set()
+    scheduler.submit('quick', tick)
+    assert quick.wait(5)
+    wait_until(lambda: scheduler.stats()['avg_job_seconds'] is not None)
+    release = occupy(scheduler, 'busy')
+    scheduler.submit('waiting', lambda: None)
+    with pytest.raises(QueueFullError) as error:
+        scheduler.check_capacity()
+    assert error.value.retry_after == 1
+    release.set()
+
+
+def test_cancel_drops_a_queued_job(clock):
+    scheduler = JobScheduler(num_workers=1, max_queue=10)
+    release = occupy(scheduler, 'busy')
+    recorder = Recorder(1)
+    recorder.submit(scheduler, 'a')
+    recorder.submit(scheduler, 'b')
+    assert scheduler.cancel('a')
+    assert not scheduler.cancel('a')
+    assert scheduler.queue_info('a') is None
+    assert scheduler.queue_info('b')['queue_position'] == 1
+
+    release.set()
+    assert recorder.done.wait(5)
+    assert recorder.order == ['b']
+
+
+def test_an_id_already_queued_is_rejected(clock):
+    scheduler = JobScheduler(num_workers=1, max_queue=10)
+    release = occupy(scheduler, 'busy')
+    recorder = Recorder(2)
+    recorder.submit(scheduler, 'a')
+    with pytest.raises(DuplicateJobError):
+        scheduler.submit('a', recorder, ('a',), force=True)
+    assert scheduler.stats()['queued'] == 1
+
+    # Once it has started the id may be queued again
+    release.set()
+    wait_until(lambda: recorder.order == ['a'])
+    recorder.submit(scheduler, 'a')
+    assert recorder.done.wait(5)
+    assert recorder.order == ['a', 'a']
+
+
+def test_eta_counts_remaining_time_of_running_jobs(clock):
+    scheduler = JobScheduler(num_workers=2, max_queue=10)
+    measured = threading.Event()
+
+    def hundred_seconds():
+        clock[0] += 100
+        measured.set()
+    scheduler.submit('warm-up', hundred_seconds)
+    assert measured.wait(5)
+    wait_until(lambda: scheduler.stats()['avg_job_seconds'] == 100)
+
+    first = occupy(scheduler, 'first')
+    clock[0] += 80
+    second = occupy(scheduler, 'second')
+    clock[0] += 10
+    for job_id in ('q1', 'q2', 'q3', 'q4'):
+        scheduler.submit(job_id, lambda: None)
+    # q1 and q2 take the slots of first (10s left) and second (90s left); q3 and q4 wait a full wave
+    assert [scheduler.queue_info(job_id)['eta_seconds'] for job_id in ('q1', 'q2', 'q3', 'q4')] == [110, 190, 210, 290]
+    first.set()
+    second.set()
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from audio import SAMPLE_RATE, split_audio
+from transcription import stitch_results, pack_clips, unpack_result, PACK_GAP_SECONDS
+
+
+def tone(seconds, amplitude=0.5):
+    t = np.arange(int(seconds * SAMPLE_RATE), dtype=np.float32) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def segment(start, end, text, words=None):
+    return {'id': 0, 'seek': 0, 'start': start, 'end': end, 'text': text, 'words': words or []}
+
+
+def test_split_audio_keeps_short_audio_whole():
+    audio = tone(20)
+    chunks = split_audio(audio, chunk_seconds=60)
+    assert len(chunks) == 1
+    assert chunks[0][0] == 0
+    assert len(chunks[0][1]) == len(audio)
+
+
+def test_split_audio_cuts_in_the_pause_and_covers_every_sample():
+    # Speech with a one-second pause a little after each 10s boundary
+    audio = np.concatenate([tone(11), silence(1), tone(10), silence(1), tone(10)])
+    chunks = split_audio(audio, chunk_seconds=10, sample_rate=SAMPLE_RATE)
+
+    assert len(chunks) == 3
+    assert np.array_equal(np.concatenate([samples for _, samples in chunks]), audio)
+    assert 11 <= chunks[1][0] <= 12
+    assert 22 <= chunks[2][0] <= 23
+    for (offset, samples), (next_offset, _) in zip(chunks, chunks[1:]):
+        assert offset + len(samples) / SAMPLE_RATE == pytest.approx(next_offset)
+
+
+def test_stitch_results_shifts_timestamps_and_renumbers():
+    chunks = [
+        {'language': 'en', 'segments': [segment(0.0, 2.0, ' Hello', [{'word': ' Hello', 'start': 0.5, 'end': 1.0}])]},
+        {'language': 'en', 'segments': [segment(1.0, 3.0, ' world'), segment(3.0, 4.0, ' again')]}
+    ]
+    result = stitch_results(chunks, [0.0, 60.0])
+
+    assert result['text'] == ' Hello world again'
+    assert result['language'] == 'en'
+    assert [s['id'] for s in result['segments']] == [0, 1, 2]
+    assert [(s['start'], s['end']) for s in result['segments']] == [(0.0, 2.0), (61.0, 63.0), (63.0, 64.0)]
+    assert result['segments'][0]['words'][0]['start'] == 0.5
+    assert result['segments'][1]['seek'] == 6000
+
+
+def test_pack_clips_spaces_clips_by_the_gap():
+    audio, offsets = pack_clips([tone(3), tone(5)])
+    assert offsets == [0.0, 3 + PACK_GAP_SECONDS]
+    assert len(audio) == int((3 + 5 + 2 * PACK_GAP_SECONDS) * SAMPLE_RATE)
+
+
+def test_unpack_result_splits_straddling_segments_by_word():
+    offsets, durations = [0.0, 5.0], [3.0, 4.0]
+    words = [
+        {'word': ' end', 'start': 2.0, 'end': 2.8},
+        {'word': ' start', 'start': 5.2, 'end': 5.6}
+    ]
+    packed = {'language': 'de', 'segments': [segment(2.0, 5.6, ' end start', words), segment(6.0, 7.0, ' more')]}
+    first, second = unpack_result(packed, offsets, durations)
+
+    assert first['text'] == ' end'
+    assert [(s['start'], s['end']) for s in first['segments']] == [(2.0, 2.8)]
+    assert second['text'] == ' start more'
+    assert [s['id'] for s in second['segments']] == [0, 1]
+    assert second['segments'][0]['start'] == pytest.approx(0.2)
+    assert second['segments'][0]['words'][0]['start'] == pytest.approx(0.2)
+    assert second['language'] == 'de'
+
+
+def test_unpack_result_drops_text_decoded_from_the_gap():
+    packed = {'segments': [segment(3.5, 4.5, ' noise')]}
+    first, second = unpack_result(packed, [0.0, 5.0], [3.0, 4.0])
+    assert first['segments'] == []
+    assert second['segments'] == []
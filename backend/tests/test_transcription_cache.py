@@ -0,0 +1,88 @@
+import os
+import threading
+import pytest
+from transcription_cache import TranscriptionCache, fcntl
+
+
+def result(text, padding=0):
+    return {'segments': [{'start': 0.0, 'end': 1.0, 'text': text + ' ' * padding}], 'language': 'en'}
+
+
+def files(cache, suffix):
+    return sorted(name for name in os.listdir(cache.cache_dir) if name.endswith(suffix))
+
+
+def test_aliases_are_evicted_with_their_entry(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), max_bytes=10 ** 6)
+    cache.put('old', result('old', padding=400))
+    cache.put_alias('upload-old', 'old')
+    os.utime(cache._path('old'), (1, 1))
+    cache.max_bytes = 700
+    cache.put('new', result('new', padding=400))
+    cache.put_alias('upload-new', 'new')
+
+    assert files(cache, '.json') == ['new.json']
+    assert files(cache, '.alias') == ['upload-new.alias']
+    assert cache.get_alias('upload-new') == 'new'
+
+
+def test_orphaned_aliases_are_removed_on_eviction(tmp_path):
+    cache = TranscriptionCache(str(tmp_path))
+    cache.put_alias('upload', 'never-written')
+    cache.put('entry', result('entry'))
+    assert files(cache, '.alias') == []
+
+
+def test_hit_and_miss_are_counted(tmp_path):
+    cache = TranscriptionCache(str(tmp_path))
+    assert cache.get('missing') is None
+    cache.put('key', result('hello'))
+    assert cache.get('key') == result('hello')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache = TranscriptionCache(str(tmp_path), max_bytes=10 ** 6)
+    for key, age in (('a', 3), ('b', 2), ('c', 1)):
+        cache.put(key, result(key, padding=400))
+        os.utime(cache._path(key), (1000 - age, 1000 - age))
+    # Reading a refreshes its access time, so b is now the oldest
+    assert cache.get('a') is not None
+    cache.max_bytes = 1000
+    cache.put('d', result('d', padding=400))
+
+    assert files(cache, '.json') == ['a.json', 'd.json']
+    assert cache.stats()['evictions'] == 2
+
+
+def test_instances_sharing_a_directory_see_each_other(tmp_path):
+    writer = TranscriptionCache(str(tmp_path))
+    reader = TranscriptionCache(str(tmp_path))
+    writer.put('key', result('shared'))
+    assert reader.get('key') == result('shared')
+    assert reader.read('key') == result('shared')
+
+    reader.max_bytes = 1
+    reader.put('other', result('other'))
+    # The writer's index is stale; its lookup goes to disk and finds the entry gone
+    assert writer.get('key') is None
+
+
+def test_eviction_waits_for_the_directory_lock(tmp_path):
+    cache = TranscriptionCache(str(tmp_path))
+    if fcntl is None:
+        pytest.skip('flock is not available on this platform')
+    holder = open(os.path.join(cache.cache_dir, '.lock'), 'a')
+    fcntl.flock(holder, fcntl.LOCK_EX)
+    finished = threading.Event()
+    writer = threading.Thread(target=lambda: (cache.put('key', result('x')), finished.set()))
+    writer.start()
+    try:
+        # Another process (here another open file) holds the lock, so put() cannot finish its eviction pass
+        assert not finished.wait(0.3)
+    finally:
+        fcntl.flock(holder, fcntl.LOCK_UN)
+        holder.close()
+    assert finished.wait(5)
+    writer.join()
@@ -0,0 +1,82 @@
+import os
+import pytest
+
+
+@pytest.fixture
+def queued(capvid, monkeypatch):
+    """Jobs the app hands to the scheduler, with ffprobe replaced by a fixed answer"""
+    submitted = []
+    monkeypatch.setattr(capvid, 'probe_media', lambda path: {
+        'duration': 12.0, 'has_audio': True, 'has_video': True, 'audio_codec': 'aac', 'video_codec': 'h264'
+    })
+    monkeypatch.setattr(capvid.scheduler, 'submit', lambda job_id, func, args=(), priority=None, force=False:
+                        submitted.append((job_id, args)) or 1)
+    return submitted
+
+
+def start_upload(client, size, filename='talk.mp4', **form):
+    response = client.post('/uploads', json=dict(form, filename=filename, size=size))
+    assert response.status_code == 201
+    return response.get_json()['upload_id']
+
+
+def patch(client, upload_id, offset, data):
+    return client.patch(f'/uploads/{upload_id}', data=data, headers={'Upload-Offset': str(offset)})
+
+
+def test_head_reports_the_current_offset(client):
+    upload_id = start_upload(client, 10)
+    assert patch(client, upload_id, 0, b'abcd').get_json()['offset'] == 4
+
+    response = client.head(f'/uploads/{upload_id}')
+    assert response.status_code == 200
+    assert response.headers['Upload-Offset'] == '4'
+    assert client.head('/uploads/00000000-0000-0000-0000-000000000000').status_code == 404
+
+
+def test_offset_mismatch_is_409_with_the_offset_to_resume_from(client):
+    upload_id = start_upload(client, 10)
+    patch(client, upload_id, 0, b'abcd')
+
+    response = patch(client, upload_id, 2, b'cdef')
+    assert response.status_code == 409
+    assert response.headers['Upload-Offset'] == '4'
+    assert response.get_json()['offset'] == 4
+    assert patch(client, upload_id, 4, b'ef').get_json()['offset'] == 6
+
+
+def test_concurrent_append_is_refused(capvid, client):
+    upload_id = start_upload(client, 10)
+    holder = capvid.resumable_uploads.open_sink(upload_id, 0, 10)
+    try:
+        assert patch(client, upload_id, 0, b'abcd').status_code == 409
+    finally:
+        holder.close()
+    assert patch(client, upload_id, 0, b'abcd').status_code == 200
+
+
+def test_last_chunk_starts_the_job(capvid, client, queued):
+    upload_id = start_upload(client, 8, output_mode='soft')
+    patch(client, upload_id, 0, b'1234')
+    response = patch(client, upload_id, 4, b'5678')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    assert [submitted_id for submitted_id, _ in queued] == [job_id]
+    filepath = queued[0][1][1]
+    with open(filepath, 'rb') as f:
+        assert f.read() == b'12345678'
+    assert capvid.job_store.get(job_id)['status'] == 'queued'
+    assert capvid.job_store.get_payload(job_id)['output_options']['mode'] == 'soft'
+    assert client.head(f'/uploads/{upload_id}').status_code == 404
+
+
+def test_oversize_uploads_are_rejected(capvid, client):
+    too_big = client.post('/uploads', json={'filename': 'big.mp4', 'size': capvid.MAX_UPLOAD_BYTES + 1})
+    assert too_big.status_code == 400
+
+    upload_id = start_upload(client, 4)
+    part_path = capvid.resumable_uploads.part_path(upload_id)
+    assert patch(client, upload_id, 0, b'123456').status_code == 400
+    assert not os.path.exists(part_path)
+    assert client.head(f'/uploads/{upload_id}').status_code == 404
@@ -0,0 +1,111 @@
+import os
+import signal
+import time
+import numpy as np
+import pytest
+from audio import SAMPLE_RATE
+from cancellation import CancelToken, JobCancelled
+from model_registry import ModelRegistry
+from worker_pool import TranscriptionWorkerPool
+
+OPTIONS = {'language': 'en'}
+CHUNK_DELAY = 0.2
+
+
+class SlowModel:
+    """Stands in for Whisper in the worker processes: one segment per call, CHUNK_DELAY apiece"""
+
+    def transcribe(self, audio, **options):
+        time.sleep(CHUNK_DELAY)
+        seconds = len(audio) / SAMPLE_RATE
+        return {'language': 'en', 'text': ' hi', 'segments': [
+            {'id': 0, 'seek': 0, 'start': 0.0, 'end': seconds, 'text': ' hi', 'words': []}
+        ]}
+
+
+def slow_registry():
+    # Runs in the worker process, so it must be importable from there
+    return ModelRegistry(loader=lambda name: SlowModel(), allowed=['tiny'], default_model='tiny', preload='tiny')
+
+
+def wait_until(condition, timeout=30):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def pcm(tmp_path):
+    def write(seconds, name='audio.pcm'):
+        path = str(tmp_path / name)
+        np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32).tofile(path)
+        return path
+    return write
+
+
+def pids(pool):
+    return {worker['pid'] for worker in pool.stats()['workers']}
+
+
+def test_workers_are_recycled_after_max_jobs(pcm, tmp_path):
+    pool = TranscriptionWorkerPool(1, max_jobs=2, num_threads=1, registry_factory=slow_registry)
+    pool.start()
+    wait_until(pool.is_ready)
+    first = pids(pool)
+    assert pool.stats()['workers'][0]['backend'] == 'whisper'
+
+    for i in range(3):
+        result, model_name = pool.transcribe(pcm(1), str(tmp_path / f'result{i}.json'), 'tiny', OPTIONS)
+        assert model_name == 'tiny'
+        assert result['segments'][0]['text'] == ' hi'
+        assert not os.path.exists(tmp_path / f'result{i}.json')
+
+    stats = pool.stats()
+    assert stats['recycled'] == 1
+    assert stats['crashed'] == 0
+    assert len(pids(pool)) == 1 and pids(pool) != first
+
+
+def test_cancel_stops_the_task_and_keeps_the_worker(pcm, tmp_path):
+    pool = TranscriptionWorkerPool(1, num_threads=1, registry_factory=slow_registry)
+    pool.start()
+    wait_until(pool.is_ready)
+    worker = pids(pool)
+
+    token = CancelToken()
+    progress = []
+
+    def on_progress(done, total):
+        progress.append(done)
+        token.cancel()
+
+    started = time.time()
+    with pytest.raises(JobCancelled):
+        pool.transcribe(pcm(20), str(tmp_path / 'result.json'), 'tiny', OPTIONS, on_progress=on_progress,
+                        chunk_seconds=1, min_chunked_seconds=0, cancel_token=token)
+    assert time.time() - started < 20 * CHUNK_DELAY
+    assert progress
+
+    # The worker stops at its next chunk and takes the next task itself
+    wait_until(lambda: not any(w['busy'] for w in pool.stats()['workers']))
+    result, _ = pool.transcribe(pcm(1, 'short.pcm'), str(tmp_path / 'short.json'), 'tiny', OPTIONS)
+    assert result['segments']
+    assert pids(pool) == worker
+    assert pool.stats()['crashed'] == 0
+
+
+def test_a_crashed_worker_fails_its_task_and_is_replaced(pcm, tmp_path):
+    pool = TranscriptionWorkerPool(1, num_threads=1, registry_factory=slow_registry)
+    pool.start()
+    wait_until(pool.is_ready)
+    (worker,) = pids(pool)
+
+    def kill_worker(done, total):
+        os.kill(worker, signal.SIGKILL)
+
+    with pytest.raises(Exception, match='exited unexpectedly'):
+        pool.transcribe(pcm(20), str(tmp_path / 'result.json'), 'tiny', OPTIONS, on_progress=kill_worker,
+                        chunk_seconds=1, min_chunked_seconds=0)
+    assert pool.stats()['crashed'] == 1
+    wait_until(lambda: pids(pool) and worker not in pids(pool))
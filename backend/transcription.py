@@ -0,0 +1,248 @@
+import os
+import bisect
+import logging
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from audio import SAMPLE_RATE, split_audio
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SECONDS = int(os.environ.get('CAPVID_CHUNK_SECONDS', 60))
+# Below this length the pool start-up cost outweighs the parallel speedup
+MIN_CHUNKED_SECONDS = int(os.environ.get('CAPVID_MIN_CHUNKED_SECONDS', 180))
+
+# Silence between packed clips so no segment runs from one clip into the next
+PACK_GAP_SECONDS = 2.0
+
+# Child processes come from a forkserver started while the web process has one thread,
+# so none of them inherits a lock that another thread held at fork time
+PROCESS_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Imported once in the server instead of in every child
+FORKSERVER_PRELOAD = ['__main__', 'worker_pool']
+
+# Set in each pool process by _init_chunk_worker
+_chunk_model = None
+
+
+def process_context():
+    """The multiprocessing context every worker and chunk process is started from"""
+    return multiprocessing.get_context(PROCESS_START_METHOD)
+
+
+def start_process_server():
+    """Start the forkserver now; call before the process starts any thread"""
+    if PROCESS_START_METHOD != 'forkserver':
+        return
+    from multiprocessing import forkserver
+    process_context().set_forkserver_preload(FORKSERVER_PRELOAD)
+    forkserver.ensure_running()
+
+
+def _init_chunk_worker(load_model, num_threads):
+    global _chunk_model
+    _chunk_model = load_model()
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def _transcribe_chunk(index, audio_chunk, options):
+    result = _chunk_model.transcribe(audio_chunk, **options)
+    return index, result
+
+
+def detect_language(model, audio):
+    """Detect the spoken language from the first 30 seconds"""
+    import whisper
+    sample = whisper.pad_or_trim(audio)
+    mel = whisper.log_mel_spectrogram(sample, n_mels=getattr(model.dims, 'n_mels', 80)).to(model.device)
+    _, probs = model.detect_language(mel)
+    return max(probs, key=probs.get)
+
+
+def shift_segments(segments, offset):
+    """Move segment and word timestamps from chunk time to file time"""
+    for segment in segments:
+        segment['start'] += offset
+        segment['end'] += offset
+        if 'seek' in segment:
+            segment['seek'] += int(offset * 100)
+        for word in segment.get('words', []):
+            word['start'] += offset
+            word['end'] += offset
+    return segments
+
+
+def stitch_results(chunk_results, offsets):
+    """Merge per-chunk results (in chunk order) into one Whisper-shaped result"""
+    segments = []
+    for result, offset in zip(chunk_results, offsets):
+        segments.extend(shift_segments(result.get('segments', []), offset))
+    for i, segment in enumerate(segments):
+        segment['id'] = i
+    language = next((r.get('language') for r in chunk_results if r.get('language')), None)
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': language
+    }
+
+
+def pack_clips(clips, gap_seconds=PACK_GAP_SECONDS):
+    """Concatenate short clips with silence between them for a single model pass; returns (audio, offsets)"""
+    gap = np.zeros(int(gap_seconds * SAMPLE_RATE), dtype=np.float32)
+    parts = []
+    offsets = []
+    position = 0
+    for clip in clips:
+        offsets.append(position / SAMPLE_RATE)
+        parts.extend([clip, gap])
+        position += len(clip) + len(gap)
+    return np.concatenate(parts), offsets
+
+
+def unpack_result(result, offsets, durations):
+    """Split a packed result into one Whisper-shaped result per clip, in clip time
+
+    Words are assigned to clips by their midpoint, so a segment that straddles a gap
+    is split in two; anything decoded from the silence after a clip is dropped.
+    """
+    def clip_of(t):
+        return max(0, bisect.bisect_right(offsets, t) - 1)
+
+    per_clip = [[] for _ in offsets]
+    for segment in result.get('segments', []):
+        words = segment.get('words') or []
+        if not words:
+            per_clip[clip_of((segment['start'] + segment['end']) / 2)].append(dict(segment))
+            continue
+        groups = {}
+        for word in words:
+            groups.setdefault(clip_of((word['start'] + word['end']) / 2), []).append(dict(word))
+        for index, group in groups.items():
+            per_clip[index].append(dict(
+                segment, start=group[0]['start'], end=group[-1]['end'],
+                text=''.join(word['word'] for word in group), words=group
+            ))
+
+    results = []
+    for index, segments in enumerate(per_clip):
+        shift_segments(segments, -offsets[index])
+        duration = durations[index]
+        segments = [s for s in segments if s['start'] < duration]
+        for i, segment in enumerate(segments):
+            segment['id'] = i
+            segment['start'] = max(0.0, segment['start'])
+            segment['end'] = min(duration, segment['end'])
+            if 'seek' in segment:
+                segment['seek'] = max(0, segment['seek'])
+        results.append({
+            'text': ''.join(segment['text'] for segment in segments),
+            'segments': segments,
+            'language': result.get('language')
+        })
+    return results
+
+
+class OrderedEmitter:
+    """Release chunk segments to a callback in file order as chunks complete out of order"""
+
+    def __init__(self, offsets, on_segments):
+        self.offsets = offsets
+        self.on_segments = on_segments
+        self.pending = {}
+        self.next_index = 0
+
+    def add(self, index, result):
+        if not self.on_segments:
+            return
+        self.pending[index] = result
+        while self.next_index in self.pending:
+            ready = self.pending.pop(self.next_index)
+            # Shift copies; the stitched result shifts the originals later
+            segments = [dict(segment, words=[dict(word) for word in segment.get('words', [])])
+                        for segment in ready.get('segments', [])]
+            self.on_segments(shift_segments(segments, self.offsets[self.next_index]))
+            self.next_index += 1
+
+
+def _stop_pool(pool):
+    """Terminate a pool's processes mid-chunk; pending futures then fail with BrokenProcessPool"""
+    for process in list((pool._processes or {}).values()):
+        process.terminate()
+
+
+def transcribe_chunked(model, audio, options, max_workers=None, on_progress=None,
+                       on_segments=None, chunk_seconds=None, min_chunked_seconds=None, cancel_token=None,
+                       load_model=None):
+    """Transcribe a decoded 16 kHz buffer, splitting long audio at pauses and fanning out to processes
+
+    on_segments, if given, receives each batch of segments in file order as soon as
+    every earlier chunk has finished, so captions can be streamed while work continues.
+    cancel_token is checked between chunks; cancelling it also kills chunks in flight.
+    Chunks only fan out when load_model is given: a picklable callable that loads
+    the same model in each pool process, since forkserver children share no memory.
+    """
+    chunk_seconds = chunk_seconds or CHUNK_SECONDS
+    min_chunked_seconds = min_chunked_seconds if min_chunked_seconds is not None else MIN_CHUNKED_SECONDS
+    duration = len(audio) / SAMPLE_RATE
+    if cancel_token:
+        cancel_token.check()
+    if duration < min_chunked_seconds:
+        result = model.transcribe(audio, **options)
+        if on_segments:
+            on_segments(result.get('segments', []))
+        if on_progress:
+            on_progress(1, 1)
+        return result
+
+    chunks = split_audio(audio, chunk_seconds)
+    offsets = [offset for offset, _ in chunks]
+    logger.info(f"Split {duration:.0f}s of audio into {len(chunks)} chunks")
+
+    options = dict(options)
+    if options.get('language') is None:
+        # Detect once so every chunk decodes in the same language
+        options['language'] = detect_language(model, audio)
+        logger.info(f"Detected language: {options['language']}")
+
+    cores = os.cpu_count() or 1
+    max_workers = min(max_workers or cores, len(chunks))
+    results = [None] * len(chunks)
+    emitter = OrderedEmitter(offsets, on_segments)
+
+    if max_workers > 1 and load_model:
+        threads_per_worker = max(1, cores // max_workers)
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=process_context(),
+                                 initializer=_init_chunk_worker,
+                                 initargs=(load_model, threads_per_worker)) as pool:
+            futures = [pool.submit(_transcribe_chunk, i, samples, options) for i, (_, samples) in enumerate(chunks)]
+            unregister = cancel_token.on_cancel(lambda: _stop_pool(pool)) if cancel_token else None
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    index, result = future.result()
+                    results[index] = result
+                    emitter.add(index, result)
+                    if on_progress:
+                        on_progress(done, len(chunks))
+            except BrokenProcessPool:
+                if cancel_token:
+                    cancel_token.check()
+                raise
+            finally:
+                if unregister:
+                    unregister()
+    else:
+        for i, (_, samples) in enumerate(chunks):
+            if cancel_token:
+                cancel_token.check()
+            results[i] = model.transcribe(samples, **options)
+            emitter.add(i, results[i])
+            if on_progress:
+                on_progress(i + 1, len(chunks))
+
+    return stitch_results(results, offsets)
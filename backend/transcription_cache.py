@@ -0,0 +1,260 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: eviction is then only coordinated within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'capvid_transcripts')
+DEFAULT_CACHE_LIMIT = 200 * 1024 * 1024  # 200MB in bytes
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(filepath):
+    """SHA-256 of the file contents, read in 1MB chunks"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(content_hash, model_name, options, backend='whisper'):
+    """Combine content hash, model name, inference backend and transcribe options into one key"""
+    params = json.dumps(options, sort_keys=True, default=str)
+    # Reference backend keys are unchanged so existing cache entries stay valid
+    if backend != 'whisper':
+        model_name = f"{model_name}@{backend}"
+    return hashlib.sha256(f"{content_hash}:{model_name}:{params}".encode('utf-8')).hexdigest()
+
+
+class TranscriptionCache:
+    """Disk-backed LRU cache of Whisper results, evicted by total size
+
+    Several processes (web workers, transcription workers) may share one cache
+    directory. The files are the source of truth: lookups stat the entry on disk,
+    and eviction rescans the directory under a file lock, so the size limit holds
+    for the directory as a whole. The in-memory index only feeds stats().
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get('CAPVID_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes or int(os.environ.get('CAPVID_CACHE_LIMIT', DEFAULT_CACHE_LIMIT))
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> (last_access, size)
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        """Rebuild the in-memory index from files left by a previous run"""
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, filename))
+            except OSError:
+                continue
+            self._entries[filename[:-5]] = (stat.st_mtime, stat.st_size)
+            self._total_bytes += stat.st_size
+        if self._entries:
+            logger.info(f"Transcription cache: {len(self._entries)} entries, {self._total_bytes / 1024 / 1024:.1f}MB")
+
+    def get(self, key):
+        """Return cached segments/language for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            os.utime(path, None)
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Never written, or evicted by another process
+            with self._lock:
+                entry = self._entries.pop(key, None)
+                if entry:
+                    self._total_bytes -= entry[1]
+                self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            self._remove(key)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            if key not in self._entries:
+                # Written by another process
+                self._total_bytes += stat.st_size
+            self._entries[key] = (stat.st_mtime, stat.st_size)
+            self.hits += 1
+        return result
+
+    def read(self, key):
+        """Entry for key straight from its file, or None; unlike get() it is not counted as a lookup"""
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, result):
+        """Store the parts of a Whisper result needed to rebuild captions"""
+        payload = {
+            'segments': result.get('segments', []),
+            'language': result.get('language')
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, default=float)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Failed to write cache entry {key}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        size = os.path.getsize(path)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries[key][1]
+            self._entries[key] = (os.path.getmtime(path), size)
+            self._total_bytes += size
+        self._evict()
+
+    def _alias_path(self, alias):
+        return os.path.join(self.cache_dir, f"{alias}.alias")
+
+    def put_alias(self, alias, key):
+        """Point a second key (e.g. the upload's byte hash) at an existing entry"""
+        try:
+            with open(self._alias_path(alias), 'w', encoding='utf-8') as f:
+                f.write(key)
+        except OSError as e:
+            logger.error(f"Failed to write cache alias {alias}: {e}")
+
+    def get_alias(self, alias):
+        """Resolve an alias to a key that is still cached, or None"""
+        try:
+            with open(self._alias_path(alias), 'r', encoding='utf-8') as f:
+                key = f.read().strip()
+        except OSError:
+            return None
+        if os.path.exists(self._path(key)):
+            return key
+        # Target was evicted; the alias is useless now
+        try:
+            os.remove(self._alias_path(alias))
+        except OSError:
+            pass
+        return None
+
+    def _remove(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry:
+                self._total_bytes -= entry[1]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    @contextmanager
+    def _directory_lock(self):
+        """Exclusive lock on the cache directory, shared with other processes using it"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.cache_dir, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _scan(self):
+        """(mtime, size) of every entry in the directory by key, and the alias files pointing at each key
+
+        An entry's size includes its aliases, which are evicted together with it.
+        """
+        entries = {}
+        aliases = {}
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.name.endswith('.alias'):
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        aliases.setdefault(f.read().strip(), []).append((entry.path, entry.stat().st_size))
+                elif entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    entries[entry.name[:-5]] = (stat.st_mtime, stat.st_size)
+            except OSError:
+                continue
+        for key, alias_files in aliases.items():
+            if key in entries:
+                mtime, size = entries[key]
+                entries[key] = (mtime, size + sum(alias_size for _, alias_size in alias_files))
+        return entries, aliases
+
+    def _evict(self):
+        """Drop least recently used entries, across every process sharing the directory, until under the size limit"""
+        evicted = []
+        with self._directory_lock():
+            entries, aliases = self._scan()
+            total = sum(size for _, size in entries.values())
+            for key, (_, size) in sorted(entries.items(), key=lambda item: item[1][0]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+                del entries[key]
+                total -= size
+                evicted.append(key)
+            # Aliases of evicted entries, and of entries removed some other way, point nowhere
+            for key, alias_files in aliases.items():
+                if key in entries:
+                    continue
+                for alias_path, _ in alias_files:
+                    try:
+                        os.remove(alias_path)
+                    except OSError:
+                        pass
+            self._entries = entries
+            self._total_bytes = total
+            self.evictions += len(evicted)
+        for key in evicted:
+            logger.info(f"Evicted transcription cache entry {key}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size_mb': round(self._total_bytes / 1024 / 1024, 2),
+                'limit_mb': round(self.max_bytes / 1024 / 1024, 2),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None
+            }
@@ -0,0 +1,214 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are then only serialized within one process
+    fcntl = None
+
+MAX_UPLOAD_BYTES = 100 * 1024 * 1024  # 100MB per file
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Paths locked by this process, for platforms without flock
+_locked_paths = set()
+_locked_paths_lock = threading.Lock()
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    """Raised mid-stream once an upload passes the size limit or storage budget"""
+
+    def __init__(self, limit, reason):
+        super().__init__(reason)
+        self.limit = limit
+        self.reason = reason
+
+
+class UploadSink:
+    """Writable file that enforces a byte limit and hashes the data as it is written
+
+    Werkzeug's multipart parser writes each file part straight into this object, so
+    the upload lands at its final location in one pass instead of being spooled to a
+    temp file and copied again by FileStorage.save.
+    """
+
+    def __init__(self, path, limit, mode='wb', reason=None):
+        self.path = path
+        self.limit = limit
+        self.reason = reason or f'File too large. Maximum size is {limit // (1024 * 1024)}MB per file.'
+        self.claimed = False
+        self._locked = False
+        self._file = open(path, mode)
+        self._hash = hashlib.sha256()
+        self.bytes_written = self._file.tell()
+
+    def try_lock(self):
+        """Take an exclusive lock on the file without waiting; released on close
+
+        Once locked, bytes_written is re-read from the file, since another writer may
+        have appended between opening it and getting the lock.
+        """
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+        else:
+            with _locked_paths_lock:
+                if self.path in _locked_paths:
+                    return False
+                _locked_paths.add(self.path)
+        self._locked = True
+        self.bytes_written = os.fstat(self._file.fileno()).st_size
+        return True
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        if self.bytes_written > self.limit:
+            raise UploadTooLarge(self.limit, self.reason)
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def readline(self, *args):
+        return self._file.readline(*args)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+        if self._locked and fcntl is None:
+            with _locked_paths_lock:
+                _locked_paths.discard(self.path)
+        self._locked = False
+
+    def claim(self, final_path):
+        """Move the finished upload to final_path; the sink is no longer discarded on teardown"""
+        self.close()
+        os.replace(self.path, final_path)
+        self.path = final_path
+        self.claimed = True
+
+    def discard(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class StreamingUploadRequest(Request):
+    """Request class whose file parts are written directly into the upload folder
+
+    Set request.upload_budget before touching request.files to cap the upload by
+    the remaining storage as well as the per-file limit (request.max_file_bytes).
+    Zip parts hold many files, so request.max_archive_bytes can give them a larger cap.
+    """
+
+    upload_budget = None
+    max_file_bytes = MAX_UPLOAD_BYTES
+    max_archive_bytes = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        from flask import current_app
+        limit = self.max_file_bytes
+        if self.max_archive_bytes and filename and filename.lower().endswith('.zip'):
+            limit = self.max_archive_bytes
+        reason = None
+        if self.upload_budget is not None and self.upload_budget < limit:
+            limit = self.upload_budget
+            reason = 'Temporary storage full. Please try again in a few minutes.'
+        path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{uuid.uuid4()}.part")
+        sink = UploadSink(path, limit, reason=reason)
+        if not hasattr(self, 'upload_sinks'):
+            self.upload_sinks = []
+        self.upload_sinks.append(sink)
+        return sink
+
+
+def copy_stream(stream, sink, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copy a raw request body into a sink in fixed-size chunks"""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        sink.write(chunk)
+    sink.flush()
+    return sink.bytes_written
+
+
+class ResumableUploads:
+    """Upload sessions that can be continued at an offset after a dropped connection
+
+    State lives next to the data in the upload folder (<id>.part plus <id>.json), so
+    any web worker sharing the folder can accept the next chunk.
+    """
+
+    def __init__(self, upload_folder):
+        self.upload_folder = upload_folder
+
+    def part_path(self, upload_id):
+        return os.path.join(self.upload_folder, f"{upload_id}.part")
+
+    def meta_path(self, upload_id):
+        return os.path.join(self.upload_folder, f"{upload_id}.json")
+
+    def create(self, filename, size, form):
+        upload_id = str(uuid.uuid4())
+        meta = {'filename': filename, 'size': size, 'form': form}
+        with open(self.meta_path(upload_id), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        open(self.part_path(upload_id), 'wb').close()
+        return upload_id
+
+    def get(self, upload_id):
+        """Return the session metadata with the current offset, or None"""
+        try:
+            uuid.UUID(upload_id)
+            with open(self.meta_path(upload_id), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta['offset'] = os.path.getsize(self.part_path(upload_id))
+        except (ValueError, OSError):
+            return None
+        return meta
+
+    def open_sink(self, upload_id, offset, size):
+        """Open the part file for appending at offset, locked until the sink is closed
+
+        Returns None if another request is appending to the upload right now or if
+        offset does not match what is on disk, so two chunks can never both append.
+        """
+        sink = UploadSink(self.part_path(upload_id), size, mode='ab')
+        if not sink.try_lock() or sink.bytes_written != offset:
+            sink.close()
+            return None
+        return sink
+
+    def finish(self, upload_id):
+        try:
+            os.remove(self.meta_path(upload_id))
+        except OSError:
+            pass
+
+    def discard(self, upload_id):
+        self.finish(upload_id)
+        try:
+            os.remove(self.part_path(upload_id))
+        except OSError:
+            pass
@@ -0,0 +1,357 @@
+import os
+import gc
+import json
+import uuid
+import signal
+import threading
+import time
+import logging
+import numpy as np
+import psutil
+from model_registry import ModelRegistry
+from transcription import transcribe_chunked, process_context
+from cancellation import JobCancelled
+from audio import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_JOBS = 25
+DEFAULT_MAX_RSS = 4 * 1024 * 1024 * 1024  # 4GB in bytes
+SUPERVISE_INTERVAL = 1.0
+# A cancelled task stops at its next chunk boundary; the worker is only killed if it
+# has not stopped by then, since killing it mid-put can corrupt the shared event queue
+CANCEL_GRACE_SECONDS = 60
+# Give up on a task after this long plus this many seconds per second of audio, so a
+# wedged worker or event queue fails the job instead of blocking its thread forever
+TASK_TIMEOUT_BASE = 300
+TASK_TIMEOUT_PER_AUDIO_SECOND = 10
+TASK_ID_BYTES = 64
+
+
+class _SharedCancelToken:
+    """Worker-side cancel token for one task, cancelled when the web process writes its id to the slot
+
+    Only supports the checkpoints transcribe_chunked polls between chunks; there is
+    nothing to call back into, since the pool never terminates a worker cooperatively.
+    """
+
+    reason = 'Cancelled'
+
+    def __init__(self, slot, task_id):
+        self.slot = slot
+        self.task_id = task_id.encode()
+
+    @property
+    def cancelled(self):
+        return self.slot.value == self.task_id
+
+    def check(self):
+        if self.cancelled:
+            raise JobCancelled(self.reason)
+
+    def on_cancel(self, callback):
+        return lambda: None
+
+
+def _worker_main(task_queue, event_queue, cancel_slot, num_threads, max_jobs, max_rss, registry_factory):
+    """Entry point of a transcription process: load models, serve tasks, retire when worn out
+
+    Audio arrives as a path to the PCM file the web process already decoded, and the
+    full result is written back to disk; only progress and caption batches travel
+    over the queue. The web process cancels a task by writing its id to cancel_slot.
+    """
+    # Ctrl-C is for the web process; it stops us through the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pid = os.getpid()
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+    registry = registry_factory()
+    registry.start()
+    registry.wait_preloaded()
+    # Report the backend actually loaded: an unknown CAPVID_INFERENCE_BACKEND falls back to whisper
+    event_queue.put(('ready', pid, registry.is_ready(), registry.backend.name))
+
+    process = psutil.Process()
+    jobs_done = 0
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, pcm_path, result_path, model_name, options, chunk_seconds, min_chunked_seconds = task
+        event_queue.put(('started', pid, task_id))
+        try:
+            audio = np.memmap(pcm_path, dtype=np.float32, mode='c')
+            with registry.use(model_name) as (model, loaded_name):
+                result = transcribe_chunked(
+                    model, audio, options, max_workers=1,
+                    on_progress=lambda done, total: event_queue.put(('progress', task_id, done, total)),
+                    on_segments=lambda segments: event_queue.put(('segments', task_id, segments)),
+                    chunk_seconds=chunk_seconds, min_chunked_seconds=min_chunked_seconds,
+                    cancel_token=_SharedCancelToken(cancel_slot, task_id)
+                )
+            with open(result_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, default=float)
+            event_queue.put(('done', task_id, loaded_name))
+        except JobCancelled:
+            event_queue.put(('cancelled', task_id))
+        except Exception as e:
+            event_queue.put(('failed', task_id, str(e)))
+        finally:
+            audio = result = None
+            gc.collect()
+
+        jobs_done += 1
+        rss = process.memory_info().rss
+        if jobs_done >= max_jobs or rss > max_rss:
+            event_queue.put(('retiring', pid, f"{jobs_done} jobs, {rss / 1024 / 1024:.0f}MB RSS"))
+            break
+
+
+class _Task:
+    def __init__(self, task_id, on_progress, on_segments):
+        self.task_id = task_id
+        self.on_progress = on_progress
+        self.on_segments = on_segments
+        self.done = threading.Event()
+        self.model_name = None
+        self.error = None
+        self.cancelled = False
+
+
+class TranscriptionWorkerPool:
+    """Long-lived transcription processes, each holding its own loaded models
+
+    Keeps Whisper's GIL-bound decode loop and its memory growth out of the web
+    process. A worker exits after max_jobs tasks or once its RSS passes max_rss,
+    and the supervisor thread starts a fresh one in its place. Each worker builds
+    its models with registry_factory, a picklable callable returning a ModelRegistry.
+    """
+
+    def __init__(self, num_workers, max_jobs=None, max_rss=None, num_threads=None, registry_factory=ModelRegistry):
+        self.num_workers = num_workers
+        self.max_jobs = max_jobs or int(os.environ.get('CAPVID_WORKER_MAX_JOBS', DEFAULT_MAX_JOBS))
+        self.max_rss = max_rss or int(os.environ.get('CAPVID_WORKER_MAX_RSS', DEFAULT_MAX_RSS))
+        self.num_threads = num_threads or max(1, (os.cpu_count() or 1) // num_workers)
+        self.registry_factory = registry_factory
+        self._context = process_context()
+        self._task_queue = self._context.Queue()
+        self._event_queue = self._context.Queue()
+        self._lock = threading.Lock()
+        self._processes = {}  # pid -> Process
+        self._cancel_slots = {}  # pid -> shared bytes holding the id of the task to stop
+        self._busy = {}  # pid -> task_id
+        self._ready = {}  # pid -> inference backend the worker loaded
+        self._tasks = {}
+        # Tasks cancelled before a worker picked them up; killed on their 'started' event
+        self._cancelled = set()
+        self._retired = 0
+        self._crashed = 0
+        self._started = False
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            for _ in range(self.num_workers):
+                self._spawn()
+        threading.Thread(target=self._event_loop, name='capvid-worker-events', daemon=True).start()
+        threading.Thread(target=self._supervise_loop, name='capvid-worker-supervisor', daemon=True).start()
+        logger.info(f"Started {self.num_workers} transcription process(es), recycled after "
+                    f"{self.max_jobs} jobs or {self.max_rss / 1024 / 1024:.0f}MB RSS")
+
+    def _spawn(self):
+        # No lock on the slot: a worker killed while reading it must not leave it locked
+        cancel_slot = self._context.RawArray('c', TASK_ID_BYTES)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self._task_queue, self._event_queue, cancel_slot, self.num_threads, self.max_jobs, self.max_rss,
+                  self.registry_factory),
+            name='capvid-transcriber',
+            daemon=True
+        )
+        process.start()
+        self._processes[process.pid] = process
+        self._cancel_slots[process.pid] = cancel_slot
+
+    def is_ready(self):
+        """True once at least one worker has its default model loaded"""
+        with self._lock:
+            return bool(self._ready)
+
+    def transcribe(self, pcm_path, result_path, model_name, options, on_progress=None,
+                   on_segments=None, chunk_seconds=None, min_chunked_seconds=None, cancel_token=None):
+        """Run one transcription in a worker process; returns (result, model_name_used)
+
+        Cancelling cancel_token raises JobCancelled right away; the worker stops at its
+        next chunk boundary, or is killed after CANCEL_GRACE_SECONDS (the supervisor
+        replaces it).
+        """
+        self.start()
+        task = _Task(str(uuid.uuid4()), on_progress, on_segments)
+        with self._lock:
+            self._tasks[task.task_id] = task
+        self._task_queue.put((task.task_id, pcm_path, result_path, model_name, options,
+                              chunk_seconds, min_chunked_seconds))
+        unregister = cancel_token.on_cancel(lambda: self._cancel(task)) if cancel_token else None
+        audio_seconds = os.path.getsize(pcm_path) / 4 / SAMPLE_RATE
+        timeout = TASK_TIMEOUT_BASE + audio_seconds * TASK_TIMEOUT_PER_AUDIO_SECOND
+        try:
+            if not task.done.wait(timeout):
+                self._cancel(task)
+                task.cancelled = False
+                task.error = f"Transcription did not finish within {timeout:.0f}s"
+        finally:
+            if unregister:
+                unregister()
+            with self._lock:
+                self._tasks.pop(task.task_id, None)
+
+        if task.cancelled:
+            raise JobCancelled(cancel_token.reason)
+        if task.error:
+            raise Exception(task.error)
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        finally:
+            try:
+                os.remove(result_path)
+            except OSError:
+                pass
+        return result, task.model_name
+
+    def _cancel(self, task):
+        with self._lock:
+            task.cancelled = True
+            pids = [pid for pid, busy_task in self._busy.items() if busy_task == task.task_id]
+            for pid in pids:
+                self._stop_task(pid, task.task_id)
+            if not pids:
+                self._cancelled.add(task.task_id)
+        task.done.set()
+
+    def _stop_task(self, pid, task_id):
+        """Ask a worker to drop task_id at its next checkpoint, killing it if it has not after the grace period"""
+        self._cancel_slots[pid].value = task_id.encode()
+        timer = threading.Timer(CANCEL_GRACE_SECONDS, self._kill_if_busy, (pid, task_id))
+        timer.daemon = True
+        timer.start()
+
+    def _kill_if_busy(self, pid, task_id):
+        with self._lock:
+            if self._busy.get(pid) == task_id and pid in self._processes:
+                logger.warning(f"Transcription worker {pid} ignored cancellation for {CANCEL_GRACE_SECONDS}s, killing it")
+                self._processes[pid].terminate()
+
+    def _event_loop(self):
+        while True:
+            try:
+                event = self._event_queue.get()
+            except (EOFError, OSError):
+                return
+            kind = event[0]
+            try:
+                if kind == 'ready':
+                    if event[2]:
+                        with self._lock:
+                            self._ready[event[1]] = event[3]
+                        logger.info(f"Transcription worker {event[1]} ready ({event[3]} backend)")
+                    else:
+                        logger.error(f"Transcription worker {event[1]} could not preload its default model")
+                elif kind == 'started':
+                    _, pid, task_id = event
+                    with self._lock:
+                        task = self._tasks.get(task_id)
+                        if pid in self._processes:
+                            self._busy[pid] = task_id
+                            if task_id in self._cancelled:
+                                self._cancelled.discard(task_id)
+                                self._stop_task(pid, task_id)
+                        elif task:
+                            # The supervisor reaped this worker before its start event arrived
+                            task.error = 'Transcription worker exited unexpectedly'
+                            task.done.set()
+                elif kind == 'retiring':
+                    logger.info(f"Recycling transcription worker {event[1]} after {event[2]}")
+                    with self._lock:
+                        self._retired += 1
+                        self._ready.pop(event[1], None)
+                else:
+                    self._task_event(kind, event[1], event[2:])
+            except Exception as e:
+                logger.error(f"Error handling worker event {kind}: {e}")
+
+    def _task_event(self, kind, task_id, args):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if kind in ('done', 'failed', 'cancelled'):
+                for pid, busy_task in list(self._busy.items()):
+                    if busy_task == task_id:
+                        del self._busy[pid]
+        if task is None:
+            return
+        if kind == 'progress' and task.on_progress:
+            task.on_progress(*args)
+        elif kind == 'segments' and task.on_segments:
+            task.on_segments(args[0])
+        elif kind == 'done':
+            task.model_name = args[0]
+            task.done.set()
+        elif kind == 'failed':
+            task.error = args[0]
+            task.done.set()
+
+    def _supervise_loop(self):
+        while True:
+            time.sleep(SUPERVISE_INTERVAL)
+            with self._lock:
+                dead = [(pid, p) for pid, p in self._processes.items() if not p.is_alive()]
+                for pid, process in dead:
+                    process.join()
+                    del self._processes[pid]
+                    self._cancel_slots.pop(pid, None)
+                    self._ready.pop(pid, None)
+                    task_id = self._busy.pop(pid, None)
+                    task = self._tasks.get(task_id)
+                    if task and not task.done.is_set():
+                        self._crashed += 1
+                        logger.error(f"Transcription worker {pid} exited (code {process.exitcode}) during a job")
+                        task.error = f"Transcription worker exited unexpectedly (exit code {process.exitcode})"
+                        task.done.set()
+                # A worker that fails to start is retried on the next tick
+                for _ in range(self.num_workers - len(self._processes)):
+                    try:
+                        self._spawn()
+                    except Exception as e:
+                        logger.error(f"Could not start a transcription worker: {e}")
+                        break
+
+    def stats(self):
+        with self._lock:
+            workers = []
+            for pid in self._processes:
+                try:
+                    rss = psutil.Process(pid).memory_info().rss
+                except psutil.Error:
+                    rss = 0
+                workers.append({
+                    'pid': pid,
+                    'ready': pid in self._ready,
+                    'backend': self._ready.get(pid),
+                    'busy': pid in self._busy,
+                    'rss_mb': round(rss / 1024 / 1024)
+                })
+            return {
+                'mode': 'process',
+                'backend': ', '.join(sorted(set(self._ready.values()))) or None,
+                'workers': workers,
+                'max_jobs_per_worker': self.max_jobs,
+                'max_rss_mb': round(self.max_rss / 1024 / 1024),
+                'recycled': self._retired,
+                'crashed': self._crashed
+            }
@@ -8,11 +8,15 @@ import AnimatedStatusDisplay from './components/AnimatedStatusDisplay';
 import ErrorBoundary from './components/ErrorBoundary';
 import GitHubFooter from './components/GitHubFooter';
 
+// Statuses after which the server sends no more updates for a job
+const TERMINAL_STATUSES = ['completed', 'failed', 'completed_srt_only', 'cancelled'];
+
 function App() {
   const [jobId, setJobId] = useState(null);
   const [status, setStatus] = useState(null);
   const [error, setError] = useState(null);
   const [originalFile, setOriginalFile] = useState(null);
+  const [captions, setCaptions] = useState([]);
 
   const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:5001';
 
@@ -40,9 +44,34 @@ function App() {
     }
   }, [API_BASE_URL]);
 
+  // Prefer server-sent events: live captions and status without polling
+  useEffect(() => {
+    if (!jobId || typeof window.EventSource === 'undefined') return undefined;
+
+    const source = new EventSource(`${API_BASE_URL}/events/${jobId}`);
+    source.addEventListener('status', (event) => {
+      const data = JSON.parse(event.data);
+      setStatus(data);
+      if (TERMINAL_STATUSES.includes(data.status)) {
+        source.close();
+      }
+    });
+    source.addEventListener('segments', (event) => {
+      const data = JSON.parse(event.data);
+      setCaptions((previous) => [...previous, ...data.segments]);
+    });
+    source.addEventListener('expired', () => {
+      setError('Job expired or not found. Please try uploading again.');
+      source.close();
+    });
+
+    return () => source.close();
+  }, [jobId, API_BASE_URL]);
+
+  // Fall back to polling /status where EventSource is unavailable
   useEffect(() => {
     let interval;
-    if (jobId && status?.status !== 'completed' && status?.status !== 'failed' && status?.status !== 'completed_srt_only' && !error) {
+    if (typeof window.EventSource === 'undefined' && jobId && !TERMINAL_STATUSES.includes(status?.status) && !error) {
       interval = setInterval(() => {
         fetchStatus(jobId);
       }, 3000);
@@ -55,6 +84,7 @@ function App() {
   // Cleanup on component unmount or page refresh
   useEffect(() => {
     const handleBeforeUnload = (e) => {
+      // Any status, cancelled included: the server only keeps files of finished jobs until cleanup
       if (jobId) {
         // Send cleanup request
         navigator.sendBeacon(`${API_BASE_URL}/cleanup/${jobId}`, '');
@@ -76,6 +106,7 @@ function App() {
   const handleUploadSuccess = (id, file) => {
     setJobId(id);
     setOriginalFile(file);
+    setCaptions([]);
     setError(null);
   };
 
@@ -106,6 +137,7 @@ function App() {
     setStatus(null);
     setError(null);
     setOriginalFile(null);
+    setCaptions([]);
   };
 
   return (
@@ -145,6 +177,7 @@ function App() {
                   onReset={handleReset}
                   jobId={jobId}
                   originalFile={originalFile}
+                  captions={captions}
                 />
               )}
             </div>
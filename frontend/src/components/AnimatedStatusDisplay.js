@@ -1,13 +1,13 @@
 import React, { useEffect } from 'react';
-import { FiCheckCircle, FiAlertTriangle, FiLoader, FiRefreshCw, FiClock, FiFileText, FiType, FiDownload } from 'react-icons/fi';
+import { FiCheckCircle, FiAlertTriangle, FiLoader, FiRefreshCw, FiClock, FiFileText, FiType, FiDownload, FiXCircle } from 'react-icons/fi';
 
-const AnimatedStatusDisplay = ({ status, error, onReset, jobId, originalFile }) => {
+const AnimatedStatusDisplay = ({ status, error, onReset, jobId, originalFile, captions = [] }) => {
   const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:5001';
   
   useEffect(() => {
     // Cleanup on page unload/refresh
     const handleBeforeUnload = () => {
-      if (jobId && (status?.status === 'completed' || status?.status === 'failed')) {
+      if (jobId && ['completed', 'completed_srt_only', 'failed', 'cancelled'].includes(status?.status)) {
         navigator.sendBeacon(`${API_BASE_URL}/cleanup/${jobId}`, '');
       }
     };
@@ -102,6 +102,16 @@ const AnimatedStatusDisplay = ({ status, error, onReset, jobId, originalFile })
 
   const getStatusInfo = () => {
     switch (status.status) {
+      case 'queued':
+        return {
+          icon: <FiClock className="h-6 w-6 text-purple-400" />,
+          title: 'Waiting in Queue',
+          message: status.queue_position
+            ? `Position ${status.queue_position} in queue${status.eta_seconds ? ` (about ${Math.ceil(status.eta_seconds / 60)} min)` : ''}...`
+            : 'Waiting for a free worker...',
+          progress: 5,
+          color: 'purple'
+        };
       case 'uploaded':
         return {
           icon: <FiClock className="h-6 w-6 text-purple-400" />,
@@ -115,7 +125,7 @@ const AnimatedStatusDisplay = ({ status, error, onReset, jobId, originalFile })
           icon: <FiLoader className="h-6 w-6 text-blue-400 animate-spin" />,
           title: 'Transcribing Audio',
           message: 'Converting speech to text using AI...',
-          progress: 30,
+          progress: status.progress ? 10 + Math.round(status.progress * 0.5) : 30,
           color: 'blue'
         };
       case 'generating_captions':
@@ -158,6 +168,14 @@ const AnimatedStatusDisplay = ({ status, error, onReset, jobId, originalFile })
           progress: 100,
           color: 'red'
         };
+      case 'cancelled':
+        return {
+          icon: <FiXCircle className="h-6 w-6 text-gray-400" />,
+          title: 'Processing Cancelled',
+          message: status.error && status.error !== 'Cancelled' ? status.error : 'This video was cancelled before it finished.',
+          progress: 0,
+          color: 'gray'
+        };
       default:
         return {
           icon: <FiLoader className="h-6 w-6 text-purple-400 animate-spin" />,
@@ -170,6 +188,7 @@ const AnimatedStatusDisplay = ({ status, error, onReset, jobId, originalFile })
   };
 
   const { icon, title, message, progress, color } = getStatusInfo();
+  const isFinished = ['completed', 'completed_srt_only', 'failed', 'cancelled'].includes(status.status);
 
   return (
     <div className="w-full max-w-md mx-auto p-2">
@@ -204,6 +223,21 @@ const AnimatedStatusDisplay = ({ status, error, onReset, jobId, originalFile })
           </div>
         )}
 
+        {/* Live caption preview while transcription is running */}
+        {captions.length > 0 && (
+          <div className="mb-3 max-h-24 overflow-y-auto rounded-lg bg-black bg-opacity-30 p-2 text-left">
+            {captions.slice(-3).map((caption) => (
+              <p
+                key={`${caption.start}-${caption.end}`}
+                className="text-xs text-gray-200"
+                style={{ fontFamily: 'Urbanist, sans-serif' }}
+              >
+                {caption.text}
+              </p>
+            ))}
+          </div>
+        )}
+
         {/* Enhanced Progress Bar */}
         <div className="w-full mx-auto bg-white bg-opacity-20 rounded-full h-3 mb-4 relative overflow-hidden">
           <div 
@@ -235,12 +269,12 @@ const AnimatedStatusDisplay = ({ status, error, onReset, jobId, originalFile })
           <button
             onClick={onReset}
             className={`font-semibold py-2 px-4 rounded-lg transition-all duration-300 text-sm ${
-              status.status === 'completed' || status.status === 'completed_srt_only' || status.status === 'failed' 
+              isFinished
                 ? 'bg-cyan-600 hover:bg-cyan-700 text-white hover:scale-105' 
                 : 'bg-gray-600 bg-opacity-50 cursor-not-allowed text-gray-400'
             }`}
             style={{ fontFamily: 'Urbanist, sans-serif' }}
-            disabled={!(status.status === 'completed' || status.status === 'completed_srt_only' || status.status === 'failed')}
+            disabled={!isFinished}
           >
             <FiRefreshCw className="mr-2 inline" /> Process Another Video
           </button>
@@ -127,6 +127,7 @@ const AnimatedUploadForm = ({ onSuccess, onError }) => {
     const formData = new FormData();
     formData.append('video', file);
     formData.append('filename', sanitizedFileName);
+    formData.append('stream', 'true');
 
     const uploadUrl = `${API_BASE_URL}/upload`;
     console.log('Uploading to:', uploadUrl);